@@ -0,0 +1,102 @@
+"""
+Latency of cached requests while a cache miss is parsed, filtered and merged: on the event
+loop vs the thread pool vs the process pool executor.
+
+A miss parses and filters the price and rank responses (`assets` items each, synthetic)
+and merges them, as `build_snapshot` does after the fetches (network and Redis not
+included). Meanwhile cached requests are simulated by a task rendering a few rows every
+millisecond; their latency is how late the task was woken up plus its own time. Misses
+are 20 ms apart (fetches). Reported:
+p50/p99/max latency of the cached requests during the misses and the time of a miss.
+
+Usage:
+    python -m benchmarks.bench_cpu_executor [assets] [misses]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+from common.executor import CpuExecutor
+from common.merge_engine import merge_encoded_rows, merge_options, merge_packed_rows, render_rows, unpack_rows
+from shared.data_fetcher import filter_response
+
+PRICE_FIELDS = [{"name": "Id", "source": "id", "default": "NOT_AVAILABLE"},
+                {"name": "Symbol", "source": "symbol", "default": "NOT_AVAILABLE"},
+                {"name": "Price USD", "source": "quote.USD.price", "default": "NOT_AVAILABLE"}]
+RANK_FIELDS = [{"name": "Id", "source": "CMC_ID", "default": "NOT_AVAILABLE"},
+               {"name": "Symbol", "source": "SYMBOL", "default": "NOT_AVAILABLE"}]
+REQUEST_PERIOD = 0.001
+
+
+def synthetic_bodies(assets):
+    price = {"data": [{"id": asset_id, "symbol": f"C{asset_id}", "name": f"Coin {asset_id}", "slug": f"coin-{asset_id}",
+                       "tags": ["mineable", "pow"], "quote": {"USD": {"price": asset_id * 1.5, "volume_24h": asset_id * 1e3,
+                                                                      "percent_change_1h": 0.1, "market_cap": asset_id * 1e6}}}
+                      for asset_id in range(1, assets + 1)]}
+    rank = {"Data": {"LIST": [{"CMC_ID": asset_id, "SYMBOL": f"C{asset_id}", "NAME": f"Coin {asset_id}",
+                               "SPOT_MOVING_24_HOUR_QUOTE_VOLUME_USD": asset_id * 1e3}
+                              for asset_id in range(assets, 0, -1)]}}
+    return json.dumps(price).encode(), json.dumps(rank).encode()
+
+
+async def miss(executor, price_body, rank_body):
+    price_args = (price_body, "data", None, json.dumps(PRICE_FIELDS))
+    rank_args = (rank_body, "Data.LIST", None, json.dumps(RANK_FIELDS))
+    rank_names, price_names = ["Id", "Symbol"], ["Id", "Symbol", "Price USD"]
+    options = merge_options({}, ["rank", "price"])
+    if executor is None:
+        rank_rows, _ = filter_response(*rank_args)
+        price_rows, _ = filter_response(*price_args)
+        return merge_encoded_rows(unpack_rows(rank_names, rank_rows), unpack_rows(price_names, price_rows), **options)
+    (rank_rows, _), (price_rows, _) = await asyncio.gather(executor.run(filter_response, *rank_args),
+                                                          executor.run(filter_response, *price_args))
+    merged = await executor.run(merge_packed_rows, [(rank_names, rank_rows), (price_names, price_rows)], options)
+    return merged.split("\n")
+
+
+async def cached_requests(latencies, stop):
+    names, columns = ["Rank", "Symbol", "Price USD"], [list(range(1, 11)), [f"C{i}" for i in range(10)], [1.5] * 10]
+    while not stop.is_set():
+        expected = time.perf_counter() + REQUEST_PERIOD
+        await asyncio.sleep(REQUEST_PERIOD)
+        render_rows(names, columns)
+        latencies.append(time.perf_counter() - expected)
+
+
+async def measure(executor, bodies, misses):
+    if executor is not None:
+        await executor.start()
+    latencies, stop = [], asyncio.Event()
+    requests = asyncio.create_task(cached_requests(latencies, stop))
+    await asyncio.sleep(0.05)
+    del latencies[:]
+    miss_time = 0
+    for _ in range(misses):
+        start = time.perf_counter()
+        await miss(executor, *bodies)
+        miss_time += (time.perf_counter() - start) / misses
+        # Fetches of the next miss
+        await asyncio.sleep(0.02)
+    stop.set()
+    await requests
+    latencies.sort()
+    return (statistics.median(latencies), latencies[int(len(latencies) * 0.99)], latencies[-1], miss_time)
+
+
+def run(assets=5000, misses=10):
+    bodies = synthetic_bodies(assets)
+    print(f"{assets} assets per source, {misses} misses, cached request every {REQUEST_PERIOD * 1000:.0f} ms")
+    for kind in ("loop", "thread", "process"):
+        executor = None if kind == "loop" else CpuExecutor(kind, 2)
+        try:
+            p50, p99, worst, miss_time = asyncio.run(measure(executor, bodies, misses))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        print(f"{kind:<8} | cached request p50 {p50 * 1000:6.2f} ms | p99 {p99 * 1000:6.2f} ms | "
+              f"max {worst * 1000:6.2f} ms | miss {miss_time * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the DataFetcher field filters.
+
+Compares the compiled extractor plan (`DataFetcher.apply_filter`) against the previous
+implementation that split the source path and evaluated the transform for every item
+and every field.
+
+Usage:
+    python -m benchmarks.bench_field_filters [rows]
+"""
+import sys
+import timeit
+from shared.data_fetcher import DataFetcher
+
+PRICE_CONFIG = {
+    "api_key_env_var_name": "COINMARKET_API_KEY",
+    "headers": {},
+    "fields": [
+        {"name": "Id", "source": "id", "default": "NOT_AVAILABLE"},
+        {"name": "Symbol", "source": "symbol", "default": "NOT_AVAILABLE"},
+        {"name": "Price USD", "source": "quote.USD.price", "default": "NOT_AVAILABLE"}
+    ]
+}
+
+RANK_CONFIG = {
+    "api_key_env_var_name": "CRYPTOCOMPARE_API_KEY",
+    "headers": {},
+    "fields": [
+        {"name": "Id", "source": "ASSET_ALTERNATIVE_IDS", "default": "NOT_AVAILABLE",
+         "transform": "(lambda alt_ids: next((int(alt_id['ID']) for alt_id in alt_ids if alt_id.get('NAME') == 'CMC'), None))"},
+        {"name": "Symbol", "source": "SYMBOL", "default": "NOT_AVAILABLE"}
+    ]
+}
+
+
+def legacy_access_nested_fields(json_data, path, default_value=None):
+    field_value = json_data
+    try:
+        for key in path.split("."):
+            field_value = field_value[key]
+    except (KeyError, TypeError):
+        if default_value:
+            field_value = default_value
+    return field_value
+
+
+def legacy_apply_filter(json_data, filter_config):
+    filtered_item = {}
+    for field_config in filter_config["fields"]:
+        field_value = legacy_access_nested_fields(json_data, field_config["source"], field_config["default"])
+        transform_function = field_config.get("transform")
+        if transform_function and field_value is not None:
+            field_value = eval(transform_function)(field_value)
+        filtered_item[field_config["name"]] = field_value
+    return filtered_item
+
+
+def price_items(rows):
+    return [{"id": i, "symbol": f"C{i}", "name": f"Coin {i}", "slug": f"coin-{i}",
+             "quote": {"USD": {"price": i * 1.5, "volume_24h": i * 10.0}}} for i in range(rows)]
+
+
+def rank_items(rows):
+    return [{"ID": i, "SYMBOL": f"C{i}",
+             "ASSET_ALTERNATIVE_IDS": [{"NAME": "CG", "ID": f"coin-{i}"}, {"NAME": "CMC", "ID": str(i)}]}
+            for i in range(rows)]
+
+
+def run(rows=5000, repeat=5):
+    for label, config, items in (("price", PRICE_CONFIG, price_items(rows)), ("rank", RANK_CONFIG, rank_items(rows))):
+        fetcher = DataFetcher(config)
+        assert [fetcher.apply_filter(item) for item in items] == [legacy_apply_filter(item, config) for item in items]
+
+        legacy = min(timeit.repeat(lambda: [legacy_apply_filter(item, config) for item in items], number=1, repeat=repeat))
+        compiled = min(timeit.repeat(lambda: [fetcher.apply_filter(item) for item in items], number=1, repeat=repeat))
+        print(f"{label:<6} {rows} rows | legacy {legacy * 1000:8.2f} ms | compiled {compiled * 1000:8.2f} ms | speedup x{legacy / compiled:.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
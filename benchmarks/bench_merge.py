@@ -0,0 +1,73 @@
+"""
+Benchmark of the merge step: previous pandas implementation of `merge_data` (float to
+str conversion, chained pd.merge, to_json, json.loads, float cast loop, json.dumps) vs
+the hash-join merge engine emitting the serialized payload in one pass.
+
+Usage:
+    python -m benchmarks.bench_merge [rows ...]
+"""
+import json
+import random
+import sys
+import time
+import pandas as pd
+from common.utils import merge_data
+
+SIZES = (5000, 50000, 500000)
+
+
+def legacy_merge_data(*data_list):
+    data_frames = [pd.DataFrame(data) for data in data_list]
+
+    all_float_columns = []
+    for df in data_frames:
+        df['Id'] = df['Id'].astype('Int64')
+        float_columns = df.select_dtypes(include='float64').columns
+        if float_columns.size > 0:
+            all_float_columns.append(*float_columns)
+        df[float_columns] = df[float_columns].astype(str)
+
+    merged_df = pd.merge(data_frames[0], data_frames[1], on=['Id', 'Symbol'], suffixes=('_df1', '_df2'))
+    for i in range(2, len(data_frames)):
+        merged_df = pd.merge(merged_df, data_frames[i], on=['Id', 'Symbol'], suffixes=(f'_df{i-1}', f'_df{i}')).astype(object)
+
+    merged_df = merged_df.drop('Id', axis=1)
+    merged_df.index = pd.RangeIndex(start=1, stop=len(merged_df) + 1, name='Rank')
+    merged_df.reset_index(inplace=True)
+    result_json = merged_df.to_json(orient='records')
+
+    data_list = json.loads(result_json)
+    for entry in data_list:
+        for target_key in all_float_columns:
+            if target_key in entry:
+                entry[target_key] = float(entry[target_key])
+    return json.dumps(data_list)
+
+
+def sources(rows):
+    ids = list(range(1, rows + 1))
+    rank_data = [{"Id": id, "Symbol": f"C{id}"} for id in ids]
+    random.shuffle(ids)
+    price_data = [{"Id": id, "Symbol": f"C{id}", "Price USD": random.random() * id} for id in ids]
+    return rank_data, price_data
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes=SIZES):
+    random.seed(0)
+    for rows in sizes:
+        rank_data, price_data = sources(rows)
+        legacy_time, legacy_result = timed(legacy_merge_data, rank_data, price_data)
+        engine_time, engine_result = timed(merge_data, rank_data, price_data)
+        assert json.loads(engine_result) == json.loads(legacy_result)
+        print(f"{rows:>7} rows | pandas {legacy_time * 1000:9.1f} ms | engine {engine_time * 1000:9.1f} ms | "
+              f"speedup x{legacy_time / engine_time:.1f}")
+
+
+if __name__ == "__main__":
+    run([int(rows) for rows in sys.argv[1:]] or SIZES)
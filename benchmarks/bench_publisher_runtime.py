@@ -0,0 +1,102 @@
+"""
+Memory and CPU per source of the multi-source publisher runtime vs one process per source.
+
+Every source fetches a synthetic listing (`assets` items, price config fields) from an
+in-process HTTP transport and publishes it `cycles` times to an in-memory stream (network
+and Redis not included, the same for both layouts). One process per source: `sources`
+worker processes with one source each, as with one container per source. Runtime: one
+worker process running every source on one event loop, with a shared HTTP client. Peak
+RSS (ru_maxrss) and CPU time (user + system, interpreter start and imports included) of
+the worker processes are read with `os.wait4`.
+
+Usage:
+    python -m benchmarks.bench_publisher_runtime [assets] [cycles]
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+SOURCES = (1, 4, 16)
+FETCHER_CONFIG = {
+    "api_key_env_var_name": "BENCH_API_KEY",
+    "url": "https://example.com/listings",
+    "parameters": {"limit": "5000"},
+    "data_path": "data",
+    "fields": [
+        {"name": "Id", "source": "id", "default": "NOT_AVAILABLE"},
+        {"name": "Symbol", "source": "symbol", "default": "NOT_AVAILABLE"},
+        {"name": "Price USD", "source": "quote.USD.price", "default": "NOT_AVAILABLE"}
+    ]
+}
+
+
+class MemoryStream:
+    """
+    Stand-in for the Redis pool, keeping the size of the last message of every stream.
+    """
+
+    def __init__(self):
+        self.messages = {}
+
+    def xadd(self, stream, fields, message_id=None, max_len=None):
+        self.messages[stream] = len(fields["data"])
+
+
+def worker(sources, cycles, assets):
+    import httpx
+    from shared.data_fetcher import DataFetcher
+    from shared.publisher import Publisher
+
+    body = json.dumps({"data": [{"id": asset_id, "symbol": f"C{asset_id}", "name": f"Coin {asset_id}",
+                                 "quote": {"USD": {"price": asset_id * 1.5, "volume_24h": asset_id * 1000.0}}}
+                                for asset_id in range(1, assets + 1)]}).encode()
+
+    async def publish():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+        redis = MemoryStream()
+        async with httpx.AsyncClient(transport=transport) as client:
+            publishers = [Publisher({"redis": {"stream": f"source{source}"}}, DataFetcher(FETCHER_CONFIG, client), redis)
+                          for source in range(sources)]
+            for cycle in range(cycles):
+                await asyncio.gather(*[publisher.send_data_to_redis_stream(60 * cycle) for publisher in publishers])
+
+    asyncio.run(publish())
+
+
+def spawn(sources, cycles, assets):
+    return subprocess.Popen([sys.executable, "-m", "benchmarks.bench_publisher_runtime", "--worker",
+                             str(sources), str(cycles), str(assets)])
+
+
+def wait(processes):
+    """
+    Wait for the worker processes, returning their summed peak RSS (MiB) and CPU time (s).
+    """
+    rss, cpu = 0, 0.0
+    for process in processes:
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode:
+            raise RuntimeError(f"Worker failed with exit code {process.returncode}")
+        rss += usage.ru_maxrss / 1024
+        cpu += usage.ru_utime + usage.ru_stime
+    return rss, cpu
+
+
+def run(assets=5000, cycles=5):
+    print(f"{assets} items per source, {cycles} publications per source, figures per source")
+    for sources in SOURCES:
+        process_rss, process_cpu = wait([spawn(1, cycles, assets) for _ in range(sources)])
+        runtime_rss, runtime_cpu = wait([spawn(sources, cycles, assets)])
+        print(f"{sources:>3} sources | one process per source {process_rss / sources:7.1f} MiB "
+              f"{process_cpu / sources * 1000:7.0f} ms CPU | runtime {runtime_rss / sources:7.1f} MiB "
+              f"{runtime_cpu / sources * 1000:7.0f} ms CPU")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(*[int(arg) for arg in sys.argv[2:]])
+    else:
+        run(*[int(arg) for arg in sys.argv[1:]])
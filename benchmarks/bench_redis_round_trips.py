@@ -0,0 +1,178 @@
+"""
+Redis round trips and write time per minute cycle: one batched MULTI/EXEC vs one round trip per write.
+
+A cycle is what the services send to Redis every minute in steady state: one XADD per
+publisher (price, rank), the XREAD of the merger and its writes of the merged snapshot
+(`assets` rows, binary keyframe), its index entry, its time series points and the snapshot
+notification. Separate: snapshot MULTI/EXEC, series pipeline and PUBLISH, as before the
+batched write path. Batched: `merge_and_save`, every write in one MULTI/EXEC.
+
+Round trips are counted by a proxy around the connection: every awaited command and every
+MULTI/EXEC or pipeline execution is one. Needs a running Redis server for the timings (keys
+are written under far past timestamps and removed at the end); with `--dry-run`, or when
+Redis is not reachable, only the round trips are counted, against a stand-in answering
+every command at once.
+
+Usage:
+    python -m benchmarks.bench_redis_round_trips [--host localhost] [--port 6379] [--assets 5000] [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import time
+import aioredis
+from common.merge_engine import merge_columns
+from common.redis_utils import execute_batch, write_batch
+from common.series_store import queue_series, series_key
+from common.snapshot_codec import encode_snapshot
+from common.snapshot_store import INDEX_KEY, binary_key, queue_snapshot_value
+from merge_service.merger import merge_and_save
+
+TIMESTAMP = 60
+CYCLES = 20
+STREAMS = ("bench:price", "bench:rank")
+
+
+class Batch:
+    """
+    MULTI/EXEC or pipeline proxy counting its execution as one round trip.
+    """
+
+    def __init__(self, batch, counter):
+        self.batch = batch
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.batch, name)
+
+    async def execute(self, **kwargs):
+        self.counter.round_trips += 1
+        return await self.batch.execute(**kwargs)
+
+
+class RoundTripCounter:
+    """
+    Connection proxy counting the round trips: awaited commands and batch executions.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.round_trips = 0
+
+    def multi_exec(self):
+        return Batch(self.redis.multi_exec(), self)
+
+    def pipeline(self):
+        return Batch(self.redis.pipeline(), self)
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        async def counted(*args, **kwargs):
+            self.round_trips += 1
+            return await command(*args, **kwargs)
+        return counted
+
+
+class StandInBatch:
+    def __init__(self):
+        self.commands = 0
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands += 1
+        return queue
+
+    async def execute(self, **kwargs):
+        return [1] * self.commands
+
+
+class StandInRedis:
+    """
+    Redis stand-in answering every command at once, to count round trips without a server.
+    """
+
+    def multi_exec(self):
+        return StandInBatch()
+
+    def pipeline(self):
+        return StandInBatch()
+
+    def __getattr__(self, name):
+        async def command(*args, **kwargs):
+            return [] if name == "xread" else 1
+        return command
+
+
+def synthetic_messages(assets):
+    rank = [{"Id": asset_id, "Symbol": f"C{asset_id}"} for asset_id in range(1, assets + 1)]
+    price = [{"Id": asset_id, "Symbol": f"C{asset_id}", "Price USD": asset_id * 1.5} for asset_id in range(1, assets + 1)]
+    return json.dumps(price), json.dumps(rank)
+
+
+async def separate_writes(redis, config, latest, timestamp):
+    """
+    Merger writes before the batched path: snapshot MULTI/EXEC, series pipeline and PUBLISH.
+    """
+    names, columns = merge_columns(json.loads(latest["rank"][1]), json.loads(latest["price"][1]))
+    data = encode_snapshot(names, columns, config["snapshot_encoding"]["compression"])
+    await write_batch(redis, lambda batch: queue_snapshot_value(batch, timestamp, binary_key(timestamp), data))
+    pipeline = redis.pipeline()
+    queue_series(pipeline, timestamp, names, columns, config["series"])
+    await execute_batch(pipeline)
+    await redis.publish(config["redis"]["snapshot_channel"], timestamp)
+
+
+async def cycle(redis, config, latest, timestamp, write):
+    for stream, (_, data) in zip(STREAMS, (latest["price"], latest["rank"])):
+        await redis.xadd(stream, {"data": data}, message_id=f"{timestamp}-0".encode(), max_len=1)
+    await redis.xread(list(STREAMS), timeout=1, count=1, latest_ids=[f"{timestamp - 1}-0"] * len(STREAMS))
+    await write(redis, config, latest, timestamp)
+
+
+async def measure(redis, config, latest, write, first_timestamp):
+    counter = RoundTripCounter(redis)
+    start = time.perf_counter()
+    for position in range(CYCLES):
+        await cycle(counter, config, latest, first_timestamp + position * 60, write)
+    return counter.round_trips / CYCLES, (time.perf_counter() - start) / CYCLES
+
+
+async def run(host, port, assets, dry_run):
+    redis = None
+    if not dry_run:
+        try:
+            redis = await aioredis.create_redis_pool((host, port))
+        except OSError as e:
+            print(f"Redis not reachable ({e}), counting round trips only")
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank", "snapshot_channel": "bench:snapshots"},
+              "snapshot_encoding": {"format": "binary", "compression": "zlib"},
+              "series": {"symbol_column": "Symbol", "columns": ["Price USD"], "window": 3600}}
+    price, rank = synthetic_messages(assets)
+    latest = {"price": (TIMESTAMP, price), "rank": (TIMESTAMP, rank)}
+    timestamps = [TIMESTAMP + position * 60 for position in range(2 * CYCLES)]
+    try:
+        client = redis if redis is not None else StandInRedis()
+        separate = await measure(client, config, latest, separate_writes, timestamps[0])
+        batched = await measure(client, config, latest, merge_and_save, timestamps[CYCLES])
+        print(f"{assets} assets, {CYCLES} minute cycles (2 publishers + merger)")
+        for name, (round_trips, elapsed) in (("separate", separate), ("batched", batched)):
+            timing = f" | {elapsed * 1000:7.2f} ms/cycle" if redis is not None else ""
+            print(f"{name:<8} | {round_trips:4.1f} round trips/cycle{timing}")
+    finally:
+        if redis is not None:
+            await redis.delete(*STREAMS, *[binary_key(timestamp) for timestamp in timestamps],
+                               *[series_key(f"C{asset_id}") for asset_id in range(1, assets + 1)])
+            await redis.zrem(INDEX_KEY, *timestamps)
+            redis.close()
+            await redis.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--assets", type=int, default=5000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.assets, args.dry_run))
@@ -0,0 +1,61 @@
+"""
+Read latency of the top rows of a past minute from the mmap snapshot archive vs a binary
+columnar snapshot (as stored in Redis or in the history tiers).
+
+A synthetic archive of `minutes` snapshots is written to a temporary folder, then random
+past minutes are read: binary search in the index and slice of the mapped records, vs the
+decompression and decode of a whole binary snapshot. Both give the JSON encoded rows
+returned by the API.
+
+Usage:
+    python -m benchmarks.bench_snapshot_archive [assets] [minutes]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+from common.merge_engine import merge_columns, render_rows
+from common.snapshot_archive import SnapshotArchive
+from common.snapshot_codec import decode_snapshot, encode_snapshot
+
+LIMITS = (10, 100, None)
+READS = 200
+
+
+def synthetic_minute(assets):
+    ids = list(range(1, assets + 1))
+    random.shuffle(ids)
+    rank_data = [{"Id": asset_id, "Symbol": f"C{asset_id}"} for asset_id in ids]
+    price_data = [{"Id": asset_id, "Symbol": f"C{asset_id}", "Price USD": random.uniform(0.0001, 50000)} for asset_id in ids]
+    return merge_columns(rank_data, price_data)
+
+
+def run(assets=5000, minutes=240):
+    random.seed(0)
+    snapshot = synthetic_minute(assets)
+    binary = encode_snapshot(*snapshot)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "snapshots.tca")
+        writer = SnapshotArchive(path)
+        start = time.perf_counter()
+        for minute in range(minutes):
+            writer.append(minute * 60, *snapshot)
+        append_time = (time.perf_counter() - start) / minutes
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+        print(f"{assets} assets, {minutes} minutes archived | {size / 2 ** 20:8.1f} MiB | "
+              f"append {append_time * 1000:6.2f} ms/snapshot")
+
+        reader = SnapshotArchive(path)
+        keys = [random.randrange(minutes) * 60 for _ in range(READS)]
+        for limit in LIMITS:
+            archive_time = timeit.timeit(lambda: [render_rows(*reader.read(key, limit)) for key in keys], number=1) / READS
+            binary_time = timeit.timeit(lambda: [render_rows(*decode_snapshot(binary, limit)) for _ in keys], number=1) / READS
+            print(f"limit {str(limit):>5} | archive {archive_time * 1000:7.3f} ms | binary snapshot {binary_time * 1000:7.3f} ms")
+        reader.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
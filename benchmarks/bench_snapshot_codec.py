@@ -0,0 +1,69 @@
+"""
+Size and decode latency of the binary columnar snapshot format vs the JSON row list.
+
+Snapshot payload bytes are averaged over a few synthetic minutes and scaled to a day of
+one snapshot per minute (Redis per-key and per-list-item overhead not included, it only
+favours the single binary value). Decode latency is the time to get the JSON encoded rows
+read by the API (JSON rows are stored as they are served) and the time to get the row
+dictionaries, binary snapshot vs JSON rows.
+
+Usage:
+    python -m benchmarks.bench_snapshot_codec [assets]
+"""
+import json
+import random
+import sys
+import timeit
+from common.merge_engine import merge_columns, render_rows
+from common.snapshot_codec import decode_snapshot, encode_snapshot, is_available
+
+MINUTES_PER_DAY = 1440
+SAMPLE_MINUTES = 5
+LIMITS = (10, 100, None)
+
+
+def synthetic_minute(assets):
+    ids = list(range(1, assets + 1))
+    random.shuffle(ids)
+    rank_data = [{"Id": asset_id, "Symbol": f"C{asset_id}"} for asset_id in ids]
+    price_data = [{"Id": asset_id, "Symbol": f"C{asset_id}", "Price USD": random.uniform(0.0001, 50000)} for asset_id in ids]
+    return merge_columns(rank_data, price_data)
+
+
+def snapshot_dicts(names, columns):
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def best_time(function, repeat=5, number=5):
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def run(assets=5000):
+    random.seed(0)
+    minutes = [synthetic_minute(assets) for _ in range(SAMPLE_MINUTES)]
+    json_rows = [render_rows(names, columns) for names, columns in minutes]
+    json_size = sum(sum(map(len, rows)) for rows in json_rows) / SAMPLE_MINUTES
+    print(f"{assets} assets, per day = average snapshot size x {MINUTES_PER_DAY}")
+    print(f"json rows   | {json_size / 1024:8.1f} KiB/snapshot | {json_size * MINUTES_PER_DAY / 2 ** 20:8.1f} MiB/day")
+
+    names, columns = minutes[0]
+    stored_rows = [row.encode() for row in json_rows[0]]
+    for compression in ("none", "zlib", "lz4", "zstd"):
+        if not is_available(compression):
+            print(f"{compression:<11} | not installed")
+            continue
+        size = sum(len(encode_snapshot(*minute, compression)) for minute in minutes) / SAMPLE_MINUTES
+        data = encode_snapshot(names, columns, compression)
+        encode_time = best_time(lambda: encode_snapshot(names, columns, compression))
+        print(f"{compression:<11} | {size / 1024:8.1f} KiB/snapshot | {size * MINUTES_PER_DAY / 2 ** 20:8.1f} MiB/day "
+              f"(x{json_size / size:.1f} smaller) | encode {encode_time * 1000:6.2f} ms")
+        for limit in LIMITS:
+            binary_rows_time = best_time(lambda: render_rows(*decode_snapshot(data, limit)))
+            binary_dicts_time = best_time(lambda: snapshot_dicts(*decode_snapshot(data, limit)))
+            json_dicts_time = best_time(lambda: [json.loads(row) for row in stored_rows[:limit]])
+            print(f"    limit {str(limit):>5} | binary -> json rows {binary_rows_time * 1000:7.3f} ms | "
+                  f"binary -> dicts {binary_dicts_time * 1000:7.3f} ms | json rows -> dicts {json_dicts_time * 1000:7.3f} ms")
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
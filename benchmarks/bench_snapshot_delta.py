@@ -0,0 +1,97 @@
+"""
+Storage and reconstruction cost of delta snapshots over a synthetic day of data.
+
+Every minute of the day a share of the prices move, a few assets swap ranks and a few
+are listed/delisted. Snapshots are stored as full row lists only, and as keyframes plus
+deltas for several keyframe intervals (see `common.snapshot_delta.DeltaWriter`). Rebuild
+time is measured in memory (decode and apply of the delta chain), without Redis, on a
+sample of the minutes: of every row, and of the top `TOP_LIMIT` rows only, as read by the
+API for a small `limit` (deltas decoded up to the top rows only, applied to the top of the keyframe).
+
+Usage:
+    python -m benchmarks.bench_snapshot_delta [assets] [minutes]
+"""
+import random
+import sys
+import time
+from common.merge_engine import merge_encoded_rows
+from common.snapshot_delta import DeltaWriter, apply_deltas, decode_delta, truncate_delta
+
+KEYFRAME_INTERVALS = (15, 60, 240)
+PRICE_CHANGE_SHARE = 0.3
+RANK_SWAPS = 20
+LISTINGS = 2
+# Rebuild every 7th minute, to sample every position in the delta chains without rebuilding the whole day
+REBUILD_STEP = 7
+TOP_LIMIT = 10
+
+
+def synthetic_day(assets, minutes):
+    random.seed(0)
+    next_id = assets + 1
+    ranking = list(range(1, assets + 1))
+    prices = {asset_id: random.uniform(0.01, 50000) for asset_id in ranking}
+    for _ in range(minutes):
+        for asset_id in random.sample(ranking, int(len(ranking) * PRICE_CHANGE_SHARE)):
+            prices[asset_id] *= random.uniform(0.99, 1.01)
+        for _ in range(RANK_SWAPS):
+            position = random.randrange(len(ranking) - 1)
+            ranking[position], ranking[position + 1] = ranking[position + 1], ranking[position]
+        for _ in range(LISTINGS):
+            ranking.pop(random.randrange(len(ranking)))
+            ranking.insert(random.randrange(len(ranking)), next_id)
+            prices[next_id] = random.uniform(0.01, 10)
+            next_id += 1
+        rank_data = [{"Id": asset_id, "Symbol": f"C{asset_id}"} for asset_id in ranking]
+        price_data = [{"Id": asset_id, "Symbol": f"C{asset_id}", "Price USD": prices[asset_id]} for asset_id in ranking]
+        yield merge_encoded_rows(rank_data, price_data)
+
+
+def store(snapshots, keyframe_interval):
+    writer = DeltaWriter(keyframe_interval=keyframe_interval)
+    stored = []
+    encode_time = 0
+    for timestamp, rows in enumerate(snapshots):
+        start = time.perf_counter()
+        delta = writer.encode(timestamp, rows)
+        encode_time += time.perf_counter() - start
+        writer.stored(timestamp, rows, delta is not None)
+        stored.append(rows if delta is None else delta)
+    return stored, encode_time
+
+
+def rebuild(stored, timestamp, limit=None):
+    chain = []
+    while isinstance(stored[timestamp], str):
+        timestamp, operations = decode_delta(stored[timestamp], limit)
+        if limit is not None:
+            operations, limit = truncate_delta(operations, limit)
+        chain.append(operations)
+    return apply_deltas(stored[timestamp][:limit], chain[::-1])
+
+
+def run(assets=5000, minutes=1440):
+    print(f"Generating {minutes} minutes of {assets} assets...")
+    snapshots = list(synthetic_day(assets, minutes))
+    full_size = sum(sum(map(len, rows)) for rows in snapshots)
+    print(f"full snapshots      | {full_size / 2 ** 20:8.1f} MiB")
+
+    for keyframe_interval in KEYFRAME_INTERVALS:
+        stored, encode_time = store(snapshots, keyframe_interval)
+        size = sum(len(item) if isinstance(item, str) else sum(map(len, item)) for item in stored)
+        rebuild_times = {None: [], TOP_LIMIT: []}
+        for timestamp in range(0, minutes, REBUILD_STEP):
+            for limit, times in rebuild_times.items():
+                start = time.perf_counter()
+                rows = rebuild(stored, timestamp, limit)[:limit]
+                times.append(time.perf_counter() - start)
+                assert rows == snapshots[timestamp][:limit]
+        all_times, top_times = rebuild_times[None], rebuild_times[TOP_LIMIT]
+        print(f"keyframe every {keyframe_interval:>4} | {size / 2 ** 20:8.1f} MiB (x{full_size / size:.1f} smaller) | "
+              f"delta {encode_time / minutes * 1000:6.2f} ms/min | rebuild avg "
+              f"{sum(all_times) / len(all_times) * 1000:7.2f} ms, max {max(all_times) * 1000:7.2f} ms | "
+              f"top {TOP_LIMIT} avg {sum(top_times) / len(top_times) * 1000:6.2f} ms, max {max(top_times) * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,56 @@
+"""
+Benchmark of the snapshot read latency against `limit` for both storage layouts.
+
+- legacy : GET of the whole JSON string + json.loads + slice.
+- rows   : LRANGE of the top `limit` rows (`common.snapshot_store.read_snapshot_rows`).
+
+Needs a running Redis server. Keys are written under a far past timestamp and removed at the end.
+
+Usage:
+    python -m benchmarks.bench_snapshot_storage [--host localhost] [--port 6379] [--rows 5000]
+"""
+import argparse
+import asyncio
+import json
+import time
+import aioredis
+from common.snapshot_store import save_snapshot, read_snapshot_rows, rows_key
+
+TIMESTAMP = 60
+LIMITS = (10, 100, 1000, 5000)
+
+
+async def timed(coroutine_function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await coroutine_function()
+    return (time.perf_counter() - start) / repeat
+
+
+async def run(host, port, rows_count, repeat=200):
+    redis = await aioredis.create_redis_pool((host, port))
+    rows = [{"Rank": rank, "Symbol": f"C{rank}", "Price USD": rank * 1.2345678901} for rank in range(1, rows_count + 1)]
+    try:
+        await redis.set(TIMESTAMP, json.dumps(rows))
+        await save_snapshot(redis, TIMESTAMP, rows)
+
+        async def legacy(limit):
+            return json.loads(await redis.get(TIMESTAMP))[:limit]
+
+        for limit in LIMITS:
+            legacy_time = await timed(lambda: legacy(limit), repeat)
+            rows_time = await timed(lambda: read_snapshot_rows(redis, TIMESTAMP, limit), repeat)
+            print(f"limit {limit:>5} | legacy {legacy_time * 1000:7.3f} ms | rows {rows_time * 1000:7.3f} ms")
+    finally:
+        await redis.delete(TIMESTAMP, rows_key(TIMESTAMP))
+        redis.close()
+        await redis.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.rows))
@@ -0,0 +1,87 @@
+"""
+Benchmark of the DataFetcher parse modes on a large CMC-like listing.
+
+Each mode runs in its own subprocess so the reported peak RSS (`ru_maxrss`) is not
+shared between them. The peak of Python allocations during the fetch (tracemalloc) is
+reported too, as it excludes the synthetic response body held by the mock transport.
+
+Usage:
+    python -m benchmarks.bench_stream_parse [rows]
+"""
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import httpx
+from shared.data_fetcher import DataFetcher
+
+CHUNK_SIZE = 64 * 1024
+
+
+def listing_body(rows):
+    quote = {"price": 1.0, "volume_24h": 1.0, "volume_change_24h": 1.0, "percent_change_1h": 1.0,
+             "percent_change_24h": 1.0, "percent_change_7d": 1.0, "market_cap": 1.0,
+             "market_cap_dominance": 1.0, "fully_diluted_market_cap": 1.0, "last_updated": "2024-02-01T00:00:00.000Z"}
+    data = [{"id": i, "name": f"Coin {i}", "symbol": f"C{i}", "slug": f"coin-{i}", "num_market_pairs": 10,
+             "date_added": "2024-01-01T00:00:00.000Z", "tags": ["mineable", "pow", "store-of-value"] * 5,
+             "max_supply": 21000000, "circulating_supply": 19000000.5, "total_supply": 19000000.5,
+             "platform": None, "cmc_rank": i, "last_updated": "2024-02-01T00:00:00.000Z",
+             "quote": {"USD": {**quote, "price": i * 1.5}}} for i in range(rows)]
+    return json.dumps({"status": {"error_code": 0}, "data": data}).encode()
+
+
+def fetcher_config(parse_mode):
+    return {
+        "api_key_env_var_name": "COINMARKET_API_KEY",
+        "url": "https://example.com/listing",
+        "parameters": {},
+        "headers": {},
+        "parse_mode": parse_mode,
+        "data_path": "data",
+        "fields": [
+            {"name": "Id", "source": "id", "default": "NOT_AVAILABLE"},
+            {"name": "Symbol", "source": "symbol", "default": "NOT_AVAILABLE"},
+            {"name": "Price USD", "source": "quote.USD.price", "default": "NOT_AVAILABLE"}
+        ]
+    }
+
+
+async def fetch(parse_mode, body):
+    async def chunks():
+        for start in range(0, len(body), CHUNK_SIZE):
+            yield body[start:start + CHUNK_SIZE]
+
+    fetcher = DataFetcher(fetcher_config(parse_mode))
+    fetcher.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=chunks())))
+    async with fetcher:
+        return await fetcher.get_data()
+
+
+def run_mode(parse_mode, rows):
+    body = listing_body(rows)
+    tracemalloc.start()
+    items = asyncio.run(fetch(parse_mode, body))
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Timed separately, tracemalloc slows down every allocation
+    start = time.perf_counter()
+    asyncio.run(fetch(parse_mode, body))
+    elapsed = time.perf_counter() - start
+    print(f"{parse_mode:<6} {rows} rows ({len(body) / 2**20:.1f} MiB body) | {len(items)} items | "
+          f"{elapsed * 1000:8.1f} ms | peak alloc {traced_peak / 2**20:7.1f} MiB | peak RSS {max_rss / 1024:7.1f} MiB")
+
+
+def run(rows=5000):
+    for parse_mode in ("json", "stream"):
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_stream_parse", "--mode", parse_mode, str(rows)], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--mode":
+        run_mode(sys.argv[2], int(sys.argv[3]))
+    else:
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
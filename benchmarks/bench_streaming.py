@@ -0,0 +1,78 @@
+"""
+Peak memory per request of the buffered and the streaming response paths, against `limit`.
+
+The stored snapshot is a binary columnar snapshot held in memory (not counted). Buffered:
+decode the top `limit` rows and render the JSON and CSV payloads, as `getTopCryptoList`
+does on a cache miss. Streaming: decode and render `chunk_size` rows at a time, as with
+`stream=true`. Peak memory is measured with tracemalloc.
+
+Usage:
+    python -m benchmarks.bench_streaming [assets] [chunk_size]
+"""
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+from common.merge_engine import merge_columns, render_rows
+from common.snapshot import RenderedSnapshot, stream_csv_rows, stream_json_rows
+from common.snapshot_codec import decode_snapshot, encode_snapshot, iter_snapshot_chunks
+
+LIMITS = (100, 1000, 10000, 50000)
+
+
+def synthetic_snapshot(assets):
+    random.seed(0)
+    rank_data = [{"Id": asset_id, "Symbol": f"C{asset_id}"} for asset_id in range(1, assets + 1)]
+    price_data = [{"Id": asset_id, "Symbol": f"C{asset_id}", "Price USD": random.uniform(0.0001, 50000)}
+                  for asset_id in range(1, assets + 1)]
+    return encode_snapshot(*merge_columns(rank_data, price_data))
+
+
+def buffered(data, limit):
+    snapshot = RenderedSnapshot.from_encoded_rows(render_rows(*decode_snapshot(data, limit)), complete=False)
+    return len(snapshot.json(limit)) + len(snapshot.csv(limit))
+
+
+async def chunks_of(data, limit, chunk_size):
+    for names, columns in iter_snapshot_chunks(data, limit, chunk_size):
+        yield render_rows(names, columns)
+
+
+async def consume(pieces):
+    size = 0
+    async for piece in pieces:
+        size += len(piece)
+    return size
+
+
+def streaming(data, limit, chunk_size):
+    json_size = asyncio.run(consume(stream_json_rows(chunks_of(data, limit, chunk_size))))
+    return json_size + asyncio.run(consume(stream_csv_rows(chunks_of(data, limit, chunk_size))))
+
+
+def measure(function):
+    start = time.perf_counter()
+    size = function()
+    elapsed = time.perf_counter() - start
+    # Timed without tracing, tracemalloc slows allocations down
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+def run(assets=50000, chunk_size=500):
+    data = synthetic_snapshot(assets)
+    print(f"{assets} assets snapshot, chunks of {chunk_size} rows, JSON + CSV payloads")
+    for limit in LIMITS:
+        size, buffered_peak, buffered_time = measure(lambda: buffered(data, limit))
+        _, streaming_peak, streaming_time = measure(lambda: streaming(data, limit, chunk_size))
+        print(f"limit {limit:>6} | payload {size / 2 ** 20:6.2f} MiB | buffered peak {buffered_peak / 2 ** 20:7.2f} MiB "
+              f"({buffered_time * 1000:7.1f} ms) | streaming peak {streaming_peak / 2 ** 20:7.2f} MiB "
+              f"({streaming_time * 1000:7.1f} ms)")
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
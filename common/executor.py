@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+EXECUTOR_KINDS = ("process", "thread")
+DEFAULT_START_METHOD = "spawn"
+
+
+def warm_up():
+    """
+    No-op run in every worker at startup, so the first offloaded call does not pay the worker start.
+    """
+    return None
+
+
+class CpuExecutor:
+    """
+    Runs CPU-bound functions (parsing, filtering, merging) off the event loop.
+
+    With `kind` `process` the functions run in a process pool, so they do not hold the GIL
+    of the process serving requests; functions and arguments must be picklable, pass compact
+    payloads (bytes, str, lists of tuples) rather than lists of dictionaries. When the process
+    pool can not be created or breaks (e.g. no shared semaphores in the container, a worker
+    killed), calls fall back to a thread pool, which keeps them off the loop but shares the GIL.
+    """
+
+    def __init__(self, kind="process", max_workers=None, start_method=DEFAULT_START_METHOD):
+        """
+        Parameters:
+            - `kind` (str): `process` or `thread`.
+            - `max_workers` (int, optional): Pool size. The `concurrent.futures` default if None.
+            - `start_method` (str): multiprocessing start method of the process pool workers. `spawn`
+              by default, forking a process running an event loop and its threads is not safe.
+
+        Raises:
+            - ValueError: If `kind` is not supported.
+        """
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Executor kind {kind} not supported, use one of {EXECUTOR_KINDS}")
+        self.max_workers = max_workers
+        self.kind = kind
+        self.pool = None
+        if kind == "process":
+            try:
+                self.pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context(start_method))
+            except (OSError, ImportError, NotImplementedError, ValueError) as e:
+                logging.warning(f"Process pool not available ({e!r}), falling back to a thread pool")
+                self.kind = "thread"
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="cpu")
+
+    def fall_back_to_threads(self, reason, failed_pool):
+        """
+        Replace a broken process pool with a thread pool.
+
+        Concurrent calls all see the same pool break, only the first one replaces it.
+
+        Parameters:
+            - `reason` (Exception): Why the pool broke.
+            - `failed_pool` (Executor): The pool the call was submitted to.
+        """
+        if self.pool is not failed_pool:
+            return
+        logging.error(f"Process pool broken ({reason!r}), falling back to a thread pool")
+        failed_pool.shutdown(wait=False)
+        self.kind = "thread"
+        self.pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="cpu")
+
+    async def run(self, function, *args):
+        """
+        Run `function(*args)` in the pool without blocking the event loop.
+
+        Parameters:
+            - `function` (function): Module level function (picklable for a process pool).
+            - `*args`: Its arguments.
+
+        Returns:
+            - The result of `function`.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            return await loop.run_in_executor(pool, function, *args)
+        except BrokenProcessPool as e:
+            self.fall_back_to_threads(e, pool)
+            return await loop.run_in_executor(self.pool, function, *args)
+
+    async def start(self):
+        """
+        Start the pool workers ahead of the first call.
+        """
+        workers = self.max_workers or getattr(self.pool, "_max_workers", 1)
+        await asyncio.gather(*[self.run(warm_up) for _ in range(workers)])
+        logging.info(f"CPU executor ready: {workers} {self.kind} workers")
+
+    def shutdown(self):
+        """
+        Shut the pool down, cancelling the calls not started yet.
+        """
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_executor(executor_config):
+    """
+    Create the CPU executor described by the `executor` block of a service configuration.
+
+    Parameters:
+        - `executor_config` (dict): `executor` configuration block. Keys: `kind` (`process`,
+          `thread` or `none`), `max_workers` and `start_method` (all optional).
+
+    Returns:
+        - CpuExecutor: The executor, or None if there is no block or `kind` is `none` (CPU work
+          stays on the event loop).
+    """
+    if not executor_config or executor_config.get("kind", "process") == "none":
+        return None
+    return CpuExecutor(executor_config.get("kind", "process"), executor_config.get("max_workers"),
+                       executor_config.get("start_method", DEFAULT_START_METHOD))
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import threading
+
+# Downsampled tiers, finest first, with the time span (seconds) every snapshot stands for
+TIERS = (("hour", 3600), ("day", 86400))
+
+
+class HistoryStore:
+    """
+    On-disk SQLite store of the downsampled (hourly and daily) snapshots.
+
+    Snapshots are stored in the binary columnar format (see `common.snapshot_codec`), one
+    per tier and time span, under the timestamp of the minute snapshot they were taken
+    from. Calls are blocking, run them in a thread from async code (`asyncio.to_thread`).
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+            - `path` (str): SQLite database file. Created with its folder if missing.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS snapshots (tier TEXT NOT NULL, timestamp INTEGER NOT NULL, "
+                                    "data BLOB NOT NULL, PRIMARY KEY (tier, timestamp))")
+
+    def save(self, tier, timestamp, data):
+        """
+        Save the snapshot of a tier, replacing any snapshot stored for the same timestamp.
+
+        Parameters:
+            - `tier` (str): Tier name (see `TIERS`).
+            - `timestamp` (int): Timestamp of the snapshot.
+            - `data` (bytes): Encoded snapshot.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO snapshots (tier, timestamp, data) VALUES (?, ?, ?)",
+                                    (tier, timestamp, data))
+
+    def timestamps(self, tier, start=0, end=None):
+        """
+        Get the timestamps of the snapshots of a tier in `[start, end)`, in ascending order.
+
+        Parameters:
+            - `tier` (str): Tier name.
+            - `start` (int): First timestamp included.
+            - `end` (int, optional): First timestamp excluded. No upper bound if None.
+
+        Returns:
+            - list: Snapshot timestamps.
+        """
+        end = end if end is not None else 2 ** 62
+        with self.lock:
+            cursor = self.connection.execute("SELECT timestamp FROM snapshots WHERE tier = ? AND timestamp >= ? "
+                                             "AND timestamp < ? ORDER BY timestamp", (tier, start, end))
+            return [timestamp for (timestamp,) in cursor]
+
+    def load(self, tier, timestamp):
+        """
+        Get a snapshot of a tier.
+
+        Parameters:
+            - `tier` (str): Tier name.
+            - `timestamp` (int): Timestamp of the snapshot.
+
+        Returns:
+            - bytes: The encoded snapshot, or None if it is not stored.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM snapshots WHERE tier = ? AND timestamp = ?",
+                                          (tier, timestamp)).fetchone()
+        return row[0] if row else None
+
+    def find(self, timestamp, tolerance=None):
+        """
+        Find the latest snapshot at or before `timestamp` in the finest tier covering it.
+
+        A snapshot of a tier covers the requests up to one tier span after its timestamp, and
+        at most `tolerance` seconds after it.
+
+        Parameters:
+            - `timestamp` (int): Requested timestamp.
+            - `tolerance` (int, optional): Max seconds the snapshot may be older than `timestamp`.
+              Bounded by the tier span only if None.
+
+        Returns:
+            - tuple: Snapshot timestamp (int) and encoded snapshot (bytes), or None if no tier covers it.
+        """
+        with self.lock:
+            for tier, span in TIERS:
+                oldest = timestamp - span + 1 if tolerance is None else max(timestamp - span + 1, timestamp - tolerance)
+                row = self.connection.execute("SELECT timestamp, data FROM snapshots WHERE tier = ? AND timestamp <= ? "
+                                              "AND timestamp >= ? ORDER BY timestamp DESC LIMIT 1",
+                                              (tier, timestamp, oldest)).fetchone()
+                if row:
+                    return row[0], row[1]
+        return None
+
+    def delete(self, tier, end):
+        """
+        Delete the snapshots of a tier older than `end`.
+
+        Parameters:
+            - `tier` (str): Tier name.
+            - `end` (int): First timestamp kept.
+
+        Returns:
+            - int: Number of snapshots deleted.
+        """
+        with self.lock, self.connection:
+            return self.connection.execute("DELETE FROM snapshots WHERE tier = ? AND timestamp < ?", (tier, end)).rowcount
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.connection.close()
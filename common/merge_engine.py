@@ -0,0 +1,368 @@
+import json
+import logging
+from collections import Counter
+from itertools import compress, product
+from json.encoder import encode_basestring_ascii
+from math import isfinite
+from operator import itemgetter
+
+DEFAULT_JOIN_COLUMNS = ("Id", "Symbol")
+JOIN_TYPES = ("inner", "left")
+
+
+def source_columns(rows):
+    """
+    Get the columns of a source, in order of first appearance.
+
+    Parameters:
+        - `rows` (list): Source rows (dictionaries).
+
+    Returns:
+        - list: Column names.
+    """
+    columns = {}
+    # Rows of a source nearly always share their columns, only the distinct layouts are merged
+    for layout in dict.fromkeys(map(tuple, rows)):
+        columns.update(dict.fromkeys(layout))
+    return list(columns)
+
+
+def column_values(rows, column):
+    """
+    Extract the values of a column of every row, in a single C level pass.
+
+    Missing values are returned as None.
+
+    Parameters:
+        - `rows` (list): Source rows (dictionaries).
+        - `column` (str): Column name.
+
+    Returns:
+        - list: The value of `column` of every row.
+    """
+    try:
+        return list(map(itemgetter(column), rows))
+    except KeyError:
+        return [row.get(column) for row in rows]
+
+
+def join_keys(rows, on):
+    """
+    Get the join key of every row, as a tuple of the join column values.
+
+    Parameters:
+        - `rows` (list): Source rows (dictionaries).
+        - `on` (tuple): Join columns.
+
+    Returns:
+        - list: One key tuple per row.
+    """
+    return list(zip(*[column_values(rows, column) for column in on])) if rows else []
+
+
+def build_index(keys):
+    """
+    Index the rows of a source by their join key.
+
+    Parameters:
+        - `keys` (list): Join key of every row.
+
+    Returns:
+        - tuple: `index` dict (join key -> row position) and `duplicates` dict (join key ->
+          every row position with that key, in source order) for the keys found more than once.
+    """
+    index = dict(zip(keys, range(len(keys))))
+    duplicates = {}
+    if len(index) < len(keys):
+        for position, key in enumerate(keys):
+            duplicates.setdefault(key, []).append(position)
+        duplicates = {key: positions for key, positions in duplicates.items() if len(positions) > 1}
+    return index, duplicates
+
+
+def join_positions(main_keys, indexes, how="inner"):
+    """
+    Join the main source keys against the indexes of the other sources.
+
+    Parameters:
+        - `main_keys` (list): Join key of every main source row.
+        - `indexes` (list): `(index, duplicates)` of every other source (see `build_index`).
+        - `how` (str): `inner` keeps only the main rows found in every source, `left` keeps
+          all the main rows.
+
+    Returns:
+        - list: For every source, main source first, the position of the row feeding each
+          merged row (None if a `left` join found no row). Merged rows keep the main source
+          order; keys found more than once in a source produce every combination, as pandas does.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unsupported join type '{how}', expected one of {JOIN_TYPES}")
+
+    if not any(duplicates for _, duplicates in indexes):
+        # Unique keys: a single dict lookup per source and row
+        positions = [list(map(index.get, main_keys)) for index, _ in indexes]
+        main_positions = range(len(main_keys))
+        if how == "inner" and any(None in source_positions for source_positions in positions):
+            matched = [None not in joined for joined in zip(*positions)]
+            main_positions = list(compress(main_positions, matched))
+            positions = [list(compress(source_positions, matched)) for source_positions in positions]
+        return [main_positions] + positions
+
+    positions = [[] for _ in range(len(indexes) + 1)]
+    for main_position, key in enumerate(main_keys):
+        if how == "inner" and any(key not in index for index, _ in indexes):
+            continue
+        matches = [duplicates.get(key) or [index.get(key)] for index, duplicates in indexes]
+        for joined in product([main_position], *matches):
+            for source_positions, position in zip(positions, joined):
+                source_positions.append(position)
+    return positions
+
+
+def gather(values, positions):
+    """
+    Pick the values at `positions`, None for a None position.
+
+    Parameters:
+        - `values` (list): Column values of a source.
+        - `positions` (list): Row positions to pick, in output order.
+
+    Returns:
+        - list: The picked values.
+    """
+    if isinstance(positions, range) or None not in positions:
+        return list(map(values.__getitem__, positions))
+    return [None if position is None else values[position] for position in positions]
+
+
+def output_plan(columns_list, on, suffixes=None):
+    """
+    Work out the output columns of the join and where every value comes from.
+
+    Join columns are taken from the main (first) source. Other columns present in more
+    than one source get a suffix: `_df<n>` as pandas does for chained merges by default,
+    or the suffix of their source when `suffixes` lists one per source.
+
+    Parameters:
+        - `columns_list` (list): Columns of every source, main source first.
+        - `on` (tuple): Join columns.
+        - `suffixes` (list, optional): Suffix of every source, main source first.
+
+    Returns:
+        - list: `(output_name, source_position, column)` per output column.
+    """
+    if suffixes is not None:
+        if len(suffixes) != len(columns_list):
+            raise ValueError(f"Expected {len(columns_list)} suffixes, got {len(suffixes)}")
+        counts = Counter(column for columns in columns_list for column in set(columns) if column not in on)
+        return [(column + suffixes[position] if counts[column] > 1 else column, position, column)
+                for position, columns in enumerate(columns_list)
+                for column in columns if position == 0 or column not in on]
+
+    plan = [[name, 0, name] for name in columns_list[0]]
+    for position, columns in enumerate(columns_list[1:], start=1):
+        left_suffix, right_suffix = ("_df1", "_df2") if position == 1 else (f"_df{position - 1}", f"_df{position}")
+        new_columns = [column for column in columns if column not in on]
+        overlapping = {entry[0] for entry in plan} & set(new_columns)
+        for entry in plan:
+            if entry[0] in overlapping:
+                entry[0] += left_suffix
+        plan.extend([column + right_suffix if column in overlapping else column, position, column]
+                    for column in new_columns)
+    return [tuple(entry) for entry in plan]
+
+
+def merge_columns(*data_list, on=DEFAULT_JOIN_COLUMNS, how="inner", suffixes=None, drop=("Id",),
+                  rank_column="Rank"):
+    """
+    Join N sources on the join columns with hash-join semantics, column-wise.
+
+    The first source is the main one and sets the order of the results; the others are
+    looked up in a dict index built once per source. Every output column is then gathered
+    from its source with a single pass, no intermediate row is built.
+    Values are copied as they are, floats are never converted.
+
+    Parameters:
+        - `*data_list`: Rows (list of dictionaries) of every source, main source first.
+        - `on` (tuple): Join columns.
+        - `how` (str): Join type, `inner` or `left` (main source rows missing in other sources kept, with None values).
+        - `suffixes` (list, optional): Suffix of every source for overlapping columns (see `output_plan`).
+        - `drop` (tuple): Columns left out of the results.
+        - `rank_column` (str): Name of the column added first with the 1-based position of the row.
+
+    Returns:
+        - tuple: Output column names (list) and the values of every output column (list of lists).
+    """
+    on = tuple(on)
+    indexes = [build_index(join_keys(rows, on)) for rows in data_list[1:]]
+    positions = join_positions(join_keys(data_list[0], on), indexes, how)
+
+    names = [rank_column]
+    columns = [range(1, len(positions[0]) + 1)]
+    for name, source_position, column in output_plan([source_columns(rows) for rows in data_list], on, suffixes):
+        if name in drop:
+            continue
+        values = column_values(data_list[source_position], column)
+        names.append(name)
+        columns.append(gather(values, positions[source_position]))
+    return names, columns
+
+
+def iter_merged_rows(*data_list, on=DEFAULT_JOIN_COLUMNS, how="inner", suffixes=None, drop=("Id",),
+                     rank_column="Rank"):
+    """
+    Merge N sources into rows ranked by the main source order.
+
+    Parameters:
+        - `*data_list`: Rows (list of dictionaries) of every source, main source first.
+        - `on` (tuple): Join columns.
+        - `how` (str): Join type, `inner` or `left` (main source rows missing in other sources kept, with None values).
+        - `suffixes` (list, optional): Suffix of every source for overlapping columns (see `output_plan`).
+        - `drop` (tuple): Columns left out of the results.
+        - `rank_column` (str): Name of the column added first with the 1-based position of the row.
+
+    Yields:
+        - dict: Merged rows in rank order.
+    """
+    names, columns = merge_columns(*data_list, on=on, how=how, suffixes=suffixes, drop=drop, rank_column=rank_column)
+    for values in zip(*columns):
+        yield dict(zip(names, values))
+
+
+def encode_column(values):
+    """
+    JSON encode every value of a column.
+
+    Columns holding only strings, ints or finite floats are encoded with a single C level
+    pass; any other column falls back to `json.dumps` per value. Output is the same as
+    `json.dumps` in both cases.
+
+    Parameters:
+        - `values` (list): Column values.
+
+    Returns:
+        - list: JSON representation of every value.
+    """
+    types = set(map(type, values))
+    if types == {str}:
+        return list(map(encode_basestring_ascii, values))
+    if types == {int}:
+        return list(map(int.__repr__, values))
+    # NaN and infinities have their own JSON spelling
+    if types == {float} and all(map(isfinite, values)):
+        return list(map(float.__repr__, values))
+    return list(map(json.dumps, values))
+
+
+def merge_encoded_rows(*data_list, on=DEFAULT_JOIN_COLUMNS, how="inner", suffixes=None, drop=("Id",),
+                       rank_column="Rank"):
+    """
+    Merge N sources and JSON encode the merged rows in the same pass.
+
+    Merged columns are rendered to JSON column-wise, see `render_rows`.
+
+    Parameters:
+        - `*data_list`: Rows (list of dictionaries) of every source, main source first.
+        - `on` (tuple): Join columns.
+        - `how` (str): Join type, `inner` or `left` (main source rows missing in other sources kept, with None values).
+        - `suffixes` (list, optional): Suffix of every source for overlapping columns (see `output_plan`).
+        - `drop` (tuple): Columns left out of the results.
+        - `rank_column` (str): Name of the column added first with the 1-based position of the row.
+
+    Returns:
+        - list: One JSON string per merged row, in rank order. Same output as `json.dumps`
+          of the rows of `iter_merged_rows`.
+    """
+    logging.info(f"Merging data from {len(data_list)} sources")
+    return render_rows(*merge_columns(*data_list, on=on, how=how, suffixes=suffixes, drop=drop,
+                                      rank_column=rank_column))
+
+
+def pack_rows(rows, names):
+    """
+    Convert rows to a compact form, a tuple of values per row, for other processes.
+
+    Without a key per value, the rows are pickled several times faster than dictionaries.
+
+    Parameters:
+        - `rows` (list): Rows (dictionaries) holding every column of `names`.
+        - `names` (list): Column names, in value order.
+
+    Returns:
+        - list: One tuple of values per row.
+    """
+    if len(names) == 1:
+        return [(value,) for value in column_values(rows, names[0])]
+    return list(map(itemgetter(*names), rows))
+
+
+def unpack_rows(names, rows):
+    """
+    Convert packed rows (see `pack_rows`) back to dictionaries.
+
+    Parameters:
+        - `names` (list): Column names, in value order.
+        - `rows` (list): One tuple of values per row.
+
+    Returns:
+        - list: Rows (dictionaries).
+    """
+    return [dict(zip(names, values)) for values in rows]
+
+
+def merge_packed_rows(packed_list, options):
+    """
+    Merge N packed sources and JSON encode the merged rows, returning them in a single buffer.
+
+    Module level function taking and returning compact payloads, to run in a process pool
+    (see `common.executor`).
+
+    Parameters:
+        - `packed_list` (list): Column names (list) and packed rows (list of tuples) of every source, main source first.
+        - `options` (dict): Keyword arguments of `merge_encoded_rows` (see `merge_options`).
+
+    Returns:
+        - str: JSON encoded merged rows, in rank order, separated by new lines (escaped in JSON strings).
+    """
+    return "\n".join(merge_encoded_rows(*[unpack_rows(names, rows) for names, rows in packed_list], **options))
+
+
+def render_rows(names, columns):
+    """
+    JSON encode the rows of a column-wise table.
+
+    Columns are encoded one by one (see `encode_column`) and every row is rendered with a
+    template holding the already encoded column names, so no dictionary is built per row.
+
+    Parameters:
+        - `names` (list): Column names.
+        - `columns` (list): Values of every column.
+
+    Returns:
+        - list: One JSON string per row, same output as `json.dumps` of the row dictionary.
+    """
+    template = "{" + ", ".join(encode_basestring_ascii(name).replace("%", "%%") + ": %s" for name in names) + "}"
+    return list(map(template.__mod__, zip(*map(encode_column, columns))))
+
+
+def merge_options(merge_config, sources):
+    """
+    Get the merge options from the `merge` block of a service configuration.
+
+    Parameters:
+        - `merge_config` (dict): `merge` configuration block. Keys (all optional): `on` (join
+          columns), `how` (`inner` or `left`), `suffixes` (suffix per source name, pandas
+          `_df<n>` suffixes if missing) and `drop` (columns left out).
+        - `sources` (list): Names of the sources in merge order, main source first.
+
+    Returns:
+        - dict: Keyword arguments for `merge_encoded_rows`/`merge_columns`.
+    """
+    options = {
+        "on": tuple(merge_config.get("on", DEFAULT_JOIN_COLUMNS)),
+        "how": merge_config.get("how", "inner"),
+        "drop": tuple(merge_config.get("drop", ("Id",))),
+    }
+    if merge_config.get("suffixes"):
+        options["suffixes"] = [merge_config["suffixes"].get(source, f"_{source}") for source in sources]
+    return options
@@ -112,3 +112,69 @@ async def save_to_redis(redis, redis_key, data):
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         return False
+
+
+class BatchWriteError(Exception):
+    """
+    Raised when commands of a batched write failed.
+    """
+
+    def __init__(self, name, errors):
+        """
+        Parameters:
+            - `name` (str): What the batch writes, for the error message.
+            - `errors` (list): `(position, exception)` of every failed command, in queue order.
+        """
+        self.name = name
+        self.errors = errors
+        super().__init__(f"{len(errors)} command(s) of {name} failed: "
+                         + "; ".join(f"#{position}: {error}" for position, error in errors))
+
+
+async def write_batch(redis, *queue_functions, atomic=True, name="batch"):
+    """
+    Send the commands queued by every function in a single round trip and check every reply.
+
+    Every function gets the batch (an aioredis MULTI/EXEC or pipeline) and queues its commands
+    on it without awaiting them, e.g. `lambda batch: queue_snapshot(batch, timestamp, rows)`.
+    So a snapshot write, its index updates, expiry and notifications cost one round trip
+    instead of one per command, and a failed command is reported instead of being lost.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `*queue_functions` (function): Functions queueing commands on the batch.
+        - `atomic` (bool): True for MULTI/EXEC (applied all together), False for a plain pipeline.
+        - `name` (str): What the batch writes, for logs and errors.
+
+    Returns:
+        - list: Reply of every command, in queue order.
+
+    Raises:
+        - BatchWriteError: If any command failed, with every failure.
+    """
+    batch = redis.multi_exec() if atomic else redis.pipeline()
+    for queue in queue_functions:
+        queue(batch)
+    return await execute_batch(batch, name)
+
+
+async def execute_batch(batch, name="batch"):
+    """
+    Send the commands queued on a MULTI/EXEC or pipeline in one round trip and check every reply.
+
+    Parameters:
+        - `batch`: aioredis MULTI/EXEC or pipeline with the commands queued.
+        - `name` (str): What the batch writes, for logs and errors.
+
+    Returns:
+        - list: Reply of every command, in queue order.
+
+    Raises:
+        - BatchWriteError: If any command failed, with every failure.
+    """
+    results = await batch.execute(return_exceptions=True)
+    errors = [(position, result) for position, result in enumerate(results) if isinstance(result, Exception)]
+    if errors:
+        raise BatchWriteError(name, errors)
+    logging.debug(f"Wrote {name}: {len(results)} commands in one round trip")
+    return results
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+from common.snapshot_store import read_snapshot_rows, snapshot_exists
+
+DEFAULT_BUILD_DELAY = 15
+
+
+def next_build_time(now, build_delay):
+    """
+    Get the next time the current minute snapshot has to be checked, `build_delay` seconds into a minute.
+
+    Parameters:
+        - `now` (float): Current timestamp.
+        - `build_delay` (int): Seconds into the minute.
+
+    Returns:
+        - tuple: Minute timestamp of the snapshot to check (int) and when to check it (int).
+    """
+    minute = int(now) - int(now) % 60
+    if now > minute + build_delay:
+        minute += 60
+    return minute, minute + build_delay
+
+
+async def refresh_snapshot(redis, single_flight, build, minute):
+    """
+    Build the snapshot of a minute if it is not stored yet, sharing the work with concurrent requests for it.
+
+    Parameters:
+        - `redis`: An initialized connection to a Redis server.
+        - `single_flight` (SingleFlight): Coalesces the builds of the same minute.
+        - `build` (function): Coroutine function building and storing the snapshot of a minute.
+        - `minute` (int): Minute timestamp of the snapshot.
+
+    Returns:
+        - bool: True if the snapshot was built.
+    """
+    if await snapshot_exists(redis, minute):
+        return False
+    logging.info(f"Snapshot {minute} not stored yet, building it ahead of demand")
+    await single_flight.do(minute, lambda: build(minute), lambda: read_snapshot_rows(redis, minute))
+    return True
+
+
+async def run_refresher(redis, single_flight, build, build_delay=DEFAULT_BUILD_DELAY, clock=time.time):
+    """
+    Build the current minute snapshot when the merge service has not stored it `build_delay` seconds
+    into the minute, so requests do not wait for the external fetches. Runs until cancelled.
+
+    Parameters:
+        - `redis`: An initialized connection to a Redis server.
+        - `single_flight` (SingleFlight): Coalesces the builds with the request misses of the same minute.
+        - `build` (function): Coroutine function building and storing the snapshot of a minute.
+        - `build_delay` (int): Seconds into the minute the snapshot is checked.
+        - `clock` (function): Returns the current timestamp.
+    """
+    try:
+        while True:
+            now = clock()
+            minute, build_time = next_build_time(now, build_delay)
+            await asyncio.sleep(build_time - now)
+            try:
+                await refresh_snapshot(redis, single_flight, build, minute)
+            except Exception as e:
+                logging.error(f"Snapshot {minute} refresh failed: {e}")
+    except asyncio.CancelledError:
+        pass
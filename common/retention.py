@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+from common.merge_engine import column_values
+from common.snapshot_codec import encode_snapshot
+from common.snapshot_store import INDEX_KEY, chain_root, delete_snapshots, read_snapshot_rows, snapshot_timestamps
+
+HOUR = 3600
+DAY = 86400
+
+
+def snapshot_table(encoded_rows):
+    """
+    Turn JSON encoded snapshot rows into columns, as taken by `common.snapshot_codec.encode_snapshot`.
+
+    Parameters:
+        - `encoded_rows` (list): JSON encoded rows (bytes or str) in rank order, rank column first.
+
+    Returns:
+        - tuple: Column names (list) and the values of every column (list).
+    """
+    rows = [json.loads(row) for row in encoded_rows]
+    names = list(rows[0]) if rows else []
+    return names, [column_values(rows, name) for name in names]
+
+
+async def retention_boundary(redis, cutoff):
+    """
+    Get the timestamp before which minute snapshots can be removed from Redis.
+
+    It is `cutoff`, moved back to the keyframe of the first snapshot kept if that one is
+    stored as a delta, so no kept snapshot loses its delta chain.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `cutoff` (int): Oldest timestamp of the minute resolution window.
+
+    Returns:
+        - int: The boundary timestamp.
+    """
+    kept = await redis.zrangebyscore(INDEX_KEY, min=cutoff, offset=0, count=1)
+    if not kept:
+        return cutoff
+    return min(cutoff, await chain_root(redis, int(kept[0])))
+
+
+async def roll_up_minutes(redis, history, end):
+    """
+    Move the minute snapshots older than `end` out of Redis, keeping the first one of every hour
+    in the hourly tier of the history store.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `history` (HistoryStore): On-disk store of the downsampled snapshots.
+        - `end` (int): First timestamp kept in Redis.
+
+    Returns:
+        - int: Number of minute snapshots removed from Redis.
+    """
+    timestamps = await snapshot_timestamps(redis, end=end)
+    if not timestamps:
+        return 0
+
+    stored_hours = {timestamp - timestamp % HOUR for timestamp in
+                    await asyncio.to_thread(history.timestamps, "hour", timestamps[0] - timestamps[0] % HOUR, end)}
+    for timestamp in timestamps:
+        hour = timestamp - timestamp % HOUR
+        if hour in stored_hours:
+            continue
+        rows = await read_snapshot_rows(redis, timestamp)
+        if rows:
+            await asyncio.to_thread(history.save, "hour", timestamp, encode_snapshot(*snapshot_table(rows)))
+            stored_hours.add(hour)
+
+    await delete_snapshots(redis, timestamps)
+    return len(timestamps)
+
+
+def roll_up_hours(history, end, day_end=None):
+    """
+    Drop the hourly snapshots older than `end`, keeping the first one of every day in the daily tier.
+
+    Parameters:
+        - `history` (HistoryStore): On-disk store of the downsampled snapshots.
+        - `end` (int): First timestamp kept in the hourly tier.
+        - `day_end` (int, optional): First timestamp kept in the daily tier. Kept forever if None.
+
+    Returns:
+        - int: Number of hourly snapshots removed.
+    """
+    hours = history.timestamps("hour", end=end)
+    if hours:
+        stored_days = {timestamp - timestamp % DAY for timestamp in
+                       history.timestamps("day", hours[0] - hours[0] % DAY, end)}
+        for timestamp in hours:
+            day = timestamp - timestamp % DAY
+            if day not in stored_days:
+                history.save("day", timestamp, history.load("hour", timestamp))
+                stored_days.add(day)
+    removed = history.delete("hour", end)
+    if day_end is not None:
+        history.delete("day", day_end)
+    return removed
+
+
+async def apply_retention(redis, history, retention_config, now):
+    """
+    Apply the retention policy once: minute snapshots in Redis for `minute_window` seconds,
+    hourly ones on disk for `hour_window` seconds, daily ones for `day_window` seconds (forever if missing).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `history` (HistoryStore): On-disk store of the downsampled snapshots.
+        - `retention_config` (dict): `retention` configuration block.
+        - `now` (int): Current timestamp.
+
+    Returns:
+        - tuple: Number of minute and hourly snapshots rolled up.
+    """
+    boundary = await retention_boundary(redis, now - retention_config["minute_window"])
+    minutes = await roll_up_minutes(redis, history, boundary)
+    day_window = retention_config.get("day_window")
+    hours = await asyncio.to_thread(roll_up_hours, history, now - retention_config["hour_window"],
+                                    now - day_window if day_window else None)
+    if minutes or hours:
+        logging.info(f"Retention: {minutes} minute snapshots moved to the hourly tier, "
+                     f"{hours} hourly snapshots moved to the daily tier")
+    return minutes, hours
+
+
+async def run_retention(redis, history, retention_config, clock):
+    """
+    Apply the retention policy every `interval` seconds, until cancelled.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `history` (HistoryStore): On-disk store of the downsampled snapshots.
+        - `retention_config` (dict): `retention` configuration block.
+        - `clock` (function): Returns the current timestamp.
+    """
+    while True:
+        try:
+            await apply_retention(redis, history, retention_config, clock())
+        except Exception as e:
+            logging.error(f"Retention error: {e}")
+        await asyncio.sleep(retention_config.get("interval", 300))
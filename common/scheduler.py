@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+
+DEFAULT_INTERVAL = 60
+# Ticks fired later than this (seconds) are logged as warnings
+LATE_THRESHOLD = 1
+
+
+def next_tick(now, interval=DEFAULT_INTERVAL):
+    """
+    Get the first wall-clock boundary (multiple of `interval` since the epoch) after `now`.
+
+    Parameters:
+        - `now` (float): Current timestamp.
+        - `interval` (int): Seconds between ticks.
+
+    Returns:
+        - int: Timestamp of the next tick.
+    """
+    return (int(now) // interval + 1) * interval
+
+
+class MinuteScheduler:
+    """
+    Asyncio scheduler firing a coroutine function on wall-clock boundaries (every minute by default).
+
+    Every tick is computed from the clock, not from the previous sleep, so it does not drift.
+    The callback of every tick runs in its own task, a slow or failed tick does not delay the
+    next one. Ticks missed while the event loop was blocked or the clock jumped are caught up
+    at once: the latest boundary passed is fired immediately and the older ones are skipped
+    (their data can not be fetched anymore). How late every tick fired is logged and kept in
+    `lateness` (last tick) and `max_lateness`.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, clock=time.time, late_threshold=LATE_THRESHOLD):
+        """
+        Parameters:
+            - `interval` (int): Seconds between ticks.
+            - `clock` (function): Returns the current wall-clock timestamp.
+            - `late_threshold` (float): Seconds after which a late tick is logged as a warning.
+        """
+        self.interval = interval
+        self.clock = clock
+        self.late_threshold = late_threshold
+        self.tasks = set()
+        self.ticks = 0
+        self.missed = 0
+        self.lateness = None
+        self.max_lateness = 0
+
+    async def sleep_until(self, timestamp):
+        """
+        Sleep until the clock reaches `timestamp`, sleeping again if woken up early.
+        """
+        remaining = timestamp - self.clock()
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            remaining = timestamp - self.clock()
+
+    def fire(self, tick, callback):
+        """
+        Start the callback of a tick in a task, recording how late it fired.
+
+        Parameters:
+            - `tick` (int): Timestamp of the tick.
+            - `callback` (function): Coroutine function called with the tick timestamp.
+
+        Returns:
+            - asyncio.Task: The task running the callback.
+        """
+        self.lateness = self.clock() - tick
+        self.max_lateness = max(self.max_lateness, self.lateness)
+        self.ticks += 1
+        log = logging.warning if self.lateness > self.late_threshold else logging.info
+        log(f"Tick {tick} fired {self.lateness * 1000:.1f} ms late")
+
+        task = asyncio.create_task(callback(tick))
+        self.tasks.add(task)
+        task.add_done_callback(self.tick_done)
+        return task
+
+    def tick_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Scheduled tick failed: {task.exception()}")
+
+    async def run(self, callback, first_tick=None):
+        """
+        Fire `callback` on every tick until cancelled. Running tick tasks are cancelled with it.
+
+        Parameters:
+            - `callback` (function): Coroutine function called with the tick timestamp (int).
+            - `first_tick` (int, optional): Timestamp of the first tick. The next boundary if None.
+        """
+        tick = first_tick if first_tick is not None else next_tick(self.clock(), self.interval)
+        try:
+            while True:
+                await self.sleep_until(tick)
+                latest = int(self.clock()) // self.interval * self.interval
+                if latest > tick:
+                    # Woken up after later boundaries: catch up with the latest one only
+                    skipped = (latest - tick) // self.interval
+                    self.missed += skipped
+                    logging.warning(f"Scheduler {self.clock() - tick:.1f} s behind, skipping {skipped} tick(s)")
+                    tick = latest
+                self.fire(tick, callback)
+                tick += self.interval
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
@@ -0,0 +1,133 @@
+from json.encoder import encode_basestring_ascii
+from common.merge_engine import render_rows
+from common.redis_utils import execute_batch
+
+DEFAULT_SYMBOL_COLUMN = "Symbol"
+TIMESTAMP_COLUMN = "Timestamp"
+
+
+def series_key(symbol):
+    """
+    Redis key of the time series of an asset.
+
+    Parameters:
+        - `symbol` (str): Asset symbol.
+
+    Returns:
+        - str: The key, `series:<symbol>`.
+    """
+    return f"series:{symbol}"
+
+
+def series_points(timestamp, names, columns, symbol_column=DEFAULT_SYMBOL_COLUMN, value_columns=None):
+    """
+    Get the time series point of every asset of a snapshot.
+
+    Parameters:
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `names` (list): Column names, rank column first (see `common.merge_engine.merge_columns`).
+        - `columns` (list): Values of every column.
+        - `symbol_column` (str): Column identifying the asset.
+        - `value_columns` (list, optional): Columns kept in the points. Every column but the symbol if None.
+
+    Returns:
+        - tuple: Symbol of every asset (list) and its JSON encoded point (list), e.g.
+          `{"Timestamp": 1706868720, "Rank": 1, "Price USD": 42863.7}`.
+    """
+    symbols = columns[names.index(symbol_column)]
+    if value_columns is None:
+        value_columns = [name for name in names[1:] if name != symbol_column]
+    selected = [names.index(name) for name in value_columns if name in names]
+    point_names = [TIMESTAMP_COLUMN, names[0]] + [names[position] for position in selected]
+    point_columns = [[timestamp] * len(symbols), columns[0]] + [columns[position] for position in selected]
+    return symbols, render_rows(point_names, point_columns)
+
+
+def queue_series(batch, timestamp, names, columns, series_config):
+    """
+    Queue the commands adding the points of a snapshot to the time series (sorted sets scored by timestamp) of its assets.
+
+    Any point already stored for the same minute is replaced, points older than `window`
+    seconds are dropped and series not updated for `window` seconds expire (delisted assets).
+
+    Parameters:
+        - `batch`: MULTI/EXEC or pipeline the commands are queued on (see `common.redis_utils.write_batch`).
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `names` (list): Column names, rank column first.
+        - `columns` (list): Values of every column.
+        - `series_config` (dict): `series` configuration block. Keys (all optional): `symbol_column`,
+          `columns` (value columns kept) and `window` (seconds kept, forever if missing).
+
+    Returns:
+        - int: Number of series updated.
+    """
+    symbols, points = series_points(timestamp, names, columns, series_config.get("symbol_column", DEFAULT_SYMBOL_COLUMN),
+                                    series_config.get("columns"))
+    window = series_config.get("window")
+    for symbol, point in zip(symbols, points):
+        if not isinstance(symbol, str):
+            continue
+        key = series_key(symbol)
+        batch.zremrangebyscore(key, min=timestamp, max=timestamp)
+        batch.zadd(key, timestamp, point)
+        if window:
+            batch.zremrangebyscore(key, max=timestamp - window)
+            batch.expire(key, window)
+    return len(symbols)
+
+
+async def save_series(redis, timestamp, names, columns, series_config):
+    """
+    Add the points of a snapshot to the time series of its assets (see `queue_series`), in a single pipeline.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `names` (list): Column names, rank column first.
+        - `columns` (list): Values of every column.
+        - `series_config` (dict): `series` configuration block.
+
+    Returns:
+        - int: Number of series updated.
+
+    Raises:
+        - BatchWriteError: If any command failed.
+    """
+    pipeline = redis.pipeline()
+    updated = queue_series(pipeline, timestamp, names, columns, series_config)
+    await execute_batch(pipeline, f"time series {timestamp}")
+    return updated
+
+
+async def read_series(redis, symbols, start, end):
+    """
+    Read the points of several assets in a time range, with a single pipeline.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `symbols` (list): Asset symbols.
+        - `start` (int): First timestamp included.
+        - `end` (int): Last timestamp included.
+
+    Returns:
+        - dict: JSON encoded points (bytes) of every symbol, in timestamp order.
+    """
+    pipeline = redis.pipeline()
+    for symbol in symbols:
+        pipeline.zrangebyscore(series_key(symbol), min=start, max=end)
+    return dict(zip(symbols, await pipeline.execute()))
+
+
+def render_series(series):
+    """
+    JSON encode the points of several assets as an object keyed by symbol, without decoding the points.
+
+    Parameters:
+        - `series` (dict): JSON encoded points (bytes or str) of every symbol (see `read_series`).
+
+    Returns:
+        - str: JSON object, e.g. `{"BTC": [{"Timestamp": 1706868720, "Rank": 1, "Price USD": 42863.7}]}`.
+    """
+    return "{" + ", ".join(f"{encode_basestring_ascii(symbol)}: ["
+                           + ", ".join(point.decode() if isinstance(point, bytes) else point for point in points) + "]"
+                           for symbol, points in series.items()) + "}"
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+import uuid
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into a single in-flight execution.
+
+    The first caller for a key starts the work; callers arriving while it is running
+    wait on the same future and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+
+    def _forget(self, key, future):
+        if self.in_flight.get(key) is future:
+            del self.in_flight[key]
+        if not future.cancelled():
+            future.exception()  # Mark as retrieved even if every waiter was cancelled
+
+    async def do(self, key, function, load=None):
+        """
+        Run `function` once for all the concurrent callers using `key`.
+
+        Parameters:
+            - `key`: Identifier of the work (e.g. the snapshot redis key).
+            - `function`: Coroutine function without arguments producing the result.
+            - `load`: Unused here, see `RedisSingleFlight.do`.
+
+        Returns:
+            - The result of `function`.
+        """
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(function())
+            self.in_flight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logging.debug(f"Joining in-flight execution for {key}")
+        # Shielded so a cancelled caller does not cancel the work shared with the others
+        return await asyncio.shield(future)
+
+
+class RedisSingleFlight(SingleFlight):
+    """
+    Single-flight coalescing across processes using a Redis lock.
+
+    Calls are first coalesced in-process. Then one process at a time acquires the lock
+    for the key and runs the work, while the others poll `load` until the result
+    produced by the lock owner is available. A process acquiring the lock checks `load`
+    once more before running the work, the previous owner may have just stored it.
+    """
+
+    def __init__(self, redis, lock_ttl=30, poll_interval=0.1, wait_timeout=30):
+        """
+        Parameters:
+            - `redis`: An initialized connection to a Redis server.
+            - `lock_ttl` (float): Seconds before a lock is released if its owner dies.
+            - `poll_interval` (float): Seconds between checks for the result of the lock owner.
+            - `wait_timeout` (float): Max seconds to wait for another process before running the work anyway.
+        """
+        super().__init__()
+        self.redis = redis
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+
+    async def acquire(self, lock_key, token):
+        return await self.redis.set(lock_key, token, pexpire=int(self.lock_ttl * 1000), exist=self.redis.SET_IF_NOT_EXIST)
+
+    async def release(self, lock_key, token):
+        await self.redis.eval(RELEASE_LOCK_SCRIPT, keys=[lock_key], args=[token])
+
+    async def _do_locked(self, key, function, load):
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            if await self.acquire(lock_key, token):
+                try:
+                    # The previous owner may have stored the result just before releasing the lock
+                    result = await load()
+                    if result is not None:
+                        logging.debug(f"Result for {key} produced by another process")
+                        return result
+                    return await function()
+                finally:
+                    await self.release(lock_key, token)
+
+            # Another process is producing the result, wait for it
+            await asyncio.sleep(self.poll_interval)
+            result = await load()
+            if result is not None:
+                logging.debug(f"Result for {key} produced by another process")
+                return result
+
+        logging.warning(f"Timeout waiting for lock {lock_key}, running without it")
+        return await function()
+
+    async def do(self, key, function, load=None):
+        """
+        Run `function` once for all the concurrent callers using `key`, across processes.
+
+        Parameters:
+            - `key`: Identifier of the work (e.g. the snapshot redis key).
+            - `function`: Coroutine function without arguments producing and storing the result.
+            - `load`: Coroutine function without arguments returning the result stored by
+              another process, or None if it is not available yet.
+
+        Returns:
+            - The result of `function`, or the one loaded with `load`.
+        """
+        if load is None:
+            return await super().do(key, function)
+        return await super().do(key, lambda: self._do_locked(key, function, load))
@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+from array import array
+
+
+def render_json_rows(encoded_rows):
+    """
+    Render JSON encoded rows as a JSON array keeping the byte offset where every row ends.
+
+    Parameters:
+        - `encoded_rows` (list): JSON encoded rows (bytes).
+
+    Returns:
+        - tuple: The JSON payload (bytes) and an array where item `k` is the offset right
+          after the k-th row (item 0 is the offset after the opening bracket).
+    """
+    offsets = array('Q', [1])
+    position = 1
+    for index, encoded_row in enumerate(encoded_rows):
+        position += len(encoded_row) + (2 if index else 0)
+        offsets.append(position)
+    return b"[" + b", ".join(encoded_rows) + b"]", offsets
+
+
+def render_csv_rows(rows):
+    """
+    Render rows as CSV (header from the first row keys) keeping the byte offset where every row ends.
+
+    Parameters:
+        - `rows` (list): List of dictionaries.
+
+    Returns:
+        - tuple: The CSV payload (bytes) and an array where item `k` is the offset right
+          after the k-th row (item 0 is the offset after the header).
+    """
+    header = rows[0].keys() if rows else []
+    csv_buffer = io.StringIO()
+    csv_writer = csv.DictWriter(csv_buffer, fieldnames=header, lineterminator="\n")
+    csv_writer.writeheader()
+    lines = [csv_buffer.getvalue().encode()]
+    for row in rows:
+        csv_buffer.seek(0)
+        csv_buffer.truncate()
+        csv_writer.writerow(row)
+        lines.append(csv_buffer.getvalue().encode())
+
+    offsets = array('Q')
+    position = 0
+    for line in lines:
+        position += len(line)
+        offsets.append(position)
+    return b"".join(lines), offsets
+
+
+def as_bytes(encoded_rows):
+    """
+    Get JSON encoded rows (bytes or str) as bytes.
+    """
+    return [row if isinstance(row, bytes) else row.encode() for row in encoded_rows]
+
+
+async def stream_json_rows(chunks):
+    """
+    Render chunks of JSON encoded rows as a JSON array, one piece per chunk.
+
+    Parameters:
+        - `chunks`: Async iterable of JSON encoded rows (bytes or str) lists.
+
+    Yields:
+        - bytes: The next piece of the JSON array.
+    """
+    separator = b"["
+    async for chunk in chunks:
+        if chunk:
+            yield separator + b", ".join(as_bytes(chunk))
+            separator = b", "
+    yield b"]" if separator == b", " else b"[]"
+
+
+async def stream_ndjson_rows(chunks):
+    """
+    Render chunks of JSON encoded rows as NDJSON (one row per line), one piece per chunk.
+
+    Parameters:
+        - `chunks`: Async iterable of JSON encoded rows (bytes or str) lists.
+
+    Yields:
+        - bytes: The next lines.
+    """
+    async for chunk in chunks:
+        yield b"".join(row + b"\n" for row in as_bytes(chunk))
+
+
+async def stream_csv_rows(chunks):
+    """
+    Render chunks of JSON encoded rows as CSV (header from the first row keys), one piece per chunk.
+
+    Same output as `render_csv_rows` of all the rows.
+
+    Parameters:
+        - `chunks`: Async iterable of JSON encoded rows (bytes or str) lists.
+
+    Yields:
+        - bytes: The next lines, the header included in the first piece.
+    """
+    csv_buffer = io.StringIO()
+    csv_writer = None
+    async for chunk in chunks:
+        rows = [json.loads(row) for row in chunk]
+        if csv_writer is None:
+            csv_writer = csv.DictWriter(csv_buffer, fieldnames=rows[0].keys() if rows else [], lineterminator="\n")
+            csv_writer.writeheader()
+        csv_writer.writerows(rows)
+        yield csv_buffer.getvalue().encode()
+        csv_buffer.seek(0)
+        csv_buffer.truncate()
+
+
+def render_csv_payload(json_body):
+    """
+    Render a JSON array of rows as CSV keeping the row byte offsets (see `render_csv_rows`).
+
+    Module level so it can run in a process pool (see `common.executor`).
+
+    Parameters:
+        - `json_body` (bytes): JSON array of rows.
+
+    Returns:
+        - tuple: The CSV payload (bytes) and the array of row offsets.
+    """
+    return render_csv_rows(json.loads(json_body))
+
+
+class RenderedSnapshot:
+    """
+    Ready-to-send JSON and CSV payloads of an immutable snapshot.
+
+    Both payloads are rendered once; a response for any `limit` is a slice of them at a
+    precomputed row byte offset, so no serialisation happens per request. The JSON payload
+    is joined from the encoded rows as stored, without decoding them; the CSV one is only
+    rendered on the first CSV request (see `render_csv`).
+    """
+
+    def __init__(self, rows, encoded_rows=None, complete=True):
+        """
+        Parameters:
+            - `rows` (list): Snapshot rows (dictionaries) in rank order. Unused if `encoded_rows` is given.
+            - `encoded_rows` (list, optional): The same rows already JSON encoded (bytes).
+            - `complete` (bool): False if `rows` are only the top rows of the snapshot.
+        """
+        if encoded_rows is None:
+            encoded_rows = [json.dumps(row).encode() for row in rows]
+        self.rows_count = len(encoded_rows)
+        self.complete = complete
+        self.json_body, self.json_offsets = render_json_rows(encoded_rows)
+        self.csv_body, self.csv_offsets = None, None
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Build a rendered snapshot from a JSON array of rows.
+
+        Parameters:
+            - `data` (str | bytes): JSON array of rows.
+
+        Returns:
+            - RenderedSnapshot: The rendered snapshot.
+        """
+        return cls(json.loads(data))
+
+    @classmethod
+    def from_encoded_rows(cls, encoded_rows, complete=True):
+        """
+        Build a rendered snapshot from JSON encoded rows, as stored in Redis.
+
+        Parameters:
+            - `encoded_rows` (list): JSON encoded rows (bytes or str) in rank order.
+            - `complete` (bool): False if `encoded_rows` are only the top rows of the snapshot.
+
+        Returns:
+            - RenderedSnapshot: The rendered snapshot.
+        """
+        return cls(None, as_bytes(encoded_rows), complete)
+
+    @property
+    def csv_rendered(self):
+        """
+        True once the CSV payload is rendered.
+        """
+        return self.csv_body is not None
+
+    async def render_csv(self, executor=None):
+        """
+        Render the CSV payload, if not rendered yet.
+
+        Parameters:
+            - `executor` (CpuExecutor, optional): Executor rendering it off the event loop. On the loop if None.
+        """
+        if self.csv_rendered:
+            return
+        if executor is None:
+            csv_body, csv_offsets = render_csv_payload(self.json_body)
+        else:
+            csv_body, csv_offsets = await executor.run(render_csv_payload, self.json_body)
+        self.csv_body, self.csv_offsets = csv_body, csv_offsets
+
+    def covers(self, limit):
+        """
+        Check if the snapshot holds enough rows to serve `limit`.
+
+        Parameters:
+            - `limit` (int): Number of rows requested.
+
+        Returns:
+            - bool: True if the response for `limit` can be served from this snapshot.
+        """
+        return self.complete or limit <= self.rows_count
+
+    @property
+    def size(self):
+        """
+        Approximate memory used by the payloads and offsets, in bytes.
+        """
+        size = len(self.json_body) + len(self.json_offsets) * self.json_offsets.itemsize
+        if self.csv_rendered:
+            size += len(self.csv_body) + len(self.csv_offsets) * self.csv_offsets.itemsize
+        return size
+
+    def json(self, limit):
+        """
+        Get the JSON payload of the first `limit` rows.
+
+        Parameters:
+            - `limit` (int): Number of rows.
+
+        Returns:
+            - bytes: JSON array with the first `limit` rows.
+        """
+        if limit >= self.rows_count:
+            return self.json_body
+        return self.json_body[:self.json_offsets[limit]] + b"]"
+
+    def csv(self, limit):
+        """
+        Get the CSV payload (header included) of the first `limit` rows.
+
+        Parameters:
+            - `limit` (int): Number of rows.
+
+        Returns:
+            - bytes: CSV with the first `limit` rows.
+        """
+        if not self.csv_rendered:
+            self.csv_body, self.csv_offsets = render_csv_payload(self.json_body)
+        if limit >= self.rows_count:
+            return self.csv_body
+        return self.csv_body[:self.csv_offsets[limit]]
@@ -0,0 +1,519 @@
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+MAGIC = b"TCA"
+VERSION = 2
+# Magic, version and length of the JSON schema following it
+HEADER = struct.Struct("<3sBI")
+# Minute timestamp, offset of the first record and number of records of a snapshot
+INDEX_ENTRY = struct.Struct("<qQI")
+DEFAULT_STRING_WIDTH = 32
+DEFAULT_SEGMENT_SECONDS = 86400
+# Nulls: int64 min in int fields, NaN in float fields, a 0xFF byte (never valid UTF-8) in strings
+NULL_INT = -2 ** 63
+MAX_INT = 2 ** 63 - 1
+NULL_STRING = b"\xff"
+# Struct fields of the numeric column types, a mixed int/float column keeps both
+FORMATS = {"int": "q", "float": "d", "number": "qd"}
+# A folder modified this recently may change again with the same mtime (coarse file system clock)
+RACY_MTIME_NS = 2 * 10 ** 9
+
+
+def value_type(value):
+    """
+    Get the archive type of a value: `int` (int64), `float`, `string`, or None for any other (null).
+    """
+    if type(value) is int:
+        return "int" if NULL_INT < value <= MAX_INT else "float"
+    if type(value) is float:
+        return "float"
+    if type(value) is str:
+        return "string"
+    return None
+
+
+def column_type(values):
+    """
+    Get the archive type of a column.
+
+    A column with any number is numeric: `int` if every number is an int64, `float` if none
+    is, `number` if both are mixed. Strings in a numeric column (e.g. a `NOT_AVAILABLE`
+    default) are archived as nulls. A column without numbers is a `string` column.
+
+    Parameters:
+        - `values` (list): Column values.
+
+    Returns:
+        - str: The column type, `int`, `float`, `number` or `string`.
+    """
+    types = set(map(value_type, values))
+    if {"int", "float"} <= types:
+        return "number"
+    if "int" in types:
+        return "int"
+    if "float" in types:
+        return "float"
+    return "string"
+
+
+def widen_type(column_type, other_type):
+    """
+    Get the narrowest column type holding the values of two column types.
+    """
+    if column_type == other_type or other_type == "string":
+        return column_type
+    if column_type == "string":
+        return other_type
+    return "number"
+
+
+def pack_values(values, column_type, string_width):
+    """
+    Convert the values of a column to the struct fields of its type, nulls included.
+
+    Strings longer than `string_width` bytes are truncated (at a character boundary).
+
+    Returns:
+        - list: The values of every field of the column (one field, two for a `number` column).
+    """
+    if column_type == "string":
+        return [[value.encode()[:string_width].decode(errors="ignore").encode() if type(value) is str else NULL_STRING
+                 for value in values]]
+    types = list(map(value_type, values))
+    ints = [value if value_type == "int" else NULL_INT for value, value_type in zip(values, types)]
+    floats = [float(value) if value_type == "float" else math.nan for value, value_type in zip(values, types)]
+    if column_type == "int":
+        return [ints]
+    if column_type == "float":
+        return [floats]
+    return [ints, floats]
+
+
+def unpack_values(fields, column_type):
+    """
+    Convert the struct fields of a column back to the archived values, None for nulls.
+
+    Parameters:
+        - `fields` (list): Values of every field of the column (see `pack_values`).
+        - `column_type` (str): The column type.
+
+    Returns:
+        - list: The column values.
+    """
+    if column_type == "string":
+        return [None if value[:1] == NULL_STRING else value.rstrip(b"\0").decode() for value in fields[0]]
+    if column_type == "int":
+        return [None if value == NULL_INT else value for value in fields[0]]
+    if column_type == "float":
+        return [None if value != value else value for value in fields[0]]
+    return [value if value != NULL_INT else None if float_value != float_value else float_value
+            for value, float_value in zip(*fields)]
+
+
+class IndexTimestamps:
+    """
+    Sequence of the snapshot timestamps of a mapped index file, for `bisect`.
+    """
+
+    def __init__(self, index_map, count):
+        self.index_map = index_map
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        return INDEX_ENTRY.unpack_from(self.index_map, position * INDEX_ENTRY.size)[0]
+
+
+class ArchiveSegment:
+    """
+    Data and index files of the snapshots archived from one minute on, with one schema.
+
+    The data file holds a header with the schema (column names, types and string width)
+    followed by the fixed-width records of every snapshot, in rank order (rank implicit).
+    The index file (`<path>.idx`) holds one fixed-width entry per snapshot, minute
+    timestamp to record offset and count, in ascending timestamp order.
+
+    Records are written before their index entry, so readers in other processes only see
+    complete snapshots.
+    """
+
+    def __init__(self, path, start):
+        """
+        Parameters:
+            - `path` (str): Data file path.
+            - `start` (int): Timestamp of the first snapshot of the segment.
+        """
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.start = start
+        self.data_file = None
+        self.index_file = None
+        self.data_map = None
+        self.index_map = None
+        self.mapped_index_size = 0
+        self.schema = None
+        self.record = None
+        self.fields = None
+
+    def load_schema(self, data):
+        """
+        Read the schema from the header of the data file.
+        """
+        magic, version, length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a snapshot archive")
+        self.schema = json.loads(bytes(data[HEADER.size:HEADER.size + length]))
+        formats = [FORMATS.get(column_type, f"{self.schema['string_width']}s") for column_type in self.schema["types"]]
+        self.record = struct.Struct("<" + "".join(formats))
+        # Position of the first struct field of every column
+        widths = [len(FORMATS.get(column_type, "s")) for column_type in self.schema["types"]]
+        self.fields = [sum(widths[:position]) for position in range(len(widths) + 1)]
+
+    def fits(self, names, types):
+        """
+        Check if the schema holds a snapshot of the given column names and types.
+        """
+        return (self.schema["names"] == list(names) and
+                all(widen_type(column_type, other_type) == column_type
+                    for column_type, other_type in zip(self.schema["types"], types)))
+
+    def refresh(self):
+        """
+        Map the files again if the index grew since they were mapped.
+
+        Returns:
+            - bool: True if there is any snapshot mapped.
+        """
+        try:
+            index_size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return False
+        index_size -= index_size % INDEX_ENTRY.size
+        if index_size != self.mapped_index_size:
+            self.unmap()
+            if index_size:
+                # Index first: the data mapped after it holds every record it points to
+                try:
+                    with open(self.index_path, "rb") as index_file:
+                        self.index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    with open(self.path, "rb") as data_file:
+                        self.data_map = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except FileNotFoundError:
+                    # Removed by the retention
+                    self.unmap()
+                    return False
+                if self.schema is None:
+                    self.load_schema(self.data_map)
+            self.mapped_index_size = index_size
+        return self.mapped_index_size > 0
+
+    def unmap(self):
+        """
+        Release the file mappings.
+        """
+        for mapped in (self.index_map, self.data_map):
+            if mapped is not None:
+                mapped.close()
+        self.index_map = None
+        self.data_map = None
+        self.mapped_index_size = 0
+
+    def find(self, timestamp):
+        """
+        Find the latest snapshot of the segment at or before `timestamp`, None if there is none.
+        """
+        if not self.refresh():
+            return None
+        timestamps = IndexTimestamps(self.index_map, self.mapped_index_size // INDEX_ENTRY.size)
+        position = bisect.bisect_right(timestamps, timestamp) - 1
+        return timestamps[position] if position >= 0 else None
+
+    def read(self, timestamp, limit=None):
+        """
+        Read the top `limit` rows of a snapshot of the segment (see `SnapshotArchive.read`).
+        """
+        if self.find(timestamp) != timestamp:
+            return None
+        timestamps = IndexTimestamps(self.index_map, self.mapped_index_size // INDEX_ENTRY.size)
+        _, offset, count = INDEX_ENTRY.unpack_from(self.index_map,
+                                                   bisect.bisect_left(timestamps, timestamp) * INDEX_ENTRY.size)
+        count = count if limit is None else min(limit, count)
+        with memoryview(self.data_map) as view:
+            records = view[offset:offset + count * self.record.size]
+            fields = list(zip(*self.record.iter_unpack(records))) or [()] * self.fields[-1]
+            records.release()
+
+        columns = [unpack_values(fields[start:end], column_type)
+                   for start, end, column_type in zip(self.fields, self.fields[1:], self.schema["types"])]
+        return self.schema["names"], [range(1, count + 1)] + columns
+
+    def open_for_append(self):
+        """
+        Open the files to append, dropping any record written after the last index entry (interrupted append).
+        """
+        self.data_file = open(self.path, "a+b")
+        self.index_file = open(self.index_path, "a+b")
+        index_size = os.path.getsize(self.index_path)
+        self.index_file.truncate(index_size - index_size % INDEX_ENTRY.size)
+        self.index_file.seek(0, os.SEEK_END)
+
+        self.data_file.seek(0)
+        data = self.data_file.read(HEADER.size)
+        if len(data) == HEADER.size and self.index_file.tell():
+            _, _, length = HEADER.unpack(data)
+            self.load_schema(data + self.data_file.read(length))
+            self.index_file.seek(-INDEX_ENTRY.size, os.SEEK_END)
+            _, offset, count = INDEX_ENTRY.unpack(self.index_file.read(INDEX_ENTRY.size))
+            self.data_file.truncate(offset + count * self.record.size)
+        else:
+            self.data_file.truncate(0)
+
+    def create(self, names, types, string_width):
+        """
+        Create the files of a new segment, writing the schema header.
+        """
+        self.open_for_append()
+        encoded_schema = json.dumps({"names": list(names), "types": types, "string_width": string_width}).encode()
+        header = HEADER.pack(MAGIC, VERSION, len(encoded_schema)) + encoded_schema
+        self.data_file.write(header)
+        self.data_file.flush()
+        self.load_schema(header)
+
+    def last_timestamp(self):
+        """
+        Get the timestamp of the last snapshot of the segment, None if it is empty.
+        """
+        if self.index_file.tell() == 0:
+            return None
+        self.index_file.seek(-INDEX_ENTRY.size, os.SEEK_END)
+        timestamp, _, _ = INDEX_ENTRY.unpack(self.index_file.read(INDEX_ENTRY.size))
+        return timestamp
+
+    def append(self, timestamp, columns):
+        """
+        Append a snapshot fitting the schema of the segment (see `SnapshotArchive.append`).
+        """
+        fields = []
+        for values, column_type in zip(columns[1:], self.schema["types"]):
+            fields.extend(pack_values(values, column_type, self.schema["string_width"]))
+        self.data_file.seek(0, os.SEEK_END)
+        offset = self.data_file.tell()
+        self.data_file.write(b"".join(self.record.pack(*values) for values in zip(*fields)))
+        self.data_file.flush()
+        self.index_file.seek(0, os.SEEK_END)
+        self.index_file.write(INDEX_ENTRY.pack(timestamp, offset, len(columns[0])))
+        self.index_file.flush()
+
+    def close(self):
+        """
+        Release the mappings and close the files.
+        """
+        self.unmap()
+        for opened in (self.data_file, self.index_file):
+            if opened is not None:
+                opened.close()
+        self.data_file = None
+        self.index_file = None
+
+    def remove(self):
+        """
+        Close and delete the files of the segment.
+        """
+        self.close()
+        for path in (self.index_path, self.path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class SnapshotArchive:
+    """
+    Append-only on-disk archive of the merged snapshots, read through `mmap`.
+
+    The archive is a series of segments (`<path>.<first timestamp>` and its `.idx` index,
+    see `ArchiveSegment`). A new segment is started every `segment_seconds`, and when a
+    snapshot does not fit the schema of the current one (other columns, or a float in an
+    int column: its types are widened). When a segment is started, the segments entirely
+    older than `retention` seconds before it are deleted. Reading the top `limit` rows of any
+    minute is a binary search in the segments and in an index, and a slice of the mapped
+    records, without parsing the rest of the files.
+
+    Columns are typed (int64, float64, both for mixed int/float columns, or NUL padded
+    UTF-8 strings of `string_width` bytes) and nullable, so values missing from a source
+    are read back as None instead of rejecting the snapshot. One writer per archive; the
+    methods are blocking and thread safe, run them in a thread from async code.
+    """
+
+    def __init__(self, path, string_width=DEFAULT_STRING_WIDTH, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 retention=None):
+        """
+        Parameters:
+            - `path` (str): Path prefix of the segment files. Their folder is created at the first append.
+            - `string_width` (int): Bytes of the string values, for new segments.
+            - `segment_seconds` (int): Seconds of snapshots of a segment before starting a new one.
+            - `retention` (int, optional): Seconds of snapshots kept before the last segment. Every snapshot if None.
+        """
+        self.path = path
+        self.folder = os.path.dirname(path) or "."
+        self.segment_name = re.compile(re.escape(os.path.basename(path)) + r"\.(\d+)$")
+        self.string_width = string_width
+        self.segment_seconds = segment_seconds
+        self.retention = retention
+        self.starts = []
+        self.listed_mtime = None
+        self.segments = {}
+        self.writer = None
+        # Reads run in threads (see `httpAPI_service.api.api.read_archive_rows`), the mappings are shared
+        self.lock = threading.Lock()
+
+    def list_segments(self):
+        """
+        List the segment files again if the folder changed (or may have changed) since they were listed.
+
+        Returns:
+            - list: Start timestamps of the segments, ascending.
+        """
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime is None or mtime != self.listed_mtime or time.time_ns() - mtime < RACY_MTIME_NS:
+            names = os.listdir(self.folder) if mtime is not None else []
+            self.starts = sorted(int(match.group(1)) for match in map(self.segment_name.match, names) if match)
+            for start in set(self.segments) - set(self.starts):
+                self.segments.pop(start).close()
+            self.listed_mtime = mtime
+        return self.starts
+
+    def segment(self, start):
+        """
+        Get the segment starting at `start`, mapped for reading.
+        """
+        if start not in self.segments:
+            self.segments[start] = ArchiveSegment(f"{self.path}.{start}", start)
+        return self.segments[start]
+
+    def find(self, timestamp, tolerance=0):
+        """
+        Find the latest archived snapshot at or before `timestamp`, at most `tolerance` seconds older.
+
+        Parameters:
+            - `timestamp` (int): Requested minute timestamp.
+            - `tolerance` (int): Max seconds the snapshot may be older than `timestamp`.
+
+        Returns:
+            - int: Timestamp of the snapshot, or None if there is none in range.
+        """
+        with self.lock:
+            starts = self.list_segments()
+            for position in range(bisect.bisect_right(starts, timestamp) - 1, -1, -1):
+                found = self.segment(starts[position]).find(timestamp)
+                if found is not None:
+                    return found if found >= timestamp - tolerance else None
+                if starts[position] <= timestamp - tolerance:
+                    break
+            return None
+
+    def read(self, timestamp, limit=None):
+        """
+        Read the top `limit` rows of an archived snapshot.
+
+        Parameters:
+            - `timestamp` (int): Minute timestamp of the snapshot.
+            - `limit` (int, optional): Number of rows to read. All of them if None.
+
+        Returns:
+            - tuple: Column names (list), rank column first, and the values of every column (list),
+              as returned by `common.merge_engine.merge_columns`, None for null values. None if the
+              snapshot is not archived.
+        """
+        with self.lock:
+            starts = self.list_segments()
+            position = bisect.bisect_right(starts, timestamp) - 1
+            if position < 0:
+                return None
+            return self.segment(starts[position]).read(timestamp, limit)
+
+    def open_for_append(self):
+        """
+        Open the last segment to append, deleting the segments left without snapshots (interrupted start).
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        for start in reversed(self.list_segments()):
+            segment = ArchiveSegment(f"{self.path}.{start}", start)
+            segment.open_for_append()
+            if segment.last_timestamp() is not None:
+                self.writer = segment
+                return
+            segment.remove()
+
+    def start_segment(self, timestamp, names, types):
+        """
+        Start a new segment with the first snapshot at `timestamp`, and apply the retention.
+        """
+        if self.writer is not None:
+            if self.writer.schema["names"] == list(names) and timestamp - self.writer.start < self.segment_seconds:
+                # Snapshot not fitting the schema: widen it so both kinds of snapshots fit
+                types = [widen_type(column_type, other_type)
+                         for column_type, other_type in zip(self.writer.schema["types"], types)]
+            if self.writer.last_timestamp() is None:
+                self.writer.remove()
+            else:
+                self.writer.close()
+        self.writer = ArchiveSegment(f"{self.path}.{timestamp}", timestamp)
+        self.writer.create(names, types, self.string_width)
+
+        if self.retention is not None:
+            starts = [start for start in self.list_segments() if start != timestamp] + [timestamp]
+            for start, next_start in zip(starts, starts[1:]):
+                if next_start <= timestamp - self.retention:
+                    ArchiveSegment(f"{self.path}.{start}", start).remove()
+
+    def append(self, timestamp, names, columns):
+        """
+        Append a snapshot to the archive. Blocking, run it in a thread from async code.
+
+        Parameters:
+            - `timestamp` (int): Minute timestamp of the snapshot, newer than the last archived one.
+            - `names` (list): Column names, rank column first (see `common.merge_engine.merge_columns`).
+            - `columns` (list): Values of every column, the rank column being 1 to the number of rows.
+
+        Returns:
+            - bool: True if appended, False if `timestamp` is not newer than the last archived snapshot.
+        """
+        with self.lock:
+            if self.writer is None:
+                self.open_for_append()
+            last_timestamp = self.writer.last_timestamp() if self.writer is not None else None
+            if last_timestamp is not None and timestamp <= last_timestamp:
+                return False
+
+            types = [column_type(values) for values in columns[1:]]
+            if (self.writer is None or timestamp - self.writer.start >= self.segment_seconds or
+                    not self.writer.fits(names, types)):
+                self.start_segment(timestamp, names, types)
+            self.writer.append(timestamp, columns)
+            return True
+
+    def close(self):
+        """
+        Release the mappings and close the files.
+        """
+        with self.lock:
+            for segment in self.segments.values():
+                segment.close()
+            self.segments = {}
+            self.listed_mtime = None
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+
+class SnapshotCache:
+    """
+    In-process LRU/TTL cache of decoded snapshots keyed by minute timestamp.
+
+    Snapshots are immutable once written, so hot reads can skip the Redis round trip
+    and the JSON decode. The memory budget is accounted with the size of the stored
+    (encoded) payload of every entry; least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600):
+        """
+        Parameters:
+            - `max_bytes` (int): Memory budget, as the sum of the payload sizes of the entries.
+            - `ttl` (float): Seconds an entry is kept since it was stored.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get a cached snapshot.
+
+        Parameters:
+            - `key` (int): Minute timestamp of the snapshot.
+
+        Returns:
+            - The cached snapshot, or None if missing or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at = entry
+        if expires_at < time.monotonic():
+            self.invalidate(key)
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, size):
+        """
+        Store a snapshot, evicting the least recently used ones if over budget.
+
+        Parameters:
+            - `key` (int): Minute timestamp of the snapshot.
+            - `value`: Decoded snapshot.
+            - `size` (int): Size in bytes accounted for the entry.
+        """
+        if size > self.max_bytes:
+            logging.debug(f"Snapshot {key} ({size} bytes) exceeds the cache budget")
+            return
+        self.invalidate(key)
+        self.entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.size += size
+        while self.size > self.max_bytes:
+            evicted_key, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            logging.debug(f"Evicted snapshot {evicted_key} from cache")
+
+    def invalidate(self, key):
+        """
+        Remove a snapshot from the cache, if present.
+
+        Parameters:
+            - `key` (int): Minute timestamp of the snapshot.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+async def listen_for_updates(redis, channel_name, cache, clear=False):
+    """
+    Subscribe to `channel_name` and invalidate the snapshot of every message, until the channel is closed.
+
+    Parameters:
+        - `redis`: An initialized connection to a Redis server.
+        - `channel_name` (str): Pub/Sub channel of the snapshot updates.
+        - `cache` (SnapshotCache): The cache to invalidate.
+        - `clear` (bool): Clear the whole cache once subscribed (updates may have been missed).
+    """
+    channel, = await redis.subscribe(channel_name)
+    if clear:
+        cache.clear()
+        logging.info(f"Subscribed again to {channel_name}, snapshot cache cleared")
+    try:
+        async for message in channel.iter():
+            try:
+                cache.invalidate(int(message))
+                logging.debug(f"Snapshot {int(message)} updated, cache entry invalidated")
+            except ValueError:
+                logging.error(f"Unexpected message in channel {channel_name}: {message}")
+    finally:
+        if not redis.closed:
+            try:
+                await redis.unsubscribe(channel_name)
+            except Exception as e:
+                logging.debug(f"Unsubscribe from {channel_name} failed: {e!r}")
+
+
+async def invalidate_on_publish(redis, channel_name, cache, min_backoff=0.5, max_backoff=30):
+    """
+    Invalidate cached snapshots when a new version of them is published, until cancelled.
+
+    The merge service publishes the key of every snapshot it writes on `channel_name`. When the
+    subscription is lost (connection dropped, channel closed) it is made again, after a backoff
+    doubling from `min_backoff` up to `max_backoff` seconds. Updates published meanwhile are
+    lost, so the whole cache is cleared on every new subscription.
+
+    Parameters:
+        - `redis`: An initialized connection to a Redis server.
+        - `channel_name` (str): Pub/Sub channel of the snapshot updates.
+        - `cache` (SnapshotCache): The cache to invalidate.
+        - `min_backoff` (float): Seconds before subscribing again the first time.
+        - `max_backoff` (float): Max seconds between subscription attempts.
+    """
+    backoff = min_backoff
+    resubscribing = False
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                await listen_for_updates(redis, channel_name, cache, clear=resubscribing)
+                logging.warning(f"Subscription to {channel_name} closed")
+            except Exception as e:
+                logging.error(f"Subscription to {channel_name} lost: {e!r}")
+            if redis.closed:
+                return
+            resubscribing = True
+            # A subscription that lasted starts the backoff over
+            if time.monotonic() - started > max_backoff:
+                backoff = min_backoff
+            logging.info(f"Subscribing again to {channel_name} in {backoff} seconds")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+    except asyncio.CancelledError:
+        pass
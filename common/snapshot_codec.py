@@ -0,0 +1,324 @@
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, zlib is used instead
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # Optional dependency, zlib is used instead
+    lz4_frame = None
+
+MAGIC = b"TCS"
+VERSION = 1
+CODECS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+CODEC_NAMES = {value: name for name, value in CODECS.items()}
+
+# Column kinds
+FLOAT64 = b"d"
+INT64 = b"q"
+DICTIONARY = b"s"
+JSON_VALUES = b"j"
+# Separator of the values of a dictionary column
+SEPARATOR = "\0"
+
+HEADER = struct.Struct("<3sBB")
+COUNTS = struct.Struct("<IH")
+LENGTH16 = struct.Struct("<H")
+LENGTH32 = struct.Struct("<I")
+
+
+def default_compression():
+    """
+    Get the best compression available: zstd, lz4 or zlib, in this order.
+
+    Returns:
+        - str: Compression name.
+    """
+    if zstandard is not None:
+        return "zstd"
+    if lz4_frame is not None:
+        return "lz4"
+    return "zlib"
+
+
+def is_available(compression):
+    """
+    Check if the library of a compression is installed.
+
+    Parameters:
+        - `compression` (str): Compression name.
+
+    Returns:
+        - bool: True if it can be used.
+    """
+    return not (compression == "zstd" and zstandard is None or compression == "lz4" and lz4_frame is None)
+
+
+def compress(body, compression):
+    """
+    Compress the snapshot body with `compression` (see `CODECS`).
+    """
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if compression == "lz4":
+        return lz4_frame.compress(body)
+    if compression == "zlib":
+        return zlib.compress(body, 6)
+    return body
+
+
+def decompress(body, compression):
+    """
+    Decompress the snapshot body compressed with `compression` (see `CODECS`).
+    """
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(body)
+    if compression == "lz4":
+        return lz4_frame.decompress(body)
+    if compression == "zlib":
+        return zlib.decompress(body)
+    return body
+
+
+def to_bytes(values):
+    """
+    Get the bytes of an array, little-endian.
+    """
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_bytes(typecode, data):
+    """
+    Build an array of `typecode` from little-endian bytes.
+    """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def pack_text(text):
+    """
+    Encode a text as UTF-8 prefixed with its length.
+    """
+    data = text.encode()
+    return LENGTH16.pack(len(data)) + data
+
+
+def pack_column(values):
+    """
+    Encode the values of a column with the most compact kind fitting all of them.
+
+    Floats are stored as a float64 array, ints as an int64 array and strings as a
+    dictionary of the distinct values (NUL separated) plus an uint32 index per row. Any
+    other column (None values, mixed types...) is stored as a JSON array.
+
+    Parameters:
+        - `values` (list): Column values.
+
+    Returns:
+        - tuple: Column kind and encoded values (bytes).
+    """
+    types = set(map(type, values))
+    if types == {float}:
+        return FLOAT64, to_bytes(array("d", values))
+    if types == {int}:
+        try:
+            return INT64, to_bytes(array("q", values))
+        except OverflowError:
+            pass
+    if types == {str} and not any(SEPARATOR in value for value in values):
+        # Distinct values in order of first appearance, so the top rows only need the first ones
+        dictionary = list(dict.fromkeys(values))
+        indexes = array("I", map({value: index for index, value in enumerate(dictionary)}.__getitem__, values))
+        encoded_dictionary = SEPARATOR.join(dictionary).encode()
+        return DICTIONARY, LENGTH32.pack(len(encoded_dictionary)) + encoded_dictionary + to_bytes(indexes)
+    return JSON_VALUES, json.dumps(values).encode()
+
+
+def dictionary_indexes(data, limit, start=0):
+    """
+    Decode the indexes `start` to `limit` (excluded) of a dictionary column.
+
+    Parameters:
+        - `data` (memoryview): Encoded values of the column.
+        - `limit` (int): Position after the last index to decode.
+        - `start` (int): Position of the first index to decode.
+
+    Returns:
+        - array: The dictionary index of every value.
+    """
+    (dictionary_length,) = LENGTH32.unpack_from(data)
+    indexes_start = LENGTH32.size + dictionary_length
+    return from_bytes("I", data[indexes_start + start * 4:indexes_start + limit * 4])
+
+
+def unpack_dictionary(data, limit, start=0):
+    """
+    Decode the indexes `start` to `limit` (excluded) of a dictionary column, and the dictionary values they use.
+
+    Parameters:
+        - `data` (memoryview): Encoded values of the column.
+        - `limit` (int): Position after the last index to decode.
+        - `start` (int): Position of the first index to decode.
+
+    Returns:
+        - tuple: Dictionary values (list), up to the highest index decoded, and the indexes (array).
+    """
+    indexes = dictionary_indexes(data, limit, start)
+    if not indexes:
+        return [], indexes
+    needed = max(indexes) + 1
+    (dictionary_length,) = LENGTH32.unpack_from(data)
+    dictionary = str(data[LENGTH32.size:LENGTH32.size + dictionary_length], "utf-8").split(SEPARATOR, needed)[:needed]
+    return dictionary, indexes
+
+
+def unpack_column(kind, data, limit, start=0):
+    """
+    Decode the values `start` to `limit` (excluded) of a column encoded with `pack_column`.
+
+    Parameters:
+        - `kind` (bytes): Column kind.
+        - `data` (memoryview): Encoded values.
+        - `limit` (int): Position after the last value to decode.
+        - `start` (int): Position of the first value to decode.
+
+    Returns:
+        - list: Column values.
+    """
+    if kind == FLOAT64:
+        return from_bytes("d", data[start * 8:limit * 8]).tolist()
+    if kind == INT64:
+        return from_bytes("q", data[start * 8:limit * 8]).tolist()
+    if kind == DICTIONARY:
+        dictionary, indexes = unpack_dictionary(data, limit, start)
+        return list(map(dictionary.__getitem__, indexes))
+    if kind == JSON_VALUES:
+        return json.loads(bytes(data))[start:limit]
+    raise ValueError(f"Unknown snapshot column kind {kind!r}")
+
+
+def encode_snapshot(names, columns, compression=None):
+    """
+    Encode a snapshot in the compact columnar binary format.
+
+    The rank column (first one) is implicit: only its name is stored. Every other column
+    is stored with `pack_column`, and the whole body is compressed.
+
+    Parameters:
+        - `names` (list): Column names, rank column first (see `common.merge_engine.merge_columns`).
+        - `columns` (list): Values of every column, the rank column being 1 to the number of rows.
+        - `compression` (str, optional): `zstd`, `lz4`, `zlib` or `none`. Best available if None.
+
+    Returns:
+        - bytes: The encoded snapshot.
+    """
+    compression = compression or default_compression()
+    if compression not in CODECS:
+        raise ValueError(f"Unsupported snapshot compression '{compression}', expected one of {list(CODECS)}")
+    if not is_available(compression):
+        compression = "zlib"
+
+    parts = [COUNTS.pack(len(columns[0]), len(names) - 1), pack_text(names[0])]
+    for name, values in zip(names[1:], columns[1:]):
+        kind, data = pack_column(values)
+        parts += [pack_text(name), kind, LENGTH32.pack(len(data)), data]
+    return HEADER.pack(MAGIC, VERSION, CODECS[compression]) + compress(b"".join(parts), compression)
+
+
+def snapshot_columns(data):
+    """
+    Decompress a snapshot encoded with `encode_snapshot` and locate its encoded columns.
+
+    Parameters:
+        - `data` (bytes): The encoded snapshot.
+
+    Returns:
+        - tuple: Number of rows (int), column names (list), rank column first, and the kind and
+          encoded values (memoryview) of every column but the rank (list).
+
+    Raises:
+        - ValueError: If `data` is not a binary snapshot or its codec is unknown or not installed.
+    """
+    magic, version, codec = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a binary snapshot")
+    compression = CODEC_NAMES.get(codec)
+    if compression is None:
+        raise ValueError(f"Unknown snapshot codec {codec}, expected one of {list(CODEC_NAMES)}")
+    if not is_available(compression):
+        raise ValueError(f"Snapshot compressed with {compression}, which is not installed")
+    body = memoryview(decompress(bytes(data[HEADER.size:]), compression))
+
+    rows_count, columns_count = COUNTS.unpack_from(body)
+    position = COUNTS.size
+    names = []
+    packed_columns = []
+    for _ in range(columns_count + 1):
+        (length,) = LENGTH16.unpack_from(body, position)
+        position += LENGTH16.size
+        names.append(bytes(body[position:position + length]).decode())
+        position += length
+        if len(names) == 1:
+            continue
+        kind = bytes(body[position:position + 1])
+        (length,) = LENGTH32.unpack_from(body, position + 1)
+        position += 1 + LENGTH32.size
+        packed_columns.append((kind, body[position:position + length]))
+        position += length
+    return rows_count, names, packed_columns
+
+
+def decode_snapshot(data, limit=None):
+    """
+    Decode the top `limit` rows of a snapshot encoded with `encode_snapshot`.
+
+    Parameters:
+        - `data` (bytes): The encoded snapshot.
+        - `limit` (int, optional): Number of rows to decode. All of them if None.
+
+    Returns:
+        - tuple: Column names (list), rank column first, and the values of every column (list).
+    """
+    rows_count, names, packed_columns = snapshot_columns(data)
+    limit = rows_count if limit is None else min(limit, rows_count)
+    return names, [range(1, limit + 1)] + [unpack_column(kind, values, limit) for kind, values in packed_columns]
+
+
+def iter_snapshot_chunks(data, limit=None, chunk_size=1000):
+    """
+    Decode the top `limit` rows of a snapshot encoded with `encode_snapshot`, `chunk_size` rows at a time.
+
+    The snapshot is decompressed once, every chunk only decodes its own rows.
+
+    Parameters:
+        - `data` (bytes): The encoded snapshot.
+        - `limit` (int, optional): Number of rows to decode. All of them if None.
+        - `chunk_size` (int): Rows per chunk.
+
+    Yields:
+        - tuple: Column names (list), rank column first, and the values of every column of the chunk (list).
+    """
+    rows_count, names, packed_columns = snapshot_columns(data)
+    limit = rows_count if limit is None else min(limit, rows_count)
+    # Dictionaries are split once, not per chunk
+    dictionaries = [unpack_dictionary(values, limit)[0] if kind == DICTIONARY else None for kind, values in packed_columns]
+    for start in range(0, limit, chunk_size):
+        stop = min(start + chunk_size, limit)
+        columns = [range(start + 1, stop + 1)]
+        for (kind, values), dictionary in zip(packed_columns, dictionaries):
+            if dictionary is None:
+                columns.append(unpack_column(kind, values, stop, start))
+            else:
+                columns.append(list(map(dictionary.__getitem__, dictionary_indexes(values, stop, start))))
+        yield names, columns
@@ -0,0 +1,239 @@
+import json
+import re
+
+# Merged rows are rendered with the rank first (see `common.merge_engine.merge_encoded_rows`)
+RANK_PREFIX = '{"Rank": '
+DIGITS = "0123456789"
+# Start of an encoded delta up to its first operation (see `encode_delta`)
+DELTA_PREFIX = re.compile(r'\s*\{\s*"base"\s*:\s*(\d+)\s*,\s*"ops"\s*:\s*\[')
+WHITESPACE = re.compile(r'\s*')
+DECODER = json.JSONDecoder()
+
+
+def row_body(encoded_row):
+    """
+    Get the part of a JSON encoded row after its rank, the same for a row at any rank.
+
+    Parameters:
+        - `encoded_row` (str): JSON encoded row starting with the rank column.
+
+    Returns:
+        - str: The row without the rank prefix, e.g. `, "Symbol": "BTC"}`.
+    """
+    return encoded_row[len(RANK_PREFIX):].lstrip(DIGITS)
+
+
+def compute_delta(base_rows, rows):
+    """
+    Compute the delta turning the rows of a snapshot into the rows of the next one.
+
+    Rows are compared without their rank, so an insert or a delete only costs the rows
+    changed and not a rank update of every row below. The delta is a list of operations:
+    `[start, count]` copies `count` rows of the base snapshot from `start`, a string is a
+    new or changed row (without rank). Ranks are renumbered when the delta is applied.
+
+    Parameters:
+        - `base_rows` (list): JSON encoded rows (str) of the base snapshot, in rank order.
+        - `rows` (list): JSON encoded rows (str) of the new snapshot, in rank order.
+
+    Returns:
+        - list: The delta operations.
+    """
+    positions = {}
+    for position, body in enumerate(map(row_body, base_rows)):
+        positions.setdefault(body, position)
+
+    operations = []
+    run = None
+    for body in map(row_body, rows):
+        position = positions.get(body)
+        if position is None:
+            run = None
+            operations.append(body)
+        elif run is not None and run[0] + run[1] == position:
+            run[1] += 1
+        else:
+            run = [position, 1]
+            operations.append(run)
+    return operations
+
+
+def apply_deltas(base_rows, chain):
+    """
+    Rebuild the rows of a snapshot from the rows of a keyframe and the chain of deltas after it.
+
+    Deltas are applied on the rows without rank, ranks are rendered once at the end.
+
+    Parameters:
+        - `base_rows` (list): JSON encoded rows (str or bytes) of the keyframe, in rank order.
+        - `chain` (list): Delta operations (see `compute_delta`) of every delta, oldest first.
+
+    Returns:
+        - list: JSON encoded rows (str) of the snapshot, in rank order.
+    """
+    bodies = [row_body(row.decode() if isinstance(row, bytes) else row) for row in base_rows]
+    for operations in chain:
+        rows = []
+        for operation in operations:
+            if isinstance(operation, str):
+                rows.append(operation)
+            else:
+                start, count = operation
+                rows.extend(bodies[start:start + count])
+        bodies = rows
+    return [f"{RANK_PREFIX}{rank}{body}" for rank, body in enumerate(bodies, start=1)]
+
+
+def apply_delta(base_rows, operations):
+    """
+    Rebuild the rows of a snapshot from the rows of its base snapshot and a delta.
+
+    Parameters:
+        - `base_rows` (list): JSON encoded rows (str or bytes) of the base snapshot, in rank order.
+        - `operations` (list): Delta operations (see `compute_delta`).
+
+    Returns:
+        - list: JSON encoded rows (str) of the snapshot, in rank order.
+    """
+    return apply_deltas(base_rows, [operations])
+
+
+def truncate_delta(operations, limit):
+    """
+    Keep the operations of a delta producing the top `limit` rows of its snapshot.
+
+    Applied to the top rows of the base snapshot they copy from, they rebuild the top
+    `limit` rows of the snapshot without the rest of the base.
+
+    Parameters:
+        - `operations` (list): Delta operations (see `compute_delta`).
+        - `limit` (int): Number of top rows of the snapshot.
+
+    Returns:
+        - tuple: The operations (list) and the number of top rows of the base snapshot they copy from (int).
+    """
+    truncated = []
+    base_limit = 0
+    for operation in operations:
+        if limit <= 0:
+            break
+        if isinstance(operation, str):
+            truncated.append(operation)
+            limit -= 1
+        else:
+            start, count = operation
+            count = min(count, limit)
+            truncated.append([start, count])
+            base_limit = max(base_limit, start + count)
+            limit -= count
+    return truncated, base_limit
+
+
+def encode_delta(base_timestamp, operations):
+    """
+    Encode a delta as stored in Redis.
+
+    Parameters:
+        - `base_timestamp` (int): Minute timestamp of the base snapshot.
+        - `operations` (list): Delta operations (see `compute_delta`).
+
+    Returns:
+        - str: JSON object with the `base` timestamp and the `ops`.
+    """
+    return json.dumps({"base": base_timestamp, "ops": operations}, separators=(",", ":"))
+
+
+def decode_delta(data, limit=None):
+    """
+    Decode a delta stored in Redis.
+
+    With a `limit`, operations are decoded one at a time and only until they produce the top
+    `limit` rows of the snapshot, the rest of the delta is not parsed. The last operation
+    may produce more rows (see `truncate_delta`).
+
+    Parameters:
+        - `data` (str | bytes): Encoded delta (see `encode_delta`).
+        - `limit` (int, optional): Number of top rows of the snapshot. Every operation if None.
+
+    Returns:
+        - tuple: Base snapshot timestamp (int) and delta operations (list).
+    """
+    if isinstance(data, bytes):
+        data = data.decode()
+    match = DELTA_PREFIX.match(data) if limit is not None else None
+    if match is None:
+        delta = json.loads(data)
+        return delta["base"], delta["ops"]
+
+    operations = []
+    position = WHITESPACE.match(data, match.end()).end()
+    while limit > 0 and data[position] != "]":
+        operation, position = DECODER.raw_decode(data, position)
+        operations.append(operation)
+        limit -= 1 if isinstance(operation, str) else operation[1]
+        position = WHITESPACE.match(data, position).end()
+        if data[position] == ",":
+            position = WHITESPACE.match(data, position + 1).end()
+    return int(match.group(1)), operations
+
+
+class DeltaWriter:
+    """
+    Decide if every new snapshot is stored as a full keyframe or as a delta of the previous one.
+
+    A keyframe is stored every `keyframe_interval` snapshots, so rebuilding a snapshot
+    takes at most `keyframe_interval - 1` deltas, and whenever the delta would not be
+    smaller than `max_delta_ratio` times the full snapshot.
+    """
+
+    def __init__(self, keyframe_interval=15, max_delta_ratio=0.5):
+        """
+        Parameters:
+            - `keyframe_interval` (int): Max snapshots between two keyframes. 1 stores only keyframes.
+            - `max_delta_ratio` (float): Max size of a delta relative to the full snapshot.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.max_delta_ratio = max_delta_ratio
+        self.base_timestamp = None
+        self.base_rows = None
+        self.chain_length = 0
+
+    def encode(self, timestamp, rows):
+        """
+        Get the delta to store for a new snapshot, if any.
+
+        Parameters:
+            - `timestamp` (int): Minute timestamp of the new snapshot.
+            - `rows` (list): JSON encoded rows (str) of the new snapshot, in rank order.
+
+        Returns:
+            - str: Encoded delta against the previous snapshot, or None to store a keyframe.
+        """
+        if (self.base_rows is None or self.base_timestamp >= timestamp or
+                self.chain_length + 1 >= self.keyframe_interval):
+            return None
+        delta = encode_delta(self.base_timestamp, compute_delta(self.base_rows, rows))
+        if len(delta) > self.max_delta_ratio * sum(map(len, rows)):
+            return None
+        return delta
+
+    def stored(self, timestamp, rows, is_delta):
+        """
+        Record the snapshot stored as base of the next delta.
+
+        Parameters:
+            - `timestamp` (int): Minute timestamp of the snapshot.
+            - `rows` (list): JSON encoded rows (str) of the snapshot, in rank order.
+            - `is_delta` (bool): True if it was stored as a delta.
+        """
+        self.chain_length = self.chain_length + 1 if is_delta else 0
+        self.base_timestamp = timestamp
+        self.base_rows = rows
+
+    def reset(self):
+        """
+        Forget the base snapshot, e.g. after a failed write, so the next snapshot is a keyframe.
+        """
+        self.base_timestamp = None
+        self.base_rows = None
+        self.chain_length = 0
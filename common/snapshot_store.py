@@ -0,0 +1,611 @@
+import asyncio
+import json
+import logging
+import aioredis
+from redis import RedisError
+from common.redis_utils import BatchWriteError, write_batch
+from common.merge_engine import render_rows
+from common.snapshot_codec import decode_snapshot, iter_snapshot_chunks
+from common.snapshot_delta import apply_delta, apply_deltas, decode_delta, truncate_delta
+
+# Sorted set of the available snapshot timestamps (score and member are the timestamp)
+INDEX_KEY = "snapshots:index"
+# Minutes of delta keys read per MGET when walking back a delta chain, a whole chain with the default keyframe interval
+DELTA_CHAIN_WINDOW = 16
+
+
+def rows_key(timestamp):
+    """
+    Redis key of the row list of a snapshot.
+
+    Parameters:
+        - `timestamp` (int): Minute timestamp of the snapshot.
+
+    Returns:
+        - str: The key, `<timestamp>:rows`.
+    """
+    return f"{timestamp}:rows"
+
+
+def delta_key(timestamp):
+    """
+    Redis key of the delta of a snapshot stored as a delta of a previous one.
+
+    Parameters:
+        - `timestamp` (int): Minute timestamp of the snapshot.
+
+    Returns:
+        - str: The key, `<timestamp>:delta`.
+    """
+    return f"{timestamp}:delta"
+
+
+def binary_key(timestamp):
+    """
+    Redis key of a snapshot stored in the binary columnar format.
+
+    Parameters:
+        - `timestamp` (int): Minute timestamp of the snapshot.
+
+    Returns:
+        - str: The key, `<timestamp>:bin`.
+    """
+    return f"{timestamp}:bin"
+
+
+def encode_rows(rows):
+    """
+    Encode every row of a snapshot as a JSON string.
+
+    Parameters:
+        - `rows` (list): Snapshot rows (dictionaries) in rank order.
+
+    Returns:
+        - list: One JSON string per row.
+    """
+    return [json.dumps(row) for row in rows]
+
+
+def queue_index(batch, timestamp, key, ttl=None):
+    """
+    Queue the snapshot index update of a saved snapshot and its expiry.
+
+    Parameters:
+        - `batch`: MULTI/EXEC or pipeline the commands are queued on (see `common.redis_utils.write_batch`).
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `key` (str): Key of the snapshot.
+        - `ttl` (int, optional): Seconds the snapshot is kept. Index entries older than `ttl` are
+          removed with it. Kept until deleted if None.
+    """
+    batch.zadd(INDEX_KEY, timestamp, timestamp)
+    if ttl:
+        batch.expire(key, ttl)
+        batch.zremrangebyscore(INDEX_KEY, max=timestamp - ttl)
+
+
+def queue_snapshot(batch, timestamp, encoded_rows, ttl=None):
+    """
+    Queue the commands saving a snapshot as a Redis list with one JSON encoded row per item, in rank order.
+
+    Any previous version of the snapshot (full or delta) is replaced and the timestamp is added to the
+    snapshot index.
+
+    Parameters:
+        - `batch`: MULTI/EXEC or pipeline the commands are queued on.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `encoded_rows` (list): JSON encoded snapshot rows in rank order (see `encode_rows`).
+        - `ttl` (int, optional): Seconds the snapshot is kept (see `queue_index`).
+    """
+    key = rows_key(timestamp)
+    batch.delete(key, delta_key(timestamp), binary_key(timestamp))
+    if encoded_rows:
+        batch.rpush(key, *encoded_rows)
+        queue_index(batch, timestamp, key, ttl)
+
+
+def queue_snapshot_value(batch, timestamp, key, value, ttl=None):
+    """
+    Queue the commands saving a snapshot stored as a single string value, replacing any other version of it.
+
+    Parameters:
+        - `batch`: MULTI/EXEC or pipeline the commands are queued on.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `key` (str): Key of the value, `delta_key` or `binary_key` of the timestamp.
+        - `value` (str | bytes): Value to store.
+        - `ttl` (int, optional): Seconds the snapshot is kept (see `queue_index`).
+    """
+    batch.delete(*[other_key for other_key in (rows_key(timestamp), delta_key(timestamp), binary_key(timestamp))
+                   if other_key != key])
+    batch.set(key, value)
+    queue_index(batch, timestamp, key, ttl)
+
+
+async def save_batch(redis, name, *queue_functions):
+    """
+    Write a snapshot and its index updates atomically, in one round trip (see `common.redis_utils.write_batch`).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `name` (str): What is written, for the logs.
+        - `*queue_functions` (function): Functions queueing the commands.
+
+    Returns:
+        - bool: True if every command succeeded, False otherwise.
+    """
+    try:
+        await write_batch(redis, *queue_functions, name=name)
+        logging.info(f"Successfully saved {name} in Redis.")
+        return True
+    except (RedisError, aioredis.RedisError, BatchWriteError) as e:
+        logging.error(f"Error saving {name} in Redis: {e}")
+        return False
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return False
+
+
+async def save_snapshot(redis, timestamp, encoded_rows, ttl=None):
+    """
+    Save a snapshot as a Redis list with one JSON encoded row per item, in rank order.
+
+    Any previous version of the snapshot (full or delta) is replaced and the timestamp is
+    added to the snapshot index atomically (MULTI/EXEC).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `encoded_rows` (list): JSON encoded snapshot rows in rank order (see `encode_rows`).
+        - `ttl` (int, optional): Seconds the snapshot is kept (see `queue_index`).
+
+    Returns:
+        - bool: True if the snapshot is successfully saved, False otherwise.
+    """
+    return await save_batch(redis, f'snapshot "{rows_key(timestamp)}" ({len(encoded_rows)} rows)',
+                            lambda batch: queue_snapshot(batch, timestamp, encoded_rows, ttl))
+
+
+async def save_snapshot_value(redis, timestamp, key, value, ttl=None):
+    """
+    Save a snapshot stored as a single string value, replacing any other version of it.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `key` (str): Key of the value, `delta_key` or `binary_key` of the timestamp.
+        - `value` (str | bytes): Value to store.
+        - `ttl` (int, optional): Seconds the snapshot is kept (see `queue_index`).
+
+    Returns:
+        - bool: True if the snapshot is successfully saved, False otherwise.
+    """
+    return await save_batch(redis, f'snapshot "{key}" ({len(value)} bytes)',
+                            lambda batch: queue_snapshot_value(batch, timestamp, key, value, ttl))
+
+
+async def save_snapshot_delta(redis, timestamp, delta, ttl=None):
+    """
+    Save a snapshot as a delta of a previous snapshot (see `common.snapshot_delta`).
+
+    Any previous version of the snapshot is replaced and the timestamp is added to the
+    snapshot index atomically (MULTI/EXEC).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `delta` (str): Encoded delta (see `common.snapshot_delta.encode_delta`).
+        - `ttl` (int, optional): Seconds the snapshot is kept (see `queue_index`).
+
+    Returns:
+        - bool: True if the snapshot is successfully saved, False otherwise.
+    """
+    return await save_snapshot_value(redis, timestamp, delta_key(timestamp), delta, ttl)
+
+
+async def save_snapshot_binary(redis, timestamp, data, ttl=None):
+    """
+    Save a snapshot in the binary columnar format (see `common.snapshot_codec`).
+
+    Any previous version of the snapshot is replaced and the timestamp is added to the
+    snapshot index atomically (MULTI/EXEC).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `data` (bytes): Encoded snapshot (see `common.snapshot_codec.encode_snapshot`).
+        - `ttl` (int, optional): Seconds the snapshot is kept (see `queue_index`).
+
+    Returns:
+        - bool: True if the snapshot is successfully saved, False otherwise.
+    """
+    return await save_snapshot_value(redis, timestamp, binary_key(timestamp), data, ttl)
+
+
+async def read_full_rows(redis, timestamp, limit=None):
+    """
+    Read the top `limit` rows of a snapshot stored in full, as a row list or in the binary format.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `limit` (int, optional): Number of rows to read. All of them if None.
+
+    Returns:
+        - list: JSON encoded rows (bytes or str) in rank order, or None if there is no full snapshot.
+    """
+    stop = -1 if limit is None else limit - 1
+    rows = await redis.lrange(rows_key(timestamp), 0, stop)
+    if rows:
+        return rows
+
+    data = await redis.get(binary_key(timestamp))
+    if data is None:
+        return None
+    return render_rows(*decode_snapshot(data, limit))
+
+
+async def read_delta_chain(redis, timestamp, limit=None, window=DELTA_CHAIN_WINDOW):
+    """
+    Read the delta chain of a snapshot back to its keyframe.
+
+    Deltas are based on the previous snapshot, usually the previous minute, so the delta keys
+    of `window` consecutive minutes are read with one MGET: a chain shorter than `window`
+    takes a single round trip. Longer chains or gaps take one more MGET per window.
+
+    With a `limit`, every delta is only decoded up to the operations producing the top rows
+    of its snapshot the next one copies from (see `common.snapshot_delta.truncate_delta`).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `limit` (int, optional): Number of top rows of the snapshot needed. All of them if None.
+        - `window` (int): Minutes of delta keys read per MGET.
+
+    Returns:
+        - tuple: Timestamp of the keyframe (int), the delta operations of the chain (list, oldest
+          first, empty if the snapshot is not a delta) and the number of top rows of the keyframe
+          they copy from (int, None without `limit`). None if a delta does not point to an older snapshot.
+    """
+    chain = []
+    current = timestamp
+    while True:
+        keys = [current - 60 * position for position in range(window)]
+        deltas = dict(zip(keys, await redis.mget(*[delta_key(key) for key in keys])))
+        # Follow the chain while its snapshots are in the window, then read the window before the last base
+        while current in deltas:
+            data = deltas[current]
+            if data is None:
+                return current, chain[::-1], limit
+            base_timestamp, operations = decode_delta(data, limit)
+            if base_timestamp >= current:
+                # Deltas always point to an older snapshot, anything else would loop
+                return None
+            if limit is not None:
+                operations, limit = truncate_delta(operations, limit)
+            chain.append(operations)
+            current = base_timestamp
+
+
+async def read_delta_rows(redis, timestamp, limit=None):
+    """
+    Rebuild the top `limit` rows of a snapshot stored as a delta, from the keyframe of its delta chain.
+
+    Only the operations producing the top `limit` rows of every snapshot of the chain are
+    decoded and applied, to the top rows of the keyframe they copy from (usually about
+    `limit`), so a small `limit` neither reads nor decodes the whole keyframe and deltas.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `limit` (int, optional): Number of rows to rebuild. All of them if None.
+
+    Returns:
+        - list: JSON encoded rows (str) in rank order, or None if the snapshot is not stored as a
+          delta or its chain is broken.
+    """
+    found = await read_delta_chain(redis, timestamp, limit)
+    if found is None:
+        logging.error(f"Snapshot {timestamp} delta chain is broken")
+        return None
+    base_timestamp, chain, base_limit = found
+    if not chain:
+        return None
+
+    # At least one row, so a missing keyframe is still detected
+    base_rows = await read_full_rows(redis, base_timestamp, None if base_limit is None else max(base_limit, 1))
+    if base_rows is None:
+        logging.error(f"Snapshot {timestamp} delta chain is broken at {base_timestamp}")
+        return None
+
+    rows = apply_deltas(base_rows, chain)
+    logging.debug(f"Snapshot {timestamp} rebuilt from {len(chain)} deltas")
+    return rows[:limit]
+
+
+async def read_snapshot_rows(redis, timestamp, limit=None):
+    """
+    Read the top `limit` rows of a snapshot with a single range command.
+
+    Snapshots in the binary format are decoded up to `limit`. Snapshots stored as deltas
+    are rebuilt up to `limit` from the top rows of their keyframe (see `read_delta_rows`),
+    and snapshots still stored in the legacy layout (one JSON string under the bare
+    timestamp key) are read as a whole and sliced.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `limit` (int, optional): Number of rows to read. All of them if None.
+
+    Returns:
+        - list: JSON encoded rows (bytes or str) in rank order, or None if the snapshot does not exist.
+    """
+    rows = await read_full_rows(redis, timestamp, limit)
+    if rows is not None:
+        return rows
+
+    rows = await read_delta_rows(redis, timestamp, limit)
+    if rows is not None:
+        return rows
+
+    return await read_legacy_rows(redis, timestamp, limit)
+
+
+async def read_legacy_rows(redis, timestamp, limit=None):
+    """
+    Read the top `limit` rows of a snapshot stored in the legacy layout (one JSON string under the bare timestamp key).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `limit` (int, optional): Number of rows to read. All of them if None.
+
+    Returns:
+        - list: JSON encoded rows (str) in rank order, or None if there is no legacy snapshot.
+    """
+    legacy_data = await redis.get(timestamp)
+    if legacy_data is None:
+        return None
+    logging.debug(f"Snapshot {timestamp} found in legacy layout")
+    return encode_rows(json.loads(legacy_data)[:limit])
+
+
+async def iter_rows_chunks(rows, chunk_size):
+    """
+    Yield rows already in memory `chunk_size` at a time, as `iter_snapshot_rows` does.
+
+    Parameters:
+        - `rows` (list): JSON encoded rows.
+        - `chunk_size` (int): Rows per chunk.
+
+    Yields:
+        - list: JSON encoded rows of the chunk.
+    """
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+async def iter_snapshot_rows(redis, timestamp, limit=None, chunk_size=500):
+    """
+    Read the top `limit` rows of a snapshot `chunk_size` rows at a time.
+
+    Row lists are read with an `LRANGE` per chunk and binary snapshots are decoded chunk by
+    chunk, so only one chunk of rows is in memory at a time. Delta snapshots are rebuilt up
+    to `limit` and legacy snapshots read whole (see `read_snapshot_rows`), then yielded in chunks.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `limit` (int, optional): Number of rows to read. All of them if None.
+        - `chunk_size` (int): Rows per chunk.
+
+    Yields:
+        - list: JSON encoded rows (bytes or str) of the chunk, in rank order. Nothing if the snapshot does not exist.
+    """
+    key = rows_key(timestamp)
+    start = 0
+    while limit is None or start < limit:
+        count = chunk_size if limit is None else min(chunk_size, limit - start)
+        rows = await redis.lrange(key, start, start + count - 1)
+        if rows:
+            yield rows
+        start += len(rows)
+        if len(rows) < count:
+            break
+    if start:
+        return
+
+    data = await redis.get(binary_key(timestamp))
+    if data is not None:
+        for names, columns in iter_snapshot_chunks(data, limit, chunk_size):
+            yield render_rows(names, columns)
+        return
+
+    rows = await read_delta_rows(redis, timestamp, limit)
+    if rows is None:
+        rows = await read_legacy_rows(redis, timestamp, limit)
+    if rows is not None:
+        async for chunk in iter_rows_chunks(rows, chunk_size):
+            yield chunk
+
+
+async def find_snapshot(redis, timestamp, tolerance=0):
+    """
+    Find the latest snapshot at or before `timestamp` in the snapshot index (O(log n)).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Requested minute timestamp.
+        - `tolerance` (int): Max seconds the snapshot found may be older than `timestamp`.
+
+    Returns:
+        - int: Timestamp of the snapshot found, or None if there is none within the tolerance.
+    """
+    result = await redis.zrevrangebyscore(INDEX_KEY, max=timestamp, min=timestamp - tolerance, offset=0, count=1)
+    return int(result[0]) if result else None
+
+
+async def snapshot_exists(redis, timestamp):
+    """
+    Check if a snapshot is stored, in any layout but the legacy one, from the snapshot index.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+
+    Returns:
+        - bool: True if the snapshot is in the index.
+    """
+    return await redis.zscore(INDEX_KEY, timestamp) is not None
+
+
+async def find_snapshots(redis, timestamps, tolerance=0):
+    """
+    Find the latest snapshot at or before every timestamp, with a single pipeline (see `find_snapshot`).
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamps` (list): Requested minute timestamps.
+        - `tolerance` (int): Max seconds a snapshot found may be older than its requested timestamp.
+
+    Returns:
+        - list: Timestamp of the snapshot found for every requested timestamp, None if there is none.
+    """
+    pipeline = redis.pipeline()
+    for timestamp in timestamps:
+        pipeline.zrevrangebyscore(INDEX_KEY, max=timestamp, min=timestamp - tolerance, offset=0, count=1)
+    return [int(result[0]) if result else None for result in await pipeline.execute()]
+
+
+async def rebuild_rows(redis, timestamp, deltas, rebuilt):
+    """
+    Get all the rows of a snapshot, rebuilding it from its delta chain if it is a delta.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+        - `deltas` (dict): Encoded deltas already read, by timestamp.
+        - `rebuilt` (dict): Rows of the snapshots already rebuilt, by timestamp. Updated in place.
+
+    Returns:
+        - list: JSON encoded rows (bytes or str) in rank order, or None if the snapshot is not stored in full
+          or as a delta, or its chain is broken.
+    """
+    if timestamp in rebuilt:
+        return rebuilt[timestamp]
+    data = deltas[timestamp] if timestamp in deltas else await redis.get(delta_key(timestamp))
+    if data is None:
+        rows = await read_full_rows(redis, timestamp)
+    else:
+        base_timestamp, operations = decode_delta(data)
+        # Deltas always point to an older snapshot, anything else would loop
+        base_rows = await rebuild_rows(redis, base_timestamp, deltas, rebuilt) if base_timestamp < timestamp else None
+        rows = apply_delta(base_rows, operations) if base_rows is not None else None
+    rebuilt[timestamp] = rows
+    return rows
+
+
+async def read_snapshots_rows(redis, timestamps, limit=None):
+    """
+    Read the top `limit` rows of several snapshots.
+
+    Row lists, binary snapshots and deltas of every timestamp are read with a single
+    pipeline (LRANGE per snapshot and MGET). Deltas are then rebuilt in timestamp order,
+    each one from the previous snapshot when it is its base, so a run of consecutive
+    minutes applies every delta once. Legacy snapshots are read one by one.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamps` (list): Minute timestamps of the snapshots.
+        - `limit` (int, optional): Number of rows to read. All of them if None.
+
+    Returns:
+        - dict: JSON encoded rows (bytes or str) in rank order of every timestamp, None if the snapshot does not exist.
+    """
+    if not timestamps:
+        return {}
+    stop = -1 if limit is None else limit - 1
+    pipeline = redis.pipeline()
+    for timestamp in timestamps:
+        pipeline.lrange(rows_key(timestamp), 0, stop)
+    pipeline.mget(*[binary_key(timestamp) for timestamp in timestamps])
+    pipeline.mget(*[delta_key(timestamp) for timestamp in timestamps])
+    *row_lists, binaries, deltas = await pipeline.execute()
+
+    snapshots = {}
+    delta_data = {}
+    others = []
+    for timestamp, rows, data, delta in zip(timestamps, row_lists, binaries, deltas):
+        if rows:
+            snapshots[timestamp] = rows
+        elif data is not None:
+            snapshots[timestamp] = render_rows(*decode_snapshot(data, limit))
+        elif delta is not None:
+            delta_data[timestamp] = delta
+        else:
+            others.append(timestamp)
+
+    rebuilt = {}
+    for timestamp in sorted(delta_data):
+        rows = await rebuild_rows(redis, timestamp, delta_data, rebuilt)
+        # Only the last snapshot is kept, the base of the next minute
+        rebuilt = {timestamp: rows}
+        snapshots[timestamp] = rows[:limit] if rows is not None else None
+
+    for timestamp, rows in zip(others, await asyncio.gather(*[read_snapshot_rows(redis, timestamp, limit)
+                                                                for timestamp in others])):
+        snapshots[timestamp] = rows
+    return snapshots
+
+
+async def snapshot_timestamps(redis, start=0, end=None):
+    """
+    Get the timestamps of the stored snapshots in `[start, end)`, from the snapshot index.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `start` (int): First timestamp included.
+        - `end` (int, optional): First timestamp excluded. No upper bound if None.
+
+    Returns:
+        - list: Snapshot timestamps (int) in ascending order.
+    """
+    result = await redis.zrangebyscore(INDEX_KEY, min=start, max=float("inf") if end is None else end - 1)
+    return [int(timestamp) for timestamp in result]
+
+
+async def chain_root(redis, timestamp):
+    """
+    Get the full snapshot (keyframe) a snapshot stored as a delta is rebuilt from.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamp` (int): Minute timestamp of the snapshot.
+
+    Returns:
+        - int: Timestamp of the keyframe, `timestamp` itself if the snapshot is not a delta.
+    """
+    data = await redis.get(delta_key(timestamp))
+    while data is not None:
+        base_timestamp, _ = decode_delta(data)
+        if base_timestamp >= timestamp:
+            break
+        timestamp = base_timestamp
+        data = await redis.get(delta_key(timestamp))
+    return timestamp
+
+
+async def delete_snapshots(redis, timestamps, batch_size=500):
+    """
+    Delete snapshots in any layout and remove them from the snapshot index.
+
+    Parameters:
+        - `redis`: The Redis connection pool or client.
+        - `timestamps` (list): Minute timestamps of the snapshots.
+        - `batch_size` (int): Snapshots deleted per transaction.
+    """
+    for start in range(0, len(timestamps), batch_size):
+        batch = timestamps[start:start + batch_size]
+        transaction = redis.multi_exec()
+        transaction.delete(*[key for timestamp in batch
+                             for key in (rows_key(timestamp), delta_key(timestamp), binary_key(timestamp), timestamp)])
+        transaction.zrem(INDEX_KEY, *batch)
+        await transaction.execute()
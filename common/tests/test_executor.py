@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import pytest
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+from ..executor import CpuExecutor, create_executor
+from ..merge_engine import merge_encoded_rows, merge_packed_rows, pack_rows, unpack_rows
+
+RANK_DATA = [{"Id": 2, "Symbol": "ETH"}, {"Id": 1, "Symbol": "BTC"}]
+PRICE_DATA = [{"Id": 1, "Symbol": "BTC", "Price USD": 42863.7}, {"Id": 2, "Symbol": "ETH", "Price USD": 2297.6}]
+
+
+def packed(rows):
+    names = list(rows[0])
+    return names, pack_rows(rows, names)
+
+
+def test_pack_rows():
+    assert pack_rows(PRICE_DATA, ["Id", "Price USD"]) == [(1, 42863.7), (2, 2297.6)]
+    assert pack_rows(RANK_DATA, ["Symbol"]) == [("ETH",), ("BTC",)]
+    assert unpack_rows(*packed(PRICE_DATA)) == PRICE_DATA
+
+
+def test_merge_packed_rows():
+    merged = merge_packed_rows([packed(RANK_DATA), packed(PRICE_DATA)], {"how": "inner"})
+
+    assert merged.split("\n") == merge_encoded_rows(RANK_DATA, PRICE_DATA)
+
+
+@pytest.mark.asyncio
+async def test_process_executor():
+    executor = CpuExecutor("process", 1)
+    try:
+        await executor.start()
+        merged = await executor.run(merge_packed_rows, [packed(RANK_DATA), packed(PRICE_DATA)], {})
+    finally:
+        executor.shutdown()
+
+    assert executor.kind == "process"
+    assert merged.split("\n") == merge_encoded_rows(RANK_DATA, PRICE_DATA)
+
+
+@pytest.mark.asyncio
+async def test_process_executor_falls_back_to_threads():
+    with patch("common.executor.ProcessPoolExecutor", side_effect=OSError("No shared semaphores")):
+        executor = CpuExecutor("process", 1)
+
+    assert executor.kind == "thread"
+    assert isinstance(executor.pool, ThreadPoolExecutor)
+    assert await executor.run(sum, [1, 2]) == 3
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_broken_process_pool_falls_back_to_threads():
+    executor = CpuExecutor("process", 1)
+    with patch.object(executor.pool, "submit", side_effect=BrokenProcessPool("Worker killed")):
+        assert await executor.run(sum, [1, 2]) == 3
+
+    assert executor.kind == "thread"
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_broken_process_pool_replaced_once(caplog):
+    def broken_future(*args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("Worker killed"))
+        return future
+
+    executor = CpuExecutor("process", 1)
+    with patch.object(executor.pool, "submit", side_effect=broken_future):
+        results = await asyncio.gather(*[executor.run(sum, [1, position]) for position in range(3)])
+
+    assert results == [1, 2, 3]
+    assert executor.kind == "thread"
+    assert [record.levelno for record in caplog.records].count(logging.ERROR) == 1
+    executor.shutdown()
+
+
+def test_create_executor():
+    assert create_executor(None) is None
+    assert create_executor({"kind": "none"}) is None
+    executor = create_executor({"kind": "thread", "max_workers": 2})
+    assert (executor.kind, executor.max_workers) == ("thread", 2)
+    executor.shutdown()
+    with pytest.raises(ValueError):
+        CpuExecutor("gpu")
@@ -0,0 +1,28 @@
+from ..history_store import HistoryStore
+
+
+def test_history_store_tiers(tmp_path):
+    history = HistoryStore(str(tmp_path / "history" / "history.db"))
+    history.save("hour", 1706868720, b"hour 1")
+    history.save("hour", 1706875200, b"hour 2")
+    history.save("day", 1706832000, b"day 1")
+
+    assert history.timestamps("hour") == [1706868720, 1706875200]
+    assert history.timestamps("hour", end=1706875200) == [1706868720]
+    assert history.load("hour", 1706868720) == b"hour 1"
+    assert history.load("day", 1706868720) is None
+
+    # Finest tier covering the request, latest snapshot at or before it
+    assert history.find(1706868780) == (1706868720, b"hour 1")
+    assert history.find(1706875300) == (1706875200, b"hour 2")
+    # Older than one hour since the last hourly snapshot: daily tier
+    assert history.find(1706868720 - 60) == (1706832000, b"day 1")
+    assert history.find(1706832000 - 60) is None
+    # Not older than the tolerance
+    assert history.find(1706868780, tolerance=60) == (1706868720, b"hour 1")
+    assert history.find(1706868780, tolerance=59) is None
+    assert history.find(1706868720 - 60, tolerance=3600) is None
+
+    assert history.delete("hour", 1706875200) == 1
+    assert history.timestamps("hour") == [1706875200]
+    history.close()
@@ -0,0 +1,73 @@
+import json
+import pytest
+from ..merge_engine import iter_merged_rows, merge_encoded_rows, merge_options, output_plan
+
+
+def test_inner_join_in_main_source_order():
+    rank_data = [{"Id": 1, "Symbol": "BTC"}, {"Id": None, "Symbol": "XYZ"},
+                 {"Id": 1027, "Symbol": "ETH"}, {"Id": 5426, "Symbol": "SOL"}]
+    price_data = [{"Id": 5426, "Symbol": "SOL", "Price USD": 91.67929509303363},
+                  {"Id": 1, "Symbol": "BTC", "Price USD": 42863.717593629444}]
+
+    merged = list(iter_merged_rows(rank_data, price_data))
+
+    assert merged == [{"Rank": 1, "Symbol": "BTC", "Price USD": 42863.717593629444},
+                      {"Rank": 2, "Symbol": "SOL", "Price USD": 91.67929509303363}]
+
+
+def test_duplicated_keys_and_overlapping_columns_of_n_sources():
+    main = [{"Id": 1, "Symbol": "A", "Price": 1.0}]
+    second = [{"Id": 1, "Symbol": "A", "Price": 2.0}, {"Id": 1, "Symbol": "A", "Price": 3.0}]
+    third = [{"Id": 1, "Symbol": "A", "Price": 4.0, "Volume": 5}]
+
+    merged = list(iter_merged_rows(main, second, third))
+
+    assert merged == [{"Rank": 1, "Symbol": "A", "Price_df1": 1.0, "Price_df2": 2.0, "Price": 4.0, "Volume": 5},
+                      {"Rank": 2, "Symbol": "A", "Price_df1": 1.0, "Price_df2": 3.0, "Price": 4.0, "Volume": 5}]
+
+
+def test_output_plan_suffixes_like_chained_pandas_merges():
+    plan = output_plan([["Id", "Symbol", "Price"], ["Id", "Symbol", "Price"], ["Id", "Symbol", "Price"]], ("Id", "Symbol"))
+
+    assert [name for name, _, _ in plan] == ["Id", "Symbol", "Price_df1", "Price_df2", "Price"]
+
+
+def test_merge_encoded_rows_keeps_float_precision():
+    price = 0.1 + 0.2
+    encoded = merge_encoded_rows([{"Id": 1, "Symbol": "BTC"}], [{"Id": 1, "Symbol": "BTC", "Price USD": price}])
+
+    assert encoded == ['{"Rank": 1, "Symbol": "BTC", "Price USD": 0.30000000000000004}']
+    assert json.loads(encoded[0])["Price USD"] == price
+
+
+def test_merge_encoded_rows_matches_json_dumps_for_mixed_columns():
+    main = [{"Id": 1, "Symbol": "BTC", "Active": True}, {"Id": 2, "Symbol": "ÉTH", "Active": None}]
+    second = [{"Id": 2, "Symbol": "ÉTH", "Price": float("nan")}, {"Id": 1, "Symbol": "BTC", "Price": 7}]
+
+    encoded = merge_encoded_rows(main, second)
+
+    assert encoded == [json.dumps(row) for row in iter_merged_rows(main, second)]
+    assert encoded[1] == '{"Rank": 2, "Symbol": "\\u00c9TH", "Active": null, "Price": NaN}'
+
+
+def test_left_join_keeps_every_main_row():
+    rank_data = [{"Id": 1, "Symbol": "BTC"}, {"Id": 1027, "Symbol": "ETH"}]
+    price_data = [{"Id": 1, "Symbol": "BTC", "Price USD": 42863.7}]
+
+    merged = list(iter_merged_rows(rank_data, price_data, how="left"))
+
+    assert merged == [{"Rank": 1, "Symbol": "BTC", "Price USD": 42863.7},
+                      {"Rank": 2, "Symbol": "ETH", "Price USD": None}]
+    with pytest.raises(ValueError):
+        list(iter_merged_rows(rank_data, price_data, how="outer"))
+
+
+def test_merge_options_from_config():
+    config = {"on": ["Id"], "how": "left", "suffixes": {"rank": "_rank"}, "drop": []}
+
+    options = merge_options(config, ["rank", "price"])
+    merged = list(iter_merged_rows([{"Id": 1, "Price": 1.0}], [{"Id": 1, "Price": 2.0}], **options))
+
+    assert options == {"on": ("Id",), "how": "left", "drop": (), "suffixes": ["_rank", "_price"]}
+    assert merged == [{"Rank": 1, "Id": 1, "Price_rank": 1.0, "Price_price": 2.0}]
+    assert merge_options({}, ["rank", "price"]) == {"on": ("Id", "Symbol"), "how": "inner", "drop": ("Id",)}
@@ -4,7 +4,7 @@ import logging
 
 from tenacity import RetryError
 from unittest.mock import AsyncMock, MagicMock, patch
-from ..redis_utils import connect_to_redis, save_to_redis, log_retry_info
+from ..redis_utils import connect_to_redis, save_to_redis, log_retry_info, write_batch, BatchWriteError
 
 
 @pytest.fixture
@@ -88,3 +88,31 @@ def test_log_retry_info_no_retry_state(caplog):
         "Retry state or next_action is None. Unable to log retry information."
         in caplog.text
     )
+
+
+@pytest.mark.asyncio
+async def test_write_batch():
+    redis_mock = MagicMock()
+    redis_mock.multi_exec.return_value.execute = AsyncMock(return_value=[1, True])
+
+    results = await write_batch(redis_mock, lambda batch: batch.set("key", "value"),
+                                lambda batch: batch.expire("key", 60), name="test batch")
+
+    assert results == [1, True]
+    redis_mock.multi_exec.return_value.set.assert_called_once_with("key", "value")
+    redis_mock.multi_exec.return_value.expire.assert_called_once_with("key", 60)
+    redis_mock.multi_exec.return_value.execute.assert_awaited_once_with(return_exceptions=True)
+    redis_mock.pipeline.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_write_batch_errors_are_raised():
+    redis_mock = MagicMock()
+    error = aioredis.errors.ReplyError("WRONGTYPE Operation against a key holding the wrong kind of value")
+    redis_mock.pipeline.return_value.execute = AsyncMock(return_value=[1, error, 1])
+
+    with pytest.raises(BatchWriteError) as excinfo:
+        await write_batch(redis_mock, lambda batch: batch.set("key", "value"), atomic=False, name="test batch")
+
+    assert excinfo.value.errors == [(1, error)]
+    assert "1 command(s) of test batch failed: #1: WRONGTYPE" in str(excinfo.value)
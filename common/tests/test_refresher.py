@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from ..refresher import next_build_time, refresh_snapshot, run_refresher
+from ..single_flight import SingleFlight
+
+
+def test_next_build_time():
+    assert next_build_time(1706792105.5, 15) == (1706792100, 1706792115)
+    assert next_build_time(1706792115, 15) == (1706792100, 1706792115)
+    # Past the build time of this minute: next minute
+    assert next_build_time(1706792130, 15) == (1706792160, 1706792175)
+
+
+@pytest.mark.asyncio
+async def test_refresh_snapshot():
+    redis_mock = AsyncMock()
+    build = AsyncMock()
+
+    redis_mock.zscore.return_value = 1706792100
+    assert not await refresh_snapshot(redis_mock, SingleFlight(), build, 1706792100)
+    build.assert_not_awaited()
+
+    redis_mock.zscore.return_value = None
+    assert await refresh_snapshot(redis_mock, SingleFlight(), build, 1706792100)
+    build.assert_awaited_once_with(1706792100)
+    redis_mock.zscore.assert_awaited_with("snapshots:index", 1706792100)
+
+
+@pytest.mark.asyncio
+async def test_run_refresher_checks_every_minute():
+    redis_mock = AsyncMock()
+    redis_mock.zscore.return_value = None
+    build = AsyncMock(side_effect=[Exception("External API down"), None])
+    clock = iter([1706792105, 1706792130, 1706792190])
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) == 3:
+            raise asyncio.CancelledError()
+
+    with patch("common.refresher.asyncio.sleep", fake_sleep):
+        await run_refresher(redis_mock, SingleFlight(), build, 15, clock=lambda: next(clock))
+
+    # A failed build does not stop the refresher
+    assert sleeps == [10, 45, 45]
+    assert [call.args[0] for call in build.await_args_list] == [1706792100, 1706792160]
@@ -0,0 +1,81 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from ..history_store import HistoryStore
+from ..retention import snapshot_table, retention_boundary, roll_up_minutes, roll_up_hours
+from ..snapshot_codec import decode_snapshot
+from ..snapshot_delta import encode_delta
+from ..snapshot_store import INDEX_KEY
+
+HOUR_START = 1706868000
+ROWS = [json.dumps({"Rank": 1, "Symbol": "BTC", "Price USD": 42863.7}),
+        json.dumps({"Rank": 2, "Symbol": "ETH", "Price USD": 2540.6})]
+
+
+def redis_with_snapshots(timestamps):
+    redis_mock = MagicMock()
+    redis_mock.zrangebyscore = AsyncMock(side_effect=lambda key, min, max: [str(ts).encode() for ts in timestamps
+                                                                            if min <= ts <= max])
+    redis_mock.lrange = AsyncMock(side_effect=lambda key, start, stop: [row.encode() for row in ROWS])
+    redis_mock.multi_exec.return_value.execute = AsyncMock()
+    return redis_mock
+
+
+def test_snapshot_table():
+    assert snapshot_table(ROWS) == (["Rank", "Symbol", "Price USD"], [[1, 2], ["BTC", "ETH"], [42863.7, 2540.6]])
+    assert snapshot_table([]) == ([], [])
+
+
+@pytest.mark.asyncio
+async def test_retention_boundary_keeps_delta_keyframe():
+    redis_mock = AsyncMock()
+    redis_mock.zrangebyscore.return_value = [b"1706868840"]
+    deltas = {"1706868840:delta": encode_delta(1706868780, []), "1706868780:delta": encode_delta(1706868720, [])}
+    redis_mock.get.side_effect = deltas.get
+
+    assert await retention_boundary(redis_mock, 1706868800) == 1706868720
+    redis_mock.zrangebyscore.assert_awaited_once_with(INDEX_KEY, min=1706868800, offset=0, count=1)
+
+    redis_mock.zrangebyscore.return_value = []
+    assert await retention_boundary(redis_mock, 1706868800) == 1706868800
+
+
+@pytest.mark.asyncio
+async def test_roll_up_minutes(tmp_path):
+    timestamps = [HOUR_START + 60, HOUR_START + 120, HOUR_START + 3600, HOUR_START + 3660, HOUR_START + 7200]
+    redis_mock = redis_with_snapshots(timestamps)
+    history = HistoryStore(str(tmp_path / "history.db"))
+
+    assert await roll_up_minutes(redis_mock, history, HOUR_START + 7200) == 4
+
+    # First snapshot of every hour kept, in the binary format
+    assert history.timestamps("hour") == [HOUR_START + 60, HOUR_START + 3600]
+    names, columns = decode_snapshot(history.load("hour", HOUR_START + 60))
+    assert names == ["Rank", "Symbol", "Price USD"]
+    assert columns[1] == ["BTC", "ETH"]
+    transaction = redis_mock.multi_exec.return_value
+    transaction.zrem.assert_called_once_with(INDEX_KEY, *timestamps[:4])
+    assert f"{HOUR_START + 120}:rows" in transaction.delete.call_args.args
+
+    # An hour already rolled up keeps its first snapshot
+    redis_mock = redis_with_snapshots([HOUR_START + 3720])
+    assert await roll_up_minutes(redis_mock, history, HOUR_START + 7200) == 1
+    assert history.timestamps("hour") == [HOUR_START + 60, HOUR_START + 3600]
+    history.close()
+
+
+def test_roll_up_hours(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.db"))
+    day_start = HOUR_START - HOUR_START % 86400
+    for timestamp in (day_start + 3600, day_start + 7200, day_start + 86400, day_start + 90000):
+        history.save("hour", timestamp, str(timestamp).encode())
+
+    assert roll_up_hours(history, day_start + 90000) == 3
+
+    assert history.timestamps("hour") == [day_start + 90000]
+    assert history.timestamps("day") == [day_start + 3600, day_start + 86400]
+    assert history.load("day", day_start + 3600) == str(day_start + 3600).encode()
+
+    roll_up_hours(history, day_start + 90000, day_end=day_start + 86400)
+    assert history.timestamps("day") == [day_start + 86400]
+    history.close()
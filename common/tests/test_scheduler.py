@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from ..scheduler import MinuteScheduler, next_tick
+
+real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    """
+    Wall clock advanced by the patched `asyncio.sleep`, with an optional extra delay per sleep
+    (early wake up by `-oversleep` seconds, if the sleep is longer, when negative).
+    Sleeping once `stop()` is true cancels the sleeper.
+    """
+
+    def __init__(self, now, oversleep=0.0):
+        self.now = now
+        self.oversleep = oversleep
+        self.sleeps = []
+        self.stop = lambda: False
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        # Let the tick tasks run first
+        await real_sleep(0)
+        if self.stop():
+            raise asyncio.CancelledError()
+        self.sleeps.append(delay)
+        self.now += delay + self.oversleep if delay + self.oversleep > 0 else delay
+
+
+def test_next_tick():
+    assert next_tick(1706792130.5) == 1706792160
+    assert next_tick(1706792160) == 1706792220
+    assert next_tick(1706792130.5, 300) == 1706792400
+
+
+async def run_ticks(scheduler, clock, ticks, callback=None):
+    fired = []
+
+    async def record(tick):
+        fired.append((tick, clock()))
+
+    clock.stop = lambda: scheduler.ticks >= ticks
+    with patch("common.scheduler.asyncio.sleep", clock.sleep), pytest.raises(asyncio.CancelledError):
+        await scheduler.run(callback or record)
+    return fired
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fires_on_minute_boundaries_without_drift():
+    # Every sleep wakes up 0.2 s late, it must not accumulate
+    clock = FakeClock(1706792130.5, oversleep=0.2)
+    scheduler = MinuteScheduler(clock=clock)
+
+    fired = await run_ticks(scheduler, clock, 3)
+
+    assert [tick for tick, _ in fired] == [1706792160, 1706792220, 1706792280]
+    assert [round(now - tick, 3) for tick, now in fired] == [0.2, 0.2, 0.2]
+    assert round(scheduler.lateness, 3) == 0.2
+    assert scheduler.ticks == 3
+    assert scheduler.missed == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_sleeps_again_when_woken_up_early():
+    clock = FakeClock(1706792130, oversleep=-10)
+    scheduler = MinuteScheduler(clock=clock)
+
+    fired = await run_ticks(scheduler, clock, 1)
+
+    assert fired == [(1706792160, 1706792160)]
+    assert clock.sleeps == [30, 10]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_catches_up_missed_ticks():
+    # The event loop was blocked past two boundaries
+    clock = FakeClock(1706792130, oversleep=150.5)
+    scheduler = MinuteScheduler(clock=clock)
+
+    fired = await run_ticks(scheduler, clock, 1)
+
+    assert fired == [(1706792280, 1706792310.5)]
+    assert scheduler.missed == 2
+    assert scheduler.max_lateness == 30.5
+
+
+@pytest.mark.asyncio
+async def test_scheduler_failed_tick_does_not_stop_it():
+    clock = FakeClock(1706792159.9)
+    scheduler = MinuteScheduler(clock=clock)
+    fired = []
+
+    async def callback(tick):
+        fired.append(tick)
+        raise Exception("External API down")
+
+    await run_ticks(scheduler, clock, 2, callback)
+
+    assert fired == [1706792160, 1706792220]
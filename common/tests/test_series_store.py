@@ -0,0 +1,48 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from ..series_store import series_key, series_points, save_series, read_series, render_series
+
+NAMES = ["Rank", "Symbol", "Price USD", "Volume"]
+COLUMNS = [range(1, 3), ["BTC", "ETH"], [42863.7, 2540.6], [10, 20]]
+
+
+def test_series_points():
+    symbols, points = series_points(1706868720, NAMES, COLUMNS, value_columns=["Price USD"])
+
+    assert symbols == ["BTC", "ETH"]
+    assert [json.loads(point) for point in points] == [{"Timestamp": 1706868720, "Rank": 1, "Price USD": 42863.7},
+                                                       {"Timestamp": 1706868720, "Rank": 2, "Price USD": 2540.6}]
+    # Every column but the symbol by default
+    assert json.loads(series_points(1706868720, NAMES, COLUMNS)[1][0]) == {"Timestamp": 1706868720, "Rank": 1,
+                                                                            "Price USD": 42863.7, "Volume": 10}
+
+
+@pytest.mark.asyncio
+async def test_save_series():
+    redis_mock = MagicMock()
+    redis_mock.pipeline.return_value.execute = AsyncMock()
+
+    assert await save_series(redis_mock, 1706868720, NAMES, COLUMNS, {"columns": ["Price USD"], "window": 3600}) == 2
+
+    pipeline = redis_mock.pipeline.return_value
+    assert pipeline.zadd.call_args_list[0].args == (series_key("BTC"), 1706868720,
+                                                     '{"Timestamp": 1706868720, "Rank": 1, "Price USD": 42863.7}')
+    # Same minute replaced, old points dropped, series expire when no longer updated
+    pipeline.zremrangebyscore.assert_any_call(series_key("ETH"), min=1706868720, max=1706868720)
+    pipeline.zremrangebyscore.assert_any_call(series_key("ETH"), max=1706868720 - 3600)
+    pipeline.expire.assert_any_call(series_key("BTC"), 3600)
+    pipeline.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_read_and_render_series():
+    redis_mock = MagicMock()
+    points = [b'{"Timestamp": 1706868720, "Rank": 1, "Price USD": 42863.7}']
+    redis_mock.pipeline.return_value.execute = AsyncMock(return_value=[points, []])
+
+    series = await read_series(redis_mock, ["BTC", "NOPE"], 1706860000, 1706870000)
+
+    redis_mock.pipeline.return_value.zrangebyscore.assert_any_call(series_key("BTC"), min=1706860000, max=1706870000)
+    assert json.loads(render_series(series)) == {"BTC": [{"Timestamp": 1706868720, "Rank": 1, "Price USD": 42863.7}],
+                                                 "NOPE": []}
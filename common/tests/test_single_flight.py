@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from ..single_flight import SingleFlight, RedisSingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    single_flight = SingleFlight()
+    results = await asyncio.gather(*[single_flight.do("key", work) for _ in range(10)])
+
+    assert results == ["result"] * 10
+    assert calls == 1
+    assert single_flight.in_flight == {}
+
+    # Once finished a new call runs the work again
+    await single_flight.do("key", work)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("fetch failed")
+
+    single_flight = SingleFlight()
+    results = await asyncio.gather(*[single_flight.do("key", work) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_redis_single_flight_lock_owner_runs_work():
+    redis_mock = AsyncMock()
+    redis_mock.set.return_value = True
+    work = AsyncMock(return_value="merged")
+
+    single_flight = RedisSingleFlight(redis_mock)
+    result = await single_flight.do(60, work, AsyncMock(return_value=None))
+
+    assert result == "merged"
+    work.assert_awaited_once()
+    assert redis_mock.set.call_args.args[0] == "lock:60"
+    redis_mock.eval.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_redis_single_flight_waits_for_other_process():
+    redis_mock = AsyncMock()
+    redis_mock.set.return_value = False
+    work = AsyncMock(return_value="merged")
+    load = AsyncMock(side_effect=[None, "merged by other replica"])
+
+    single_flight = RedisSingleFlight(redis_mock, poll_interval=0.01)
+    result = await single_flight.do(60, work, load)
+
+    assert result == "merged by other replica"
+    work.assert_not_awaited()
+    redis_mock.eval.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_redis_single_flight_rechecks_result_after_acquiring_lock():
+    # The lock is acquired right after the owner stored its result and released it
+    redis_mock = AsyncMock()
+    redis_mock.set.side_effect = [False, True]
+    work = AsyncMock(return_value="merged")
+    load = AsyncMock(side_effect=[None, "merged by other replica"])
+
+    single_flight = RedisSingleFlight(redis_mock, poll_interval=0.01)
+    result = await single_flight.do(60, work, load)
+
+    assert result == "merged by other replica"
+    work.assert_not_awaited()
+    redis_mock.eval.assert_awaited_once()
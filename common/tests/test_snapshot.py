@@ -0,0 +1,71 @@
+import json
+import pytest
+from unittest.mock import patch
+from ..executor import CpuExecutor
+from ..snapshot import RenderedSnapshot, stream_csv_rows, stream_json_rows, stream_ndjson_rows
+from ..utils import json_to_csv
+
+ROWS = [{"Rank": 1, "Symbol": "BTC", "Price USD": 42863.717593629444},
+        {"Rank": 2, "Symbol": "ETH", "Price USD": 2540.618971408493},
+        {"Rank": 3, "Symbol": "ÉTH", "Price USD": 91.67929509303363}]
+
+
+def test_rendered_snapshot_json_slices():
+    snapshot = RenderedSnapshot.from_json(json.dumps(ROWS))
+
+    for limit in range(0, 5):
+        assert json.loads(snapshot.json(limit)) == ROWS[:limit]
+    assert snapshot.json(3) is snapshot.json_body
+
+
+def test_rendered_snapshot_csv_slices():
+    snapshot = RenderedSnapshot(ROWS)
+
+    for limit in range(1, 5):
+        assert snapshot.csv(limit).decode() == json_to_csv(ROWS[:limit])
+    assert snapshot.csv(0) == b"Rank,Symbol,Price USD\n"
+
+
+@pytest.mark.asyncio
+async def test_rendered_snapshot_csv_rendered_on_demand():
+    encoded_rows = [json.dumps(row).encode() for row in ROWS]
+    with patch("common.snapshot.json.loads") as loads:
+        snapshot = RenderedSnapshot.from_encoded_rows(encoded_rows)
+    # JSON responses do not decode the rows nor render the CSV payload
+    loads.assert_not_called()
+    assert not snapshot.csv_rendered
+    json_size = snapshot.size
+
+    executor = CpuExecutor("thread", 1)
+    try:
+        await snapshot.render_csv(executor)
+    finally:
+        executor.shutdown()
+    assert snapshot.csv_rendered and snapshot.size > json_size
+    assert snapshot.csv(2).decode() == json_to_csv(ROWS[:2])
+
+
+def test_rendered_snapshot_empty():
+    snapshot = RenderedSnapshot([])
+
+    assert snapshot.json(10) == b"[]"
+    assert snapshot.csv(10) == b"\n"
+
+
+async def chunks_of(rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        yield [json.dumps(row) for row in rows[start:start + chunk_size]]
+
+
+async def collect(pieces):
+    return b"".join([piece async for piece in pieces])
+
+
+@pytest.mark.asyncio
+async def test_streamed_rows_match_rendered_snapshot():
+    snapshot = RenderedSnapshot(ROWS)
+
+    assert await collect(stream_json_rows(chunks_of(ROWS, 2))) == snapshot.json(3)
+    assert await collect(stream_csv_rows(chunks_of(ROWS, 2))) == snapshot.csv(3)
+    assert [json.loads(line) for line in (await collect(stream_ndjson_rows(chunks_of(ROWS, 2)))).splitlines()] == ROWS
+    assert json.loads(await collect(stream_json_rows(chunks_of([], 2)))) == []
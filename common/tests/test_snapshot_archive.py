@@ -0,0 +1,146 @@
+import os
+from ..snapshot_archive import SnapshotArchive, column_type, widen_type
+
+NAMES = ["Rank", "Symbol", "Price USD", "Volume"]
+
+
+def snapshot(symbols, prices, volumes):
+    return [range(1, len(symbols) + 1), symbols, prices, volumes]
+
+
+def test_column_type():
+    assert column_type([1, 2, None, "NOT_AVAILABLE"]) == "int"
+    assert column_type([1.5, None]) == "float"
+    assert column_type([1.5, 2, "NOT_AVAILABLE"]) == "number"
+    assert column_type([2 ** 70]) == "float"
+    assert column_type(["BTC", None]) == "string"
+    assert column_type([None]) == "string"
+    assert widen_type("int", "float") == "number"
+    assert widen_type("string", "int") == "int"
+    assert widen_type("float", "string") == "float"
+
+
+def test_archive_append_and_read(tmp_path):
+    path = str(tmp_path / "archive" / "snapshots.tca")
+    writer = SnapshotArchive(path, string_width=8)
+    reader = SnapshotArchive(path)
+    assert reader.find(1706868720) is None
+
+    assert writer.append(1706868720, NAMES, snapshot(["BTC", "ETH", "SOL"], [42863.7, None, 91.6], [10, 20, 30]))
+    assert writer.append(1706868840, NAMES, snapshot(["ETH", "BTC"], [2540.6, 42900.1], [21, 11]))
+    # Append-only, in timestamp order
+    assert not writer.append(1706868840, NAMES, snapshot(["BTC"], [1.0], [1]))
+
+    assert reader.read(1706868720, 2) == (NAMES, [range(1, 3), ["BTC", "ETH"], [42863.7, None], [10, 20]])
+    assert reader.read(1706868840) == (NAMES, [range(1, 3), ["ETH", "BTC"], [2540.6, 42900.1], [21, 11]])
+    assert reader.read(1706868780) is None
+
+    # Latest snapshot at or before the requested minute, within the tolerance
+    assert reader.find(1706868780) is None
+    assert reader.find(1706868780, 60) == 1706868720
+    assert reader.find(1706868900, 60) == 1706868840
+    assert reader.find(1706868660, 600) is None
+
+    # Snapshots appended after the reader mapped the files are visible
+    assert writer.append(1706868900, NAMES, snapshot(["SOL"], [92.0], [31]))
+    assert reader.read(1706868900, 10) == (NAMES, [range(1, 2), ["SOL"], [92.0], [31]])
+
+    writer.close()
+    reader.close()
+
+
+def test_archive_nullable_columns(tmp_path):
+    path = str(tmp_path / "snapshots.tca")
+    writer = SnapshotArchive(path, string_width=8)
+    reader = SnapshotArchive(path)
+
+    # Source defaults are archived as nulls, long strings truncated, ints kept as ints
+    assert writer.append(1706868720, NAMES, snapshot(["BTC", "TOO LONG SYMBOL", None],
+                                                     [42863.7, "NOT_AVAILABLE", None], [10, "NOT_AVAILABLE", 30]))
+    assert reader.read(1706868720) == (NAMES, [range(1, 4), ["BTC", "TOO LONG", None],
+                                               [42863.7, None, None], [10, None, 30]])
+    # Every value of a column missing
+    assert writer.append(1706868780, NAMES, snapshot(["BTC"], ["NOT_AVAILABLE"], ["NOT_AVAILABLE"]))
+    assert reader.read(1706868780) == (NAMES, [range(1, 2), ["BTC"], [None], [None]])
+    assert len(os.listdir(tmp_path)) == 2
+    writer.close()
+    reader.close()
+
+
+def test_archive_mixed_int_float_column(tmp_path):
+    path = str(tmp_path / "snapshots.tca")
+    writer = SnapshotArchive(path)
+    reader = SnapshotArchive(path)
+
+    assert writer.append(1706868720, NAMES, snapshot(["BTC", "ETH", "SOL"], [42863.7, 2540, None], [10, 20.5, 30]))
+    assert reader.read(1706868720) == (NAMES, [range(1, 4), ["BTC", "ETH", "SOL"], [42863.7, 2540, None], [10, 20.5, 30]])
+    assert [type(value) for value in reader.read(1706868720)[1][3]] == [int, float, int]
+    writer.close()
+    reader.close()
+
+
+def test_archive_new_segment_for_other_schema(tmp_path):
+    path = str(tmp_path / "snapshots.tca")
+    writer = SnapshotArchive(path)
+    reader = SnapshotArchive(path)
+
+    assert writer.append(1706868720, NAMES, snapshot(["BTC"], [42863.7], [10]))
+    # A float in the int column: new segment with the type widened, ints still read as ints
+    assert writer.append(1706868780, NAMES, snapshot(["BTC"], [42863.7], [10.5]))
+    assert writer.append(1706868840, NAMES, snapshot(["BTC"], [42863.7], [11]))
+    # Other columns: new segment
+    assert writer.append(1706868900, NAMES[:3], snapshot(["BTC"], [1.0], [1])[:3])
+
+    assert reader.read(1706868720) == (NAMES, [range(1, 2), ["BTC"], [42863.7], [10]])
+    assert reader.read(1706868780) == (NAMES, [range(1, 2), ["BTC"], [42863.7], [10.5]])
+    assert reader.read(1706868840) == (NAMES, [range(1, 2), ["BTC"], [42863.7], [11]])
+    assert reader.read(1706868900) == (NAMES[:3], [range(1, 2), ["BTC"], [1.0]])
+    assert reader.find(1706868960, 120) == 1706868900
+    assert sorted(name for name in os.listdir(tmp_path) if not name.endswith(".idx")) == [
+        "snapshots.tca.1706868720", "snapshots.tca.1706868780", "snapshots.tca.1706868900"]
+    writer.close()
+    reader.close()
+
+
+def test_archive_rotation_and_retention(tmp_path):
+    path = str(tmp_path / "snapshots.tca")
+    writer = SnapshotArchive(path, segment_seconds=120, retention=300)
+    reader = SnapshotArchive(path)
+
+    for minute in range(9):
+        assert writer.append(minute * 60, NAMES, snapshot(["BTC"], [float(minute)], [minute]))
+        assert reader.read(minute * 60) == (NAMES, [range(1, 2), ["BTC"], [float(minute)], [minute]])
+    # Segments of 2 minutes, the ones entirely older than 300 seconds before the last one deleted when it started
+    assert sorted(int(name.split(".")[-1]) for name in os.listdir(tmp_path) if not name.endswith(".idx")) == [120, 240, 360, 480]
+    assert reader.read(60) is None
+    assert reader.find(119, 600) is None
+    assert reader.find(179, 600) == 120
+    assert reader.find(420, 0) == 420
+
+    # Reopened, the writer appends to the last segment
+    writer.close()
+    writer = SnapshotArchive(path, segment_seconds=120, retention=300)
+    assert not writer.append(480, NAMES, snapshot(["BTC"], [1.0], [1]))
+    assert writer.append(510, NAMES, snapshot(["BTC"], [1.0], [1]))
+    assert reader.find(539, 60) == 510
+    assert len(os.listdir(tmp_path)) == 8
+    writer.close()
+    reader.close()
+
+
+def test_archive_drops_interrupted_append(tmp_path):
+    path = str(tmp_path / "snapshots.tca")
+    writer = SnapshotArchive(path)
+    writer.append(1706868720, NAMES, snapshot(["BTC"], [42863.7], [10]))
+    writer.close()
+    # Records written without their index entry
+    with open(path, "ab") as data_file:
+        data_file.write(b"\1" * 50)
+
+    writer = SnapshotArchive(path)
+    assert writer.append(1706868780, NAMES, snapshot(["ETH"], [2540.6], [20]))
+    reader = SnapshotArchive(path)
+    assert reader.read(1706868720) == (NAMES, [range(1, 2), ["BTC"], [42863.7], [10]])
+    assert reader.read(1706868780) == (NAMES, [range(1, 2), ["ETH"], [2540.6], [20]])
+    writer.close()
+    reader.close()
@@ -0,0 +1,88 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from ..snapshot_cache import SnapshotCache, invalidate_on_publish
+
+
+def test_get_put_invalidate():
+    cache = SnapshotCache(max_bytes=100)
+    cache.put(60, [{"Rank": 1}], 10)
+
+    assert cache.get(60) == [{"Rank": 1}]
+    assert cache.get(120) is None
+
+    cache.invalidate(60)
+    assert cache.get(60) is None
+    assert cache.size == 0
+
+
+def test_lru_eviction_over_budget():
+    cache = SnapshotCache(max_bytes=30)
+    cache.put(60, "a", 10)
+    cache.put(120, "b", 10)
+    cache.put(180, "c", 10)
+    cache.get(60)  # 120 becomes the least recently used
+    cache.put(240, "d", 10)
+
+    assert cache.get(120) is None
+    assert [cache.get(key) for key in (60, 180, 240)] == ["a", "c", "d"]
+    assert cache.size == 30
+
+    # Entries bigger than the whole budget are not stored
+    cache.put(300, "e", 31)
+    assert cache.get(300) is None
+    assert len(cache) == 3
+
+
+def test_ttl_expiration():
+    cache = SnapshotCache(ttl=60)
+    cache.put(60, "a", 10)
+    with patch("common.snapshot_cache.time.monotonic", return_value=time.monotonic() + 61):
+        assert cache.get(60) is None
+    assert len(cache) == 0
+
+
+class FakeChannel:
+    def __init__(self, messages, closes=True):
+        self.messages = messages
+        self.closes = closes
+
+    async def iter(self):
+        for message in self.messages:
+            yield message
+        if not self.closes:
+            await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_on_publish_subscribes_again_and_clears_cache():
+    cache = SnapshotCache()
+    cache.put(60, "a", 10)
+    cache.put(120, "b", 10)
+    redis = MagicMock(closed=False)
+    redis.unsubscribe = AsyncMock()
+    subscribed = asyncio.Event()
+
+    async def subscribe(channel_name):
+        channel = channels.pop(0)
+        if isinstance(channel, Exception):
+            raise channel
+        if not channels:
+            subscribed.set()
+        return [channel]
+
+    # Connection dropped after one update, then a failed attempt before subscribing again
+    channels = [FakeChannel([b"60"]), ConnectionError("Connection refused"), FakeChannel([b"240"], closes=False)]
+    redis.subscribe = subscribe
+    with patch.object(cache, "invalidate", wraps=cache.invalidate) as invalidate:
+        task = asyncio.create_task(invalidate_on_publish(redis, "snapshots", cache, min_backoff=0.001))
+        await asyncio.wait_for(subscribed.wait(), 1)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        task.cancel()
+        await task
+
+    assert [call.args[0] for call in invalidate.call_args_list] == [60, 240]
+    # 120 may have been updated while not subscribed
+    assert len(cache) == 0
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import patch
+from .. import snapshot_codec
+from ..snapshot_codec import decode_snapshot, encode_snapshot, iter_snapshot_chunks
+
+NAMES = ["Rank", "Symbol", "Price USD", "Volume", "Note"]
+COLUMNS = [range(1, 4), ["BTC", "ETH", "BTC"], [42863.717593629444, 2540.618971408493, float("nan")],
+           [10, 2 ** 40, -3], ["a", None, 1.5]]
+
+
+@pytest.mark.parametrize("compression", ["zstd", "lz4", "zlib", "none"])
+def test_round_trip(compression):
+    names, columns = decode_snapshot(encode_snapshot(NAMES, COLUMNS, compression))
+
+    assert names == NAMES
+    assert list(columns[0]) == [1, 2, 3]
+    assert columns[1] == COLUMNS[1] and columns[3] == COLUMNS[3] and columns[4] == COLUMNS[4]
+    assert columns[2][:2] == COLUMNS[2][:2] and columns[2][2] != columns[2][2]
+
+
+def test_decode_top_rows():
+    names, columns = decode_snapshot(encode_snapshot(NAMES, COLUMNS), limit=2)
+
+    assert [list(column) for column in columns] == [[1, 2], ["BTC", "ETH"], COLUMNS[2][:2], [10, 2 ** 40], ["a", None]]
+
+
+def test_iter_snapshot_chunks():
+    data = encode_snapshot(NAMES[:4], COLUMNS[:4])
+
+    chunks = list(iter_snapshot_chunks(data, limit=3, chunk_size=2))
+
+    assert [names for names, _ in chunks] == [NAMES[:4], NAMES[:4]]
+    assert [list(column) for column in chunks[0][1]] == [[1, 2], ["BTC", "ETH"], COLUMNS[2][:2], [10, 2 ** 40]]
+    assert [list(column) for column in chunks[1][1]][:2] == [[3], ["BTC"]]
+    assert len(list(iter_snapshot_chunks(data, chunk_size=1))) == 3
+
+
+def test_zlib_fallback_when_compression_not_installed():
+    with patch.object(snapshot_codec, "zstandard", None):
+        data = encode_snapshot(NAMES, COLUMNS, "zstd")
+
+        assert data[4] == snapshot_codec.CODECS["zlib"]
+        assert decode_snapshot(data)[0] == NAMES
+
+
+def test_unknown_codec_or_compression():
+    data = bytearray(encode_snapshot(NAMES, COLUMNS, "zlib"))
+    data[4] = 9
+
+    with pytest.raises(ValueError, match="Unknown snapshot codec 9"):
+        decode_snapshot(bytes(data))
+    with pytest.raises(ValueError, match="Unknown snapshot codec 9"):
+        list(iter_snapshot_chunks(bytes(data)))
+    with pytest.raises(ValueError, match="Unsupported snapshot compression"):
+        encode_snapshot(NAMES, COLUMNS, "brotli")
@@ -0,0 +1,60 @@
+import json
+from ..snapshot_delta import apply_delta, compute_delta, decode_delta, encode_delta, truncate_delta, DeltaWriter
+
+
+def rows(*symbols):
+    return [json.dumps({"Rank": rank, "Symbol": symbol, "Price USD": price})
+            for rank, (symbol, price) in enumerate(symbols, start=1)]
+
+
+def test_delta_round_trip_with_moves_inserts_and_deletes():
+    base = rows(("BTC", 1.0), ("ETH", 2.0), ("SOL", 3.0), ("ADA", 4.0), ("XRP", 5.0))
+    new = rows(("ETH", 2.0), ("BTC", 1.0), ("SOL", 3.5), ("DOT", 6.0), ("ADA", 4.0))
+
+    operations = compute_delta(base, new)
+
+    assert apply_delta([row.encode() for row in base], operations) == new
+    assert operations == [[1, 1], [0, 1], ', "Symbol": "SOL", "Price USD": 3.5}',
+                          ', "Symbol": "DOT", "Price USD": 6.0}', [3, 1]]
+    # Unchanged rows are a single copy operation
+    assert compute_delta(base, base) == [[0, 5]]
+
+
+def test_truncate_delta_rebuilds_top_rows_from_top_of_base():
+    base = rows(*[(f"C{index}", float(index)) for index in range(10)])
+    new = rows(("C3", 3.0), ("C0", 0.5), ("C1", 1.0), ("C2", 2.0), *[(f"C{index}", float(index)) for index in range(4, 10)])
+
+    operations, base_limit = truncate_delta(compute_delta(base, new), 3)
+
+    assert operations == [[3, 1], ', "Symbol": "C0", "Price USD": 0.5}', [1, 1]]
+    assert base_limit == 4
+    assert apply_delta(base[:base_limit], operations) == new[:3]
+
+
+def test_decode_delta_up_to_limit():
+    operations = [[3, 2], ', "Symbol": "C0", "Price USD": 0.5}', [1, 1], [5, 4]]
+
+    for data in (encode_delta(60, operations), json.dumps({"base": 60, "ops": operations}, indent=1).encode()):
+        assert decode_delta(data) == (60, operations)
+        # Only the operations producing the top rows are decoded
+        assert decode_delta(data, 3) == (60, operations[:2])
+        assert decode_delta(data, 4) == (60, operations[:3])
+        assert decode_delta(data, 100) == (60, operations)
+    assert decode_delta(encode_delta(60, []), 3) == (60, [])
+
+
+def test_delta_writer_keyframes():
+    writer = DeltaWriter(keyframe_interval=3, max_delta_ratio=0.5)
+    snapshot = rows(*[(f"C{index}", float(index)) for index in range(20)])
+
+    assert writer.encode(60, snapshot) is None
+    writer.stored(60, snapshot, False)
+    assert writer.encode(120, snapshot) is not None
+    writer.stored(120, snapshot, True)
+    assert writer.encode(180, snapshot) is not None
+    writer.stored(180, snapshot, True)
+    # Interval reached
+    assert writer.encode(240, snapshot) is None
+    writer.stored(240, snapshot, False)
+    # Delta bigger than allowed
+    assert writer.encode(300, rows(*[(f"D{index}", float(index)) for index in range(20)])) is None
@@ -0,0 +1,194 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from ..merge_engine import render_rows
+from ..snapshot_codec import decode_snapshot, encode_snapshot
+from ..snapshot_delta import compute_delta, encode_delta, row_body
+from ..snapshot_store import (encode_rows, rows_key, delta_key, binary_key, save_snapshot, save_snapshot_delta, read_snapshot_rows,
+                              read_snapshots_rows, iter_snapshot_rows,
+                              find_snapshot, INDEX_KEY)
+
+ROWS = [{"Rank": 1, "Symbol": "BTC", "Price USD": 42863.717593629444},
+        {"Rank": 2, "Symbol": "ETH", "Price USD": 2540.618971408493}]
+
+
+@pytest.mark.asyncio
+async def test_save_snapshot():
+    redis_mock = MagicMock()
+    redis_mock.multi_exec.return_value.execute = AsyncMock()
+
+    result = await save_snapshot(redis_mock, 1706868720, encode_rows(ROWS))
+
+    assert result is True
+    transaction = redis_mock.multi_exec.return_value
+    transaction.delete.assert_called_once_with("1706868720:rows", "1706868720:delta", "1706868720:bin")
+    transaction.rpush.assert_called_once_with("1706868720:rows", *[json.dumps(row) for row in ROWS])
+    transaction.zadd.assert_called_once_with(INDEX_KEY, 1706868720, 1706868720)
+
+
+@pytest.mark.asyncio
+async def test_read_snapshot_rows_by_rank_range():
+    redis_mock = AsyncMock()
+    redis_mock.lrange.return_value = [b'{"Rank": 1}']
+
+    rows = await read_snapshot_rows(redis_mock, 1706868720, 1)
+
+    assert rows == [b'{"Rank": 1}']
+    redis_mock.lrange.assert_awaited_once_with(rows_key(1706868720), 0, 0)
+    redis_mock.get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_read_snapshot_rows_legacy_and_missing():
+    redis_mock = AsyncMock()
+    redis_mock.lrange.return_value = []
+    redis_mock.get.side_effect = lambda key: json.dumps(ROWS).encode() if key == 1706868720 else None
+    redis_mock.mget.side_effect = lambda *keys: [None] * len(keys)
+
+    assert await read_snapshot_rows(redis_mock, 1706868720, 1) == [json.dumps(ROWS[0])]
+    assert await read_snapshot_rows(redis_mock, 1706868720) == [json.dumps(row) for row in ROWS]
+
+    redis_mock.get.side_effect = None
+    redis_mock.get.return_value = None
+    assert await read_snapshot_rows(redis_mock, 1706868720) is None
+
+
+@pytest.mark.asyncio
+async def test_find_snapshot():
+    redis_mock = AsyncMock()
+    redis_mock.zrevrangebyscore.return_value = [b"1706868660"]
+
+    assert await find_snapshot(redis_mock, 1706868720, 120) == 1706868660
+    redis_mock.zrevrangebyscore.assert_awaited_once_with(INDEX_KEY, max=1706868720, min=1706868600, offset=0, count=1)
+
+    redis_mock.zrevrangebyscore.return_value = []
+    assert await find_snapshot(redis_mock, 1706868720) is None
+
+
+@pytest.mark.asyncio
+async def test_save_snapshot_delta():
+    redis_mock = MagicMock()
+    redis_mock.multi_exec.return_value.execute = AsyncMock()
+
+    assert await save_snapshot_delta(redis_mock, 1706868780, '{"base":1706868720,"ops":[[0,2]]}') is True
+
+    transaction = redis_mock.multi_exec.return_value
+    transaction.delete.assert_called_once_with("1706868780:rows", "1706868780:bin")
+    transaction.set.assert_called_once_with("1706868780:delta", '{"base":1706868720,"ops":[[0,2]]}')
+    transaction.zadd.assert_called_once_with(INDEX_KEY, 1706868780, 1706868780)
+
+
+@pytest.mark.asyncio
+async def test_read_snapshot_rows_rebuilds_delta_chain():
+    keyframe = encode_rows(ROWS)
+    second = ['{"Rank": 1, "Symbol": "ETH", "Price USD": 2540.618971408493}',
+              '{"Rank": 2, "Symbol": "BTC", "Price USD": 42863.717593629444}']
+    third = second[:1] + ['{"Rank": 2, "Symbol": "SOL", "Price USD": 91.67929509303363}']
+    stored = {rows_key(1706868720): [row.encode() for row in keyframe],
+              delta_key(1706868780): encode_delta(1706868720, compute_delta(keyframe, second)),
+              delta_key(1706868840): encode_delta(1706868780, compute_delta(second, third))}
+    redis_mock = AsyncMock()
+    redis_mock.lrange.side_effect = lambda key, start, stop: stored.get(key, [])[start:None if stop == -1 else stop + 1]
+    redis_mock.get.side_effect = lambda key: stored.get(key)
+    redis_mock.mget.side_effect = lambda *keys: [stored.get(key) for key in keys]
+
+    assert await read_snapshot_rows(redis_mock, 1706868840) == third
+    # The whole chain is read with one MGET
+    redis_mock.mget.assert_awaited_once()
+    assert await read_snapshot_rows(redis_mock, 1706868780, 1) == second[:1]
+
+    # Missing keyframe
+    del stored[rows_key(1706868720)]
+    assert await read_snapshot_rows(redis_mock, 1706868840) is None
+
+
+@pytest.mark.asyncio
+async def test_read_snapshot_rows_delta_small_limit_decodes_top_of_keyframe():
+    symbols = [f"C{index}" for index in range(1000)]
+    names = ["Rank", "Symbol", "Price USD"]
+    keyframe = render_rows(names, [range(1, 1001), symbols, [float(index) for index in range(1000)]])
+    # Every minute the second asset moves to the top and the price of the last one changes
+    snapshots = [keyframe]
+    for minute in range(1, 4):
+        previous = [row_body(row) for row in snapshots[-1]]
+        bodies = [previous[1], previous[0]] + previous[2:-1] + [f', "Symbol": "C999", "Price USD": {1000.0 + minute}}}']
+        snapshots.append([f'{{"Rank": {rank}{body}' for rank, body in enumerate(bodies, start=1)])
+    stored = {binary_key(1706868720): encode_snapshot(names, [range(1, 1001), symbols, [float(index) for index in range(1000)]])}
+    for minute in range(1, 4):
+        stored[delta_key(1706868720 + 60 * minute)] = encode_delta(1706868720 + 60 * (minute - 1),
+                                                                  compute_delta(snapshots[minute - 1], snapshots[minute]))
+    redis_mock = AsyncMock()
+    redis_mock.lrange.return_value = []
+    redis_mock.get.side_effect = lambda key: stored.get(key)
+    redis_mock.mget.side_effect = lambda *keys: [stored.get(key) for key in keys]
+
+    with patch("common.snapshot_store.decode_snapshot", wraps=decode_snapshot) as decode:
+        assert await read_snapshot_rows(redis_mock, 1706868900, 2) == snapshots[3][:2]
+        # Only the top rows of the keyframe the top 2 rows are copied from
+        assert decode.call_args.args[1] == 2
+
+        assert await read_snapshot_rows(redis_mock, 1706868900) == snapshots[3]
+        assert decode.call_args.args[1] is None
+
+
+@pytest.mark.asyncio
+async def test_read_snapshot_rows_binary_keyframe():
+    names, columns = ["Rank", "Symbol", "Price USD"], [range(1, 3), ["BTC", "ETH"], [row["Price USD"] for row in ROWS]]
+    redis_mock = AsyncMock()
+    redis_mock.lrange.return_value = []
+    redis_mock.get.side_effect = lambda key: encode_snapshot(names, columns) if key == binary_key(1706868720) else None
+
+    assert await read_snapshot_rows(redis_mock, 1706868720, 1) == encode_rows(ROWS[:1])
+    assert await read_snapshot_rows(redis_mock, 1706868720) == encode_rows(ROWS)
+
+
+@pytest.mark.asyncio
+async def test_read_snapshots_rows():
+    redis_mock = MagicMock()
+    full_rows = [json.dumps(row) for row in ROWS]
+    delta_1 = encode_delta(1706868720, compute_delta(full_rows, full_rows[::-1]))
+    delta_2 = encode_delta(1706868780, compute_delta(full_rows[::-1], full_rows[1:]))
+    keyframe = encode_snapshot(["Rank", "Symbol", "Price USD"],
+                               [range(1, 3), ["BTC", "ETH"], [42863.717593629444, 2540.618971408493]])
+    redis_mock.pipeline.return_value.execute = AsyncMock(return_value=[
+        [], [], [], [], [keyframe, None, None, None], [None, delta_2, delta_1, None]])
+    redis_mock.lrange = AsyncMock(return_value=[])
+    redis_mock.get = AsyncMock(side_effect=lambda key: keyframe if key == binary_key(1706868720) else None)
+    redis_mock.mget = AsyncMock(side_effect=lambda *keys: [None] * len(keys))
+
+    snapshots = await read_snapshots_rows(redis_mock, [1706868720, 1706868840, 1706868780, 1706868900], 1)
+
+    # Every layout read with a single pipeline, deltas rebuilt from the binary keyframe
+    pipeline = redis_mock.pipeline.return_value
+    pipeline.lrange.assert_any_call(rows_key(1706868780), 0, 0)
+    pipeline.mget.assert_any_call(*[delta_key(timestamp) for timestamp in (1706868720, 1706868840, 1706868780, 1706868900)])
+    assert snapshots[1706868720] == full_rows[:1]
+    assert snapshots[1706868780] == [json.dumps(dict(ROWS[1], Rank=1))]
+    assert snapshots[1706868840] == [json.dumps(dict(ROWS[1], Rank=1))]
+    assert snapshots[1706868900] is None
+
+
+@pytest.mark.asyncio
+async def test_iter_snapshot_rows_chunks():
+    redis_mock = AsyncMock()
+    stored_rows = [json.dumps(dict(ROWS[0], Rank=rank)).encode() for rank in range(1, 6)]
+    redis_mock.lrange.side_effect = lambda key, start, stop: stored_rows[start:stop + 1]
+    redis_mock.mget.side_effect = lambda *keys: [None] * len(keys)
+
+    chunks = [chunk async for chunk in iter_snapshot_rows(redis_mock, 1706868720, 4, chunk_size=3)]
+
+    assert chunks == [stored_rows[:3], stored_rows[3:4]]
+    assert [call.args[1:] for call in redis_mock.lrange.await_args_list] == [(0, 2), (3, 3)]
+
+    # Binary snapshot decoded chunk by chunk
+    redis_mock.lrange.side_effect = None
+    redis_mock.lrange.return_value = []
+    redis_mock.get.side_effect = lambda key: encode_snapshot(["Rank", "Symbol"], [range(1, 4), ["BTC", "ETH", "SOL"]]) \
+        if key == binary_key(1706868720) else None
+    chunks = [chunk async for chunk in iter_snapshot_rows(redis_mock, 1706868720, chunk_size=2)]
+    assert chunks == [['{"Rank": 1, "Symbol": "BTC"}', '{"Rank": 2, "Symbol": "ETH"}'], ['{"Rank": 3, "Symbol": "SOL"}']]
+
+    # Missing snapshot
+    redis_mock.get.side_effect = None
+    redis_mock.get.return_value = None
+    assert [chunk async for chunk in iter_snapshot_rows(redis_mock, 1706868720, chunk_size=2)] == []
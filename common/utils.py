@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta, timezone
 import json
 import logging.config
-import pandas as pd
+from common.merge_engine import merge_encoded_rows
 
 
 def unix_timestamp_to_iso(unix_timestamp):
@@ -145,24 +145,31 @@ def print_df(df):
         print_df(df)
         ```
     """
+    # Debug helper only, pandas is not needed by the services
+    import pandas as pd
+
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', 1000)  # Set a large width to avoid line breaks
     print(df.head(20))
 
 
-def merge_data(*data_list):
+def merge_data(*data_list, **options):
     """
-    Merge data from multiple sources into a single DataFrame.
+    Merge data from multiple sources into a single list joined on `Id` and `Symbol`.
+
+    The first source sets the order of the results, a `Rank` column is added and `Id` is dropped.
+    See `common.merge_engine` for the join details.
 
     Parameters:
-        - `*data_list`: Variable number of DataFrames to be merged.
+        - `*data_list`: Variable number of row lists (list of dictionaries) to be merged.
+        - `**options`: Join options (`on`, `how`, `suffixes`, `drop`), see `common.merge_engine.merge_columns`.
 
     Returns:
-        - str: JSON-formatted string representing the merged DataFrame.
+        - str: JSON-formatted string representing the merged data.
 
     Example:
         ```python
-        merged_json = merge_data(df1, df2, df3)
+        merged_json = merge_data(rank_rows, price_rows)
         print(merged_json)
         ```
     """
@@ -170,42 +177,7 @@ def merge_data(*data_list):
         logging.info(f"No data to merge")
         return {}
 
-    logging.info(f"Merging data from {len(data_list)} sources")
-    
-    # Convert each element in data_list to a DataFrame
-    data_frames = [pd.DataFrame(data) for data in data_list]
-
-    all_float_columns = []
-    for df in data_frames:
-        df['Id'] = df['Id'].astype('Int64') # Assure Id in all tables is int64 (NaN is float by default)
-        float_columns = df.select_dtypes(include='float64').columns
-        if float_columns.size > 0:
-            all_float_columns.append(*float_columns)
-        df[float_columns] = df[float_columns].astype(str) # Convert float to str to avoid to round values
-
-    # Merge DataFrames
-    merged_df = pd.merge(data_frames[0], data_frames[1], on=['Id', 'Symbol'], suffixes=('_df1', '_df2'))
-    for i in range(2, len(data_frames)):
-        merged_df = pd.merge(merged_df, data_frames[i], on=['Id', 'Symbol'], suffixes=(f'_df{i-1}', f'_df{i}')).astype(object)
-
-    merged_df = merged_df.drop('Id', axis=1)
-
-    # Add Rank
-    merged_df.index = pd.RangeIndex(start=1, stop=len(merged_df) + 1, name='Rank')
-    merged_df.reset_index(inplace=True)
-    result_json = merged_df.to_json(orient='records')
-
-    # Get floats converted to str back
-    data_list = json.loads(result_json)
-    for entry in data_list:
-        for target_key in all_float_columns:
-            if target_key in entry:
-                entry[target_key] = float(entry[target_key])
-
-    # Convert the list of dictionaries back to a JSON string
-    updated_json_data = json.dumps(data_list)
-
-    return updated_json_data
+    return "[" + ", ".join(merge_encoded_rows(*data_list, **options)) + "]"
 
 
 def unpack_message(message):
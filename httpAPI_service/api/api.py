@@ -1,19 +1,275 @@
 import json
 import logging
 import asyncio
+import time
 from datetime import datetime
-from fastapi import Query
+from typing import List
+from fastapi import Header, Query
 from fastapi import HTTPException
-from fastapi.responses import PlainTextResponse
-from common.utils import round_to_previous_minute, json_to_csv, merge_data, rounddown_time_to_minute
-from common.redis_utils import save_to_redis
+from fastapi.responses import Response, StreamingResponse
+from common.utils import round_to_previous_minute, rounddown_time_to_minute
+from common.merge_engine import merge_encoded_rows, merge_options, merge_packed_rows, render_rows
+from common.snapshot_codec import decode_snapshot
+from common.snapshot import RenderedSnapshot, stream_csv_rows, stream_json_rows, stream_ndjson_rows
+from common.snapshot_store import (save_snapshot, read_snapshot_rows, read_snapshots_rows, find_snapshot, find_snapshots,
+                                   iter_snapshot_rows, iter_rows_chunks)
+from common.series_store import read_series, render_series
+from common.refresher import refresh_snapshot
 from httpAPI_service.app import app
+from httpAPI_service.api.http_cache import cache_headers, etag_matches
+
+
+async def build_snapshot(redis_key):
+    """
+    Fetch data from the external APIs, merge it and save it to Redis.
+
+    Parameters:
+        - `redis_key` (int): Minute timestamp used as key for the merged data.
+
+    Returns:
+        - list: JSON encoded rows of the merged data.
+    """
+    logging.info(f"Feching data from external apis")
+
+    executor = app.state.executor
+    # Packed rows (tuples) are passed to the executor rather than dictionaries
+    price_result_task  = asyncio.create_task(app.state.price_fetcher.get_data(packed=executor is not None))
+    rank_result_task  = asyncio.create_task(app.state.rank_fetcher.get_data(packed=executor is not None))
+
+    price_result, rank_result = await asyncio.gather(price_result_task, rank_result_task)
+
+    options = merge_options(app.state.config.get("merge", {}), ["rank", "price"])
+    if executor is None:
+        encoded_rows = merge_encoded_rows(rank_result, price_result, **options)
+    else:
+        merged = await executor.run(merge_packed_rows, [rank_result, price_result], options)
+        encoded_rows = merged.split("\n") if merged else []
+    await save_snapshot(app.state.redis, redis_key, encoded_rows)
+    return encoded_rows
+
+
+def lookup_tolerance(tolerance):
+    """
+    Get the tolerance of a snapshot lookup: the requested one or the configured default, bounded by the configured max.
+
+    Parameters:
+        - `tolerance` (int): Requested tolerance (seconds), None for the default.
+
+    Returns:
+        - int: The tolerance to use.
+    """
+    lookup_config = app.state.config.get("snapshot_lookup", {})
+    if tolerance is None:
+        tolerance = lookup_config.get("default_tolerance", 0)
+    return min(tolerance, lookup_config.get("max_tolerance", tolerance))
+
+
+async def read_archive_rows(redis_key, tolerance, limit):
+    """
+    Read the top `limit` rows of a snapshot from the on-disk minute archive, in a thread.
+
+    Parameters:
+        - `redis_key` (int): Requested minute timestamp.
+        - `tolerance` (int): Max seconds the snapshot may be older than `redis_key`.
+        - `limit` (int): Number of rows to read.
+
+    Returns:
+        - tuple: Timestamp of the archived snapshot (int) and its JSON encoded rows (list), or
+          None if it is not archived or there is no archive.
+    """
+    if app.state.archive is None:
+        return None
+    timestamp = await asyncio.to_thread(app.state.archive.find, redis_key, tolerance)
+    if timestamp is None:
+        return None
+    archived = await asyncio.to_thread(app.state.archive.read, timestamp, limit)
+    if archived is None:
+        # Deleted by the retention since it was found
+        return None
+    return timestamp, await asyncio.to_thread(render_rows, *archived)
+
+
+async def read_history_rows(redis_key, tolerance):
+    """
+    Read a snapshot rolled up out of Redis to the on-disk history store (hourly or daily tier).
+
+    Parameters:
+        - `redis_key` (int): Requested minute timestamp.
+        - `tolerance` (int): Max seconds the tier snapshot may be older than `redis_key`, bounded by the tier span if None.
+
+    Returns:
+        - tuple: Timestamp of the tier snapshot covering the request (int) and its JSON encoded rows
+          (list), or None if no tier covers it within the tolerance or there is no history store.
+    """
+    if app.state.history is None:
+        return None
+    found = await asyncio.to_thread(app.state.history.find, redis_key, tolerance)
+    if found is None:
+        return None
+    timestamp, data = found
+    return timestamp, render_rows(*decode_snapshot(data))
+
+# Background revalidations, referenced until they are done
+background_tasks = set()
+
+
+async def read_stale_rows(redis_key, limit):
+    """
+    Get the latest snapshot before the current minute while the current one is not stored yet
+    (stale-while-revalidate), if it is at most `refresher.stale_max_age` seconds old (config).
+
+    Once `refresher.build_delay` seconds into the minute, the current snapshot is built in the
+    background (shared with the refresher and the other requests), without waiting for it.
+
+    Parameters:
+        - `redis_key` (int): Current minute timestamp.
+        - `limit` (int): Number of rows requested.
+
+    Returns:
+        - tuple: Timestamp of the stale snapshot (int), its JSON encoded rows (list) and True if they
+          are all the rows of the snapshot. None if there is no recent enough snapshot or it is disabled.
+    """
+    refresher_config = app.state.config.get("refresher", {})
+    stale_max_age = refresher_config.get("stale_max_age")
+    if not stale_max_age or stale_max_age < 60:
+        return None
+    stale_key = await find_snapshot(app.state.redis, redis_key - 60, stale_max_age - 60)
+    ranking_data = await read_snapshot_rows(app.state.redis, stale_key, limit) if stale_key is not None else None
+    if ranking_data is None:
+        return None
+
+    if time.time() - redis_key >= refresher_config.get("build_delay", 15):
+        task = asyncio.ensure_future(refresh_snapshot(app.state.redis, app.state.single_flight, build_snapshot, redis_key))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    logging.info(f"Snapshot {redis_key} not stored yet, returning stale data for {stale_key}")
+    return stale_key, ranking_data, len(ranking_data) < limit
+
+
+async def read_missing_rows(redis_key, datetime, tolerance, limit, tier_tolerance=None):
+    """
+    Get the rows of a snapshot not stored in Redis: built from the external APIs for the current
+    minute, read from the archive or the hourly/daily tiers for a past one.
+
+    Parameters:
+        - `redis_key` (int): Minute timestamp of the snapshot.
+        - `datetime` (datetime): Requested timestamp, None for the current minute.
+        - `tolerance` (int): Max seconds an archived snapshot may be older than `redis_key`.
+        - `limit` (int): Number of rows requested.
+        - `tier_tolerance` (int, optional): Max seconds an hourly/daily tier snapshot may be older than
+          `redis_key`, only set by an explicit request `tolerance`. Bounded by the tier span if None.
+
+    Returns:
+        - tuple: Timestamp of the snapshot found (int), its JSON encoded rows (list) and True if
+          they are all the rows of the snapshot.
+
+    Raises:
+        - HTTPException: 404 if there is no data for `datetime`.
+    """
+    if not datetime:
+        stale = await read_stale_rows(redis_key, limit)
+        if stale is not None:
+            return stale
+        # Concurrent misses for the same minute share a single fetch and merge
+        ranking_data = await app.state.single_flight.do(redis_key,
+                                                        lambda: build_snapshot(redis_key),
+                                                        lambda: read_snapshot_rows(app.state.redis, redis_key))
+        if ranking_data is not None:
+            return redis_key, ranking_data, True
+    else:
+        # Older than the minute snapshots kept in Redis, served from the archive or the hourly/daily tiers
+        archived = await read_archive_rows(redis_key, tolerance, limit)
+        if archived is not None:
+            logging.info(f"Returning archived data for {archived[0]}")
+            return archived[0], archived[1], len(archived[1]) < limit
+        history = await read_history_rows(redis_key, tier_tolerance)
+        if history is not None:
+            logging.info(f"Returning history data for {history[0]}")
+            return history[0], history[1], True
+
+    logging.error(f"No data for the specified datetime : {datetime} ")
+    raise HTTPException(status_code=404, detail="Data not found for the specified timestamp")
+
+
+async def prepend_chunk(first_chunk, chunks):
+    """
+    Yield a chunk already read, then the remaining chunks.
+    """
+    yield first_chunk
+    async for chunk in chunks:
+        yield chunk
+
+
+def response_headers(redis_key, limit, format, requested_key):
+    """
+    Get the headers of a snapshot response: its timestamp plus the HTTP caching headers (see `cache_headers`).
+
+    Parameters:
+        - `redis_key` (int): Minute timestamp of the snapshot returned.
+        - `limit` (int): Number of rows requested.
+        - `format` (str): Response format.
+        - `requested_key` (int): Requested minute timestamp, None for the current minute.
+
+    Returns:
+        - dict: Response headers, with `X-Snapshot-Staleness` (seconds behind the current minute)
+          when a stale snapshot is returned for the current minute.
+    """
+    headers = {"X-Snapshot-Timestamp": str(redis_key)}
+    headers.update(cache_headers(redis_key, limit, format.upper(), requested_key, time.time(),
+                                 app.state.config.get("http_cache", {})))
+    current_key = rounddown_time_to_minute()
+    if requested_key is None and redis_key < current_key:
+        # Stale snapshot served while the current one is built
+        headers["X-Snapshot-Staleness"] = str(current_key - redis_key)
+        headers["Cache-Control"] = "no-cache"
+    return headers
+
+
+async def stream_top_crypto_list(redis_key, datetime, tolerance, limit, format, requested_key=None, if_none_match=None,
+                                 tier_tolerance=None):
+    """
+    Stream the top `limit` rows of a snapshot as they are read from Redis (see `iter_snapshot_rows`).
+
+    Parameters:
+        - `redis_key` (int): Minute timestamp of the snapshot.
+        - `datetime` (datetime): Requested timestamp, None for the current minute.
+        - `tolerance` (int): Max seconds an archived snapshot may be older than `redis_key`.
+        - `limit` (int): Number of rows.
+        - `format` (str): `JSON`, `CSV` or `NDJSON`.
+        - `requested_key` (int, optional): Requested minute timestamp, None for the current minute.
+        - `if_none_match` (str, optional): `If-None-Match` request header.
+        - `tier_tolerance` (int, optional): Max seconds an hourly/daily tier snapshot may be older (see `read_missing_rows`).
+
+    Returns:
+        - StreamingResponse: The rows, one chunk of `streaming.chunk_size` (config) rows at a time.
+    """
+    chunk_size = app.state.config.get("streaming", {}).get("chunk_size", 500)
+    chunks = iter_snapshot_rows(app.state.redis, redis_key, limit, chunk_size)
+    try:
+        # The first chunk is read before responding, so a missing snapshot is still a 404
+        chunks = prepend_chunk(await chunks.__anext__(), chunks)
+    except StopAsyncIteration:
+        redis_key, ranking_data, _ = await read_missing_rows(redis_key, datetime, tolerance, limit, tier_tolerance)
+        chunks = iter_rows_chunks(ranking_data[:limit], chunk_size)
+
+    headers = response_headers(redis_key, limit, format, requested_key)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if format == 'CSV':
+        return StreamingResponse(stream_csv_rows(chunks), media_type="application/csv", headers=headers)
+    if format == 'NDJSON':
+        return StreamingResponse(stream_ndjson_rows(chunks), media_type="application/x-ndjson", headers=headers)
+    return StreamingResponse(stream_json_rows(chunks), media_type="application/json", headers=headers)
 
 @app.get("/")
 async def getTopCryptoList(
     limit: int = Query(..., title="The number of items to retrieve", ge=1),
     datetime: datetime = Query(None, title="The timestamp of the request", description="Optional timestamp parameter"),
-    format: str = Query("JSON", title="The format of the response", description="Optional response format parameter (JSON or CSV)")
+    format: str = Query("JSON", title="The format of the response", description="Optional response format parameter (JSON or CSV)"),
+    tolerance: int = Query(None, title="Max age of the snapshot returned", ge=0,
+                           description="Optional max seconds the snapshot returned may be older than datetime"),
+    stream: bool = Query(False, title="Stream the response", description="Optional, rows sent in chunks as they are read"),
+    if_none_match: str = Header(None)
 ):
     """
     Get the top cryptocurrencies based on specified parameters.
@@ -22,7 +278,14 @@ async def getTopCryptoList(
         - `limit` (int): The number of items to retrieve. Must be greater than or equal to 1.
         - `timestamp` (int, optional): The timestamp of the request. Optional parameter.
         - `format` (str, optional): The format of the response. Optional parameter.
-          Possible values: "JSON" (default) or "CSV".
+          Possible values: "JSON" (default), "CSV" or "NDJSON" (always streamed).
+        - `tolerance` (int, optional): When `datetime` is set, the latest snapshot at or before it
+          is returned if it is at most `tolerance` seconds older. Default value from the config. An hourly or
+          daily tier snapshot is bounded by its tier span, and by `tolerance` only when it is set.
+        - `stream` (bool, optional): Send the rows in chunks as they are read from the stored
+          snapshot, without the in-process cache, so memory does not grow with `limit`.
+        - `if_none_match` (str, optional): `If-None-Match` header, 304 Not Modified if it matches
+          the ETag of the response (snapshot timestamp, `limit` and format) of an existing snapshot.
 
     Returns:
         - Response: A list of top cryptocurrencies based on the specified parameters.
@@ -48,41 +311,190 @@ async def getTopCryptoList(
 
         # Use timestamp as id/key for messages and db/cache
         if datetime:
-            # Check in database/cache
-            request_id = round_to_previous_minute(int(datetime.timestamp()), unix_format=True)
-            ranking_data = await app.state.redis.get(request_id)
+            redis_key = round_to_previous_minute(int(datetime.timestamp()), unix_format=True)
+            requested_key = redis_key
+            # Tier snapshots are up to one tier span older than the request, only an explicit tolerance bounds them
+            tier_tolerance = lookup_tolerance(tolerance) if tolerance is not None else None
+            tolerance = lookup_tolerance(tolerance)
+            snapshot_found = app.state.snapshot_cache.get(redis_key) is not None
+            if not snapshot_found:
+                # Resolve the latest available snapshot at or before the requested minute
+                resolved_key = await find_snapshot(app.state.redis, redis_key, tolerance)
+                if resolved_key is not None:
+                    redis_key = resolved_key
+                    snapshot_found = True
         else:
-            # Round current time to the minute and check for cached value
+            # Round current time to the minute
             redis_key = rounddown_time_to_minute()
-            ranking_data = await app.state.redis.get(redis_key)
+            requested_key = None
+            tier_tolerance = None
+            snapshot_found = app.state.snapshot_cache.get(redis_key) is not None
 
-            if ranking_data is None: # Not in cache
-                logging.info(f"Feching data from external apis")
+        # Snapshots are immutable, a client holding an existing one needs no body
+        headers = response_headers(redis_key, limit, format, requested_key)
+        if snapshot_found and etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
 
-                price_result_task  = asyncio.create_task(app.state.price_fetcher.get_data())
-                rank_result_task  = asyncio.create_task(app.state.rank_fetcher.get_data())
+        if stream or format.upper() == 'NDJSON':
+            return await stream_top_crypto_list(redis_key, datetime, tolerance, limit, format.upper(),
+                                                requested_key, if_none_match, tier_tolerance)
 
-                price_result, rank_result = await asyncio.gather(price_result_task, rank_result_task)
+        # Check in process cache, then database/cache
+        snapshot = app.state.snapshot_cache.get(redis_key)
+        if snapshot is None or not snapshot.covers(limit):
+            # Only the top `limit` rows are read
+            ranking_data = await read_snapshot_rows(app.state.redis, redis_key, limit)
+            complete = ranking_data is not None and len(ranking_data) < limit
 
-                ranking_data = merge_data(rank_result, price_result)
-                await save_to_redis(app.state.redis, redis_key, ranking_data)
+            if ranking_data is None: # Not in cache
+                redis_key, ranking_data, complete = await read_missing_rows(redis_key, datetime, tolerance, limit,
+                                                                            tier_tolerance)
             else:
                 logging.info(f"Returning cached data for {redis_key}")
 
-        if ranking_data is None: # Not in cache or "latest" resquest
-            logging.error(f"No data for the specified datetime : {datetime} ")
-            raise HTTPException(status_code=404, detail="Data not found for the specified timestamp")
+            snapshot = RenderedSnapshot.from_encoded_rows(ranking_data, complete)
+            app.state.snapshot_cache.put(redis_key, snapshot, snapshot.size)
 
-        # Output formating
-        ranking_data = json.loads(ranking_data)
-        ranking_data = ranking_data[:limit]
+        # Output formating, payloads are pre-rendered once per snapshot
+        headers = response_headers(redis_key, limit, format, requested_key)
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
         if format.upper() == 'CSV':
-            csv = json_to_csv(ranking_data)
-            return PlainTextResponse(content=csv, media_type="application/csv")
+            if not snapshot.csv_rendered:
+                # Rendered on the first CSV request only, off the event loop with an executor
+                await snapshot.render_csv(app.state.executor)
+                app.state.snapshot_cache.put(redis_key, snapshot, snapshot.size)
+            return Response(content=snapshot.csv(limit), media_type="application/csv", headers=headers)
 
-        return ranking_data
+        return Response(content=snapshot.json(limit), media_type="application/json", headers=headers)
 
     except json.JSONDecodeError as e:
         logging.error(f"Unexpected UTF-8 BOM (decode using utf-8-sig) - Value: {ranking_data}")
     except TypeError as e:
-        logging.error(f'The JSON object must be str, bytes or bytearray')
\ No newline at end of file
+        logging.error(f'The JSON object must be str, bytes or bytearray')
+
+
+@app.get("/series")
+async def getAssetSeries(
+    symbols: str = Query(..., title="Comma separated symbols of the assets"),
+    start: datetime = Query(None, title="Start of the time range", description="Optional, `end` minus the default range if missing"),
+    end: datetime = Query(None, title="End of the time range", description="Optional, current time if missing")
+):
+    """
+    Get the price and rank history of one or more assets over a time range.
+
+    Points are read from the per asset time series maintained by the merge service, so
+    latency depends on the number of points returned and not on the number of assets.
+
+    Parameters:
+        - `symbols` (str): Comma separated symbols, e.g. `BTC,ETH`. At most `series.max_symbols` (config).
+        - `start` (datetime, optional): Start of the time range, included.
+        - `end` (datetime, optional): End of the time range, included.
+
+    Returns:
+        - Response: JSON object with the points of every symbol in timestamp order.
+
+    Example:
+        ```
+        /series?symbols=BTC,ETH&start=2024-02-01T00:00:00&end=2024-02-02T00:00:00
+        ```
+    """
+    if app.state.redis is None:
+        logging.error(f"No redis connection available")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    series_config = app.state.config.get("series", {})
+    symbol_list = list(dict.fromkeys(symbol.strip() for symbol in symbols.split(",") if symbol.strip()))
+    if not symbol_list or len(symbol_list) > series_config.get("max_symbols", 50):
+        raise HTTPException(status_code=422, detail=f"Between 1 and {series_config.get('max_symbols', 50)} symbols expected")
+
+    end_timestamp = int(end.timestamp()) if end else int(time.time())
+    start_timestamp = int(start.timestamp()) if start else end_timestamp - series_config.get("default_range", 86400)
+    if start_timestamp > end_timestamp:
+        raise HTTPException(status_code=422, detail="start must not be after end")
+
+    series = await read_series(app.state.redis, symbol_list, start_timestamp, end_timestamp)
+    return Response(content=render_series(series), media_type="application/json")
+
+
+async def stream_batch(redis_keys, limit, tolerance, chunk_size):
+    """
+    Yield the NDJSON lines of a batch query, resolving and reading the snapshots chunk by chunk.
+
+    Parameters:
+        - `redis_keys` (list): Requested minute timestamps.
+        - `limit` (int): Number of rows per snapshot.
+        - `tolerance` (int): Max seconds a snapshot may be older than its requested timestamp.
+        - `chunk_size` (int): Timestamps resolved and read per round trip.
+
+    Yields:
+        - str: One JSON object per requested timestamp, `{"timestamp", "snapshot", "rows"}`.
+    """
+    for start in range(0, len(redis_keys), chunk_size):
+        chunk = redis_keys[start:start + chunk_size]
+        found = await find_snapshots(app.state.redis, chunk, tolerance)
+        # Snapshots missing in the index may still be stored in the legacy layout
+        resolved = [snapshot_key if snapshot_key is not None else redis_key for redis_key, snapshot_key in zip(chunk, found)]
+        snapshots = await read_snapshots_rows(app.state.redis, sorted(set(resolved)), limit)
+        lines = []
+        for redis_key, snapshot_key in zip(chunk, resolved):
+            rows = snapshots.get(snapshot_key)
+            if rows is None:
+                lines.append(f'{{"timestamp": {redis_key}, "snapshot": null, "rows": null}}\n')
+            else:
+                encoded_rows = ", ".join(row.decode() if isinstance(row, bytes) else row for row in rows)
+                lines.append(f'{{"timestamp": {redis_key}, "snapshot": {snapshot_key}, "rows": [{encoded_rows}]}}\n')
+        yield "".join(lines)
+
+
+@app.get("/batch")
+async def getTopCryptoListBatch(
+    limit: int = Query(..., title="The number of items to retrieve per timestamp", ge=1),
+    datetimes: List[datetime] = Query(None, title="Timestamps of the snapshots", description="Optional, repeat it for every timestamp"),
+    start: datetime = Query(None, title="Start of the time range", description="Optional, instead of datetimes"),
+    end: datetime = Query(None, title="End of the time range", description="Optional, instead of datetimes"),
+    step: int = Query(60, title="Seconds between the timestamps of the time range", ge=60),
+    tolerance: int = Query(None, title="Max age of the snapshots returned", ge=0,
+                           description="Optional max seconds a snapshot returned may be older than its timestamp")
+):
+    """
+    Get the top cryptocurrencies at many timestamps in a single request.
+
+    Timestamps are given as a list (`datetimes`) or as a range (`start`, `end` and `step`).
+    Snapshots are resolved and read with pipelined Redis commands, a chunk of timestamps
+    per round trip, and streamed back as NDJSON as soon as every chunk is read.
+
+    Parameters:
+        - `limit` (int): The number of items to retrieve per timestamp.
+        - `datetimes` (list, optional): Timestamps of the snapshots.
+        - `start` (datetime, optional): First timestamp of the range.
+        - `end` (datetime, optional): Last timestamp of the range, included.
+        - `step` (int, optional): Seconds between two timestamps of the range. 60 by default.
+        - `tolerance` (int, optional): Max seconds a snapshot may be older than its timestamp. Default value from the config.
+
+    Returns:
+        - StreamingResponse: One line per timestamp, `{"timestamp": ..., "snapshot": ..., "rows": [...]}`,
+          with null snapshot and rows when there is no snapshot within the tolerance.
+
+    Example:
+        ```
+        /batch?limit=10&start=2024-02-01T12:00:00&end=2024-02-01T13:00:00&step=300
+        ```
+    """
+    if app.state.redis is None:
+        logging.error(f"No redis connection available")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    batch_config = app.state.config.get("batch", {})
+    if datetimes:
+        redis_keys = [round_to_previous_minute(int(timestamp.timestamp()), unix_format=True) for timestamp in datetimes]
+    elif start and end and start <= end:
+        first_key = round_to_previous_minute(int(start.timestamp()), unix_format=True)
+        redis_keys = [key - key % 60 for key in range(first_key, int(end.timestamp()) + 1, step)]
+    else:
+        raise HTTPException(status_code=422, detail="datetimes or a start not after end expected")
+    if len(redis_keys) > batch_config.get("max_timestamps", 1440):
+        raise HTTPException(status_code=422, detail=f"At most {batch_config.get('max_timestamps', 1440)} timestamps per request")
+
+    return StreamingResponse(stream_batch(redis_keys, limit, lookup_tolerance(tolerance), batch_config.get("chunk_size", 60)),
+                             media_type="application/x-ndjson")
@@ -0,0 +1,81 @@
+from email.utils import formatdate
+
+DEFAULT_HISTORICAL_MAX_AGE = 31536000
+DEFAULT_SETTLE_TIME = 120
+
+
+def snapshot_etag(snapshot_key, limit, format, weak=False):
+    """
+    ETag of a snapshot response. Snapshots are immutable once they settle, so the snapshot key,
+    `limit` and format identify the payload.
+
+    Parameters:
+        - `snapshot_key` (int): Minute timestamp of the snapshot returned.
+        - `limit` (int): Number of rows requested.
+        - `format` (str): Response format.
+        - `weak` (bool): True for a snapshot that may still be written again (e.g. a current minute
+          snapshot built by the API, then stored by the merger), equivalent but not byte identical.
+
+    Returns:
+        - str: The quoted ETag, e.g. `"1706791980-10-json"`, or `W/"1706791980-10-json"` if weak.
+    """
+    return f'{"W/" if weak else ""}"{snapshot_key}-{limit}-{format.lower()}"'
+
+
+def opaque_tag(etag):
+    """
+    Get an ETag without its weak indicator.
+    """
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an `If-None-Match` request header against the ETag of the response (weak comparison).
+
+    Parameters:
+        - `if_none_match` (str): Header value, a list of ETags or `*`. None if missing.
+        - `etag` (str): ETag of the response.
+
+    Returns:
+        - bool: True if the client copy is still valid (304 Not Modified).
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or opaque_tag(etag) in map(opaque_tag, candidates)
+
+
+def cache_headers(snapshot_key, limit, format, requested_key, now, http_cache_config):
+    """
+    Get the validators and the `Cache-Control` header of a snapshot response.
+
+    Requests for a minute older than `settle_time` seconds always get the same snapshot, they
+    are cached for `historical_max_age` seconds. Requests for the current minute are cached
+    until the minute ends, and recent `datetime` requests must be revalidated (the snapshot
+    they resolve to may still be written). The ETag of a snapshot newer than `settle_time`
+    seconds is weak, it may be written again with the same key.
+
+    Parameters:
+        - `snapshot_key` (int): Minute timestamp of the snapshot returned.
+        - `limit` (int): Number of rows requested.
+        - `format` (str): Response format.
+        - `requested_key` (int): Requested minute timestamp, None for the current minute.
+        - `now` (float): Current timestamp.
+        - `http_cache_config` (dict): `http_cache` configuration block, `historical_max_age` and `settle_time`.
+
+    Returns:
+        - dict: `ETag`, `Last-Modified` and `Cache-Control` headers.
+    """
+    settle_time = http_cache_config.get("settle_time", DEFAULT_SETTLE_TIME)
+    if requested_key is None:
+        cache_control = f"public, max-age={max(1, 60 - int(now) % 60)}"
+    elif requested_key <= now - settle_time:
+        cache_control = f"public, max-age={http_cache_config.get('historical_max_age', DEFAULT_HISTORICAL_MAX_AGE)}, immutable"
+    else:
+        cache_control = "no-cache"
+    return {
+        "ETag": snapshot_etag(snapshot_key, limit, format, snapshot_key > now - settle_time),
+        "Last-Modified": formatdate(snapshot_key, usegmt=True),
+        "Cache-Control": cache_control,
+    }
@@ -4,10 +4,17 @@ import logging
 import logging.config
 import yaml
 import json
+import asyncio
 from tenacity import RetryError
 from shared.data_fetcher import DataFetcher
 from common.redis_utils import connect_to_redis
 from common.utils import load_config_from_json
+from common.history_store import HistoryStore
+from common.snapshot_archive import SnapshotArchive
+from common.single_flight import SingleFlight, RedisSingleFlight
+from common.snapshot_cache import SnapshotCache, invalidate_on_publish
+from common.refresher import run_refresher
+from common.executor import create_executor
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -35,6 +42,16 @@ async def lifespan(app: FastAPI):
     
     try:
         app.state.redis = None
+        app.state.config = {}
+        app.state.single_flight = SingleFlight()
+        app.state.snapshot_cache = SnapshotCache()
+        app.state.cache_invalidation_task = None
+        app.state.refresher_task = None
+        app.state.price_fetcher = None
+        app.state.rank_fetcher = None
+        app.state.history = None
+        app.state.archive = None
+        app.state.executor = None
         app.state.config = load_config_from_json('httpAPI_service/config.json')
 
         # Set up logging based on the configuration
@@ -44,11 +61,44 @@ async def lifespan(app: FastAPI):
         
         app.state.redis = await connect_to_redis(app.state.config["redis"])
 
+        # Coalesce cache misses of the API replicas using a Redis lock
+        single_flight_config = dict(app.state.config.get("single_flight", {}))
+        if single_flight_config.pop("redis_lock", False):
+            app.state.single_flight = RedisSingleFlight(app.state.redis, **single_flight_config)
+
+        # In process cache of decoded snapshots, invalidated when the merger writes a snapshot
+        cache_config = app.state.config.get("snapshot_cache", {})
+        app.state.snapshot_cache = SnapshotCache(cache_config.get("max_bytes", 64 * 1024 * 1024),
+                                                 cache_config.get("ttl", 3600))
+        if app.state.config["redis"].get("snapshot_channel"):
+            app.state.cache_invalidation_task = asyncio.create_task(
+                invalidate_on_publish(app.state.redis, app.state.config["redis"]["snapshot_channel"], app.state.snapshot_cache))
+
+        # On-disk hourly/daily snapshots rolled up by the merger, for requests older than Redis data
+        if app.state.config.get("history", {}).get("path"):
+            app.state.history = HistoryStore(app.state.config["history"]["path"])
+        # Append-only archive of every minute snapshot written by the merger, read through mmap
+        if app.state.config.get("archive", {}).get("path"):
+            app.state.archive = SnapshotArchive(app.state.config["archive"]["path"])
+
+        # Parsing, filtering and merging of cache misses off the event loop serving the requests
+        app.state.executor = create_executor(app.state.config.get("executor"))
+        if app.state.executor is not None:
+            await app.state.executor.start()
+
         # Setup data fetchers for direct data adquisition
         price_config = load_config_from_json('config/price_config.json')
         rank_config = load_config_from_json('config/rank_config.json')
-        app.state.price_fetcher = DataFetcher(price_config)
-        app.state.rank_fetcher = DataFetcher(rank_config)
+        app.state.price_fetcher = DataFetcher(price_config, executor=app.state.executor)
+        app.state.rank_fetcher = DataFetcher(rank_config, executor=app.state.executor)
+
+        # Build the current minute snapshot ahead of demand when the merge service is late
+        refresher_config = app.state.config.get("refresher", {})
+        if refresher_config.get("enabled"):
+            # Imported here, the api module imports this one
+            from httpAPI_service.api.api import build_snapshot
+            app.state.refresher_task = asyncio.create_task(
+                run_refresher(app.state.redis, app.state.single_flight, build_snapshot, refresher_config.get("build_delay", 15)))
 
 
     except json.decoder.JSONDecodeError as e:
@@ -62,6 +112,22 @@ async def lifespan(app: FastAPI):
     finally:
         yield
         # Shutdown (Close connections to msg broker, db, ...)
+        if app.state.cache_invalidation_task is not None:
+            app.state.cache_invalidation_task.cancel()
+            await app.state.cache_invalidation_task
+        if app.state.refresher_task is not None:
+            app.state.refresher_task.cancel()
+            await app.state.refresher_task
+        for fetcher in (app.state.price_fetcher, app.state.rank_fetcher):
+            if fetcher is not None:
+                await fetcher.close()
+        if app.state.executor is not None:
+            # Waits for the running calls, off the event loop
+            await asyncio.to_thread(app.state.executor.shutdown)
+        if app.state.history is not None:
+            app.state.history.close()
+        if app.state.archive is not None:
+            app.state.archive.close()
         if app.state.redis is not None:
             app.state.redis.close()
 
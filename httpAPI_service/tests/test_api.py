@@ -1,15 +1,47 @@
+import json
+import time
 import pytest
+from datetime import datetime, timezone
 from fastapi.testclient import TestClient
 from fastapi.exceptions import HTTPException
 from httpAPI_service.app import app
-from unittest.mock import AsyncMock, patch
+from common.single_flight import SingleFlight
+from common.snapshot_cache import SnapshotCache
+from common.executor import CpuExecutor
+from common.history_store import HistoryStore
+from common.snapshot_archive import SnapshotArchive
+from common.merge_engine import merge_columns
+from common.snapshot_codec import encode_snapshot
+from unittest.mock import AsyncMock, MagicMock, patch
+
+ROWS = [{"Rank": 1, "Symbol": "BTC", "Price": 42863.717593629444},
+        {"Rank": 2, "Symbol": "ETH", "Price": 2540.618971408493},
+        {"Rank": 3, "Symbol": "SOL", "Price": 91.67929509303363}]
+
+
+def lrange_rows(key, start, stop):
+    return [json.dumps(row).encode() for row in ROWS][start:None if stop == -1 else stop + 1]
+
+
+def set_app_state(redis_mock):
+    # Lifespan is not run by the test client, set the state it would set up
+    redis_mock.zrevrangebyscore.return_value = []
+    # No snapshot stored as a delta
+    redis_mock.mget.side_effect = lambda *keys: [None] * len(keys)
+    app.state.redis = redis_mock
+    app.state.config = {}
+    app.state.single_flight = SingleFlight()
+    app.state.snapshot_cache = SnapshotCache()
+    app.state.history = None
+    app.state.archive = None
+    app.state.executor = None
 
 
 @pytest.fixture
 def client_ready():
     redis_mock = AsyncMock()
-    redis_mock.get.return_value = '[{"Rank": 1, "Symbol": "BTC", "Price": 42863.717593629444}, {"Rank": 2, "Symbol": "ETH", "Price": 2540.618971408493}, {"Rank": 3, "Symbol": "SOL", "Price": 91.67929509303363}]'
-    app.state.redis = redis_mock
+    redis_mock.lrange.side_effect = lrange_rows
+    set_app_state(redis_mock)
     client = TestClient(app)
     return client
 
@@ -42,3 +74,294 @@ def test_get_top_crypto_list_no_redis():
         client = TestClient(app)
         response_500 = client.get("/?limit=7")
         assert response_500.status_code == 500
+
+
+def test_get_top_crypto_list_cache_miss():
+    redis_mock = AsyncMock()
+    redis_mock.lrange.return_value = []
+    redis_mock.get.return_value = None
+    redis_mock.multi_exec = MagicMock()
+    redis_mock.multi_exec.return_value.execute = AsyncMock()
+    set_app_state(redis_mock)
+    app.state.price_fetcher = AsyncMock()
+    app.state.price_fetcher.get_data.return_value = [{"Id": 1, "Symbol": "BTC", "Price USD": 42863.7}]
+    app.state.rank_fetcher = AsyncMock()
+    app.state.rank_fetcher.get_data.return_value = [{"Id": 1, "Symbol": "BTC"}]
+
+    response = TestClient(app).get("/?limit=1")
+
+    assert response.status_code == 200
+    assert response.json() == [{"Rank": 1, "Symbol": "BTC", "Price USD": 42863.7}]
+    redis_mock.multi_exec.return_value.rpush.assert_called_once_with(
+        redis_mock.lrange.call_args.args[0], '{"Rank": 1, "Symbol": "BTC", "Price USD": 42863.7}')
+    redis_mock.multi_exec.return_value.execute.assert_awaited_once()
+
+
+def test_get_top_crypto_list_served_from_snapshot_cache(client_ready):
+    response = client_ready.get("/?limit=2&datetime=2024-02-01T12:34:56")
+    response_cached = client_ready.get("/?limit=1&datetime=2024-02-01T12:34:10")
+
+    assert response.status_code == 200
+    assert [row["Symbol"] for row in response_cached.json()] == ["BTC"]
+    app.state.redis.lrange.assert_awaited_once()
+
+    # More rows than the cached ones are read again, then the whole snapshot is cached
+    assert len(client_ready.get("/?limit=5&datetime=2024-02-01T12:34:56").json()) == 3
+    assert len(client_ready.get("/?limit=4&datetime=2024-02-01T12:34:56").json()) == 3
+    assert app.state.redis.lrange.await_count == 2
+    assert app.state.redis.lrange.call_args.args[2] == 4
+
+
+def test_get_top_crypto_list_legacy_layout(client_ready):
+    app.state.redis.lrange.side_effect = None
+    app.state.redis.lrange.return_value = []
+    app.state.redis.get.side_effect = lambda key: None if ":" in str(key) else json.dumps(ROWS)
+
+    response = client_ready.get("/?limit=2&datetime=2024-02-01T12:34:56")
+
+    assert response.json() == ROWS[:2]
+
+
+def test_get_top_crypto_list_nearest_snapshot(client_ready):
+    app.state.config = {"snapshot_lookup": {"default_tolerance": 300, "max_tolerance": 600}}
+    app.state.redis.zrevrangebyscore.return_value = [b"1706791980"]
+
+    response = client_ready.get("/?limit=1&datetime=2024-02-01T12:55:00Z")
+
+    assert response.status_code == 200
+    assert response.headers["X-Snapshot-Timestamp"] == "1706791980"
+    app.state.redis.zrevrangebyscore.assert_awaited_once_with("snapshots:index", max=1706792100, min=1706791800,
+                                                              offset=0, count=1)
+    app.state.redis.lrange.assert_awaited_once_with("1706791980:rows", 0, 0)
+
+    # Tolerance is bounded by the configured max
+    client_ready.get("/?limit=1&datetime=2024-02-01T13:55:00Z&tolerance=3600")
+    assert app.state.redis.zrevrangebyscore.call_args.kwargs["min"] == 1706795700 - 600
+
+
+def test_get_top_crypto_list_history_tier(client_ready, tmp_path):
+    app.state.redis.lrange.side_effect = None
+    app.state.redis.lrange.return_value = []
+    app.state.redis.get.return_value = None
+    app.state.history = HistoryStore(str(tmp_path / "history.db"))
+    names, columns = merge_columns([{"Id": row["Rank"], "Symbol": row["Symbol"]} for row in ROWS],
+                                   [{"Id": row["Rank"], "Symbol": row["Symbol"], "Price": row["Price"]} for row in ROWS])
+    app.state.history.save("hour", 1706790060, encode_snapshot(names, columns))
+
+    # Not in Redis any more, served from the hourly tier
+    response = client_ready.get("/?limit=2&datetime=2024-02-01T12:55:00Z&tolerance=3600")
+
+    assert response.status_code == 200
+    assert response.headers["X-Snapshot-Timestamp"] == "1706790060"
+    assert response.json() == ROWS[:2]
+
+    # Tier snapshot older than the tolerance
+    assert client_ready.get("/?limit=2&datetime=2024-02-01T12:55:00Z&tolerance=600").status_code == 404
+    # Not covered by any tier
+    assert client_ready.get("/?limit=2&datetime=2024-02-01T14:55:00Z&tolerance=86400").status_code == 404
+    app.state.history.close()
+
+
+def test_get_top_crypto_list_history_tier_default_tolerance(client_ready, tmp_path):
+    app.state.redis.lrange.side_effect = None
+    app.state.redis.lrange.return_value = []
+    app.state.redis.get.return_value = None
+    app.state.config = {"snapshot_lookup": {"default_tolerance": 300}}
+    app.state.history = HistoryStore(str(tmp_path / "history.db"))
+    names, columns = merge_columns([{"Id": row["Rank"], "Symbol": row["Symbol"]} for row in ROWS],
+                                   [{"Id": row["Rank"], "Symbol": row["Symbol"], "Price": row["Price"]} for row in ROWS])
+    # Three days old, first snapshot of the hour in the hourly tier
+    hour = (int(time.time()) // 3600 - 72) * 3600
+    app.state.history.save("hour", hour, encode_snapshot(names, columns))
+    requested = datetime.fromtimestamp(hour + 37 * 60, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    # 37 minutes after the hourly snapshot: the default tolerance only bounds the minute snapshots
+    response = client_ready.get(f"/?limit=2&datetime={requested}")
+
+    assert response.status_code == 200
+    assert response.headers["X-Snapshot-Timestamp"] == str(hour)
+    assert response.json() == ROWS[:2]
+    app.state.history.close()
+
+
+def test_get_top_crypto_list_archive(client_ready, tmp_path):
+    app.state.redis.lrange.side_effect = None
+    app.state.redis.lrange.return_value = []
+    app.state.redis.get.return_value = None
+    app.state.config = {"snapshot_lookup": {"default_tolerance": 300}}
+    app.state.archive = SnapshotArchive(str(tmp_path / "snapshots.tca"))
+    app.state.archive.append(1706791980, ["Rank", "Symbol", "Price"],
+                             [range(1, 4), [row["Symbol"] for row in ROWS], [row["Price"] for row in ROWS]])
+
+    # Not in Redis any more, top rows read from the archive
+    response = client_ready.get("/?limit=2&datetime=2024-02-01T12:55:00Z")
+
+    assert response.status_code == 200
+    assert response.headers["X-Snapshot-Timestamp"] == "1706791980"
+    assert response.json() == ROWS[:2]
+    assert client_ready.get("/?limit=5&datetime=2024-02-01T12:55:00Z").json() == ROWS
+
+    # Out of the tolerance
+    assert client_ready.get("/?limit=2&datetime=2024-02-01T13:55:00Z").status_code == 404
+    app.state.archive.close()
+
+
+def test_get_asset_series(client_ready):
+    app.state.redis = MagicMock()
+    app.state.redis.pipeline.return_value.execute = AsyncMock(
+        return_value=[[b'{"Timestamp": 1706791980, "Rank": 1, "Price USD": 42863.7}'], []])
+
+    response = client_ready.get("/series?symbols=BTC, ETH,BTC&start=2024-02-01T12:00:00Z&end=2024-02-01T13:00:00Z")
+
+    assert response.status_code == 200
+    assert response.json() == {"BTC": [{"Timestamp": 1706791980, "Rank": 1, "Price USD": 42863.7}], "ETH": []}
+    app.state.redis.pipeline.return_value.zrangebyscore.assert_any_call("series:ETH", min=1706788800, max=1706792400)
+
+    # Default range before the end
+    client_ready.get("/series?symbols=BTC&end=2024-02-01T13:00:00Z")
+    assert app.state.redis.pipeline.return_value.zrangebyscore.call_args.kwargs["min"] == 1706792400 - 86400
+
+    assert client_ready.get("/series?symbols=,").status_code == 422
+    assert client_ready.get("/series?symbols=" + ",".join(f"C{i}" for i in range(51))).status_code == 422
+    assert client_ready.get("/series?symbols=BTC&start=2024-02-02T00:00:00Z&end=2024-02-01T00:00:00Z").status_code == 422
+
+
+def test_get_top_crypto_list_batch(client_ready):
+    app.state.redis = MagicMock()
+    app.state.config = {"batch": {"chunk_size": 2}}
+    index = [1706791920, 1706791980]
+    pipelines = [MagicMock(), MagicMock(), MagicMock(), MagicMock()]
+    app.state.redis.pipeline.side_effect = pipelines
+    # Chunk 1: 12:52 and 12:53 resolved to themselves; chunk 2: 12:54 missing, 12:55 nothing in the index
+    pipelines[0].execute = AsyncMock(return_value=[[b"1706791920"], [b"1706791980"]])
+    pipelines[1].execute = AsyncMock(return_value=[lrange_rows(None, 0, 1), [], [None, None],
+                                                   [None, json.dumps({"base": 1706791920, "ops": [[1, 1], [0, 1]]})]])
+    pipelines[2].execute = AsyncMock(return_value=[[], []])
+    pipelines[3].execute = AsyncMock(return_value=[[], [], [None, None], [None, None]])
+    app.state.redis.lrange = AsyncMock(side_effect=lambda key, start, stop: lrange_rows(key, start, stop)
+                                       if key == "1706791920:rows" else [])
+    app.state.redis.get = AsyncMock(return_value=None)
+    app.state.redis.mget = AsyncMock(side_effect=lambda *keys: [None] * len(keys))
+
+    response = client_ready.get("/batch?limit=2&start=2024-02-01T12:52:00Z&end=2024-02-01T12:55:30Z")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["timestamp"] for line in lines] == [1706791920, 1706791980, 1706792040, 1706792100]
+    assert lines[0] == {"timestamp": 1706791920, "snapshot": 1706791920, "rows": ROWS[:2]}
+    # Delta rebuilt from the full rows of its base
+    assert lines[1]["rows"] == [dict(ROWS[1], Rank=1), dict(ROWS[0], Rank=2)]
+    assert lines[2] == {"timestamp": 1706792040, "snapshot": None, "rows": None}
+    pipelines[0].zrevrangebyscore.assert_any_call("snapshots:index", max=1706791980, min=1706791980, offset=0, count=1)
+
+    assert client_ready.get("/batch?limit=2").status_code == 422
+    assert client_ready.get("/batch?limit=2&start=2024-02-02T00:00:00Z&end=2024-02-01T00:00:00Z").status_code == 422
+    assert client_ready.get("/batch?limit=2&start=2024-02-01T00:00:00Z&end=2024-02-03T00:00:00Z").status_code == 422
+
+
+def test_get_top_crypto_list_stream(client_ready):
+    app.state.config = {"streaming": {"chunk_size": 2}}
+
+    response = client_ready.get("/?limit=3&stream=true")
+    assert response.status_code == 200
+    assert response.json() == ROWS
+    # Read from Redis in chunks, without the in-process cache
+    assert [call.args[1:] for call in app.state.redis.lrange.await_args_list] == [(0, 1), (2, 2)]
+
+    response_csv = client_ready.get("/?limit=2&stream=true&format=CSV")
+    assert response_csv.text == "Rank,Symbol,Price\n1,BTC,42863.717593629444\n2,ETH,2540.618971408493\n"
+
+    response_ndjson = client_ready.get("/?limit=5&format=NDJSON")
+    assert response_ndjson.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response_ndjson.text.splitlines()] == ROWS
+
+    # Missing past snapshot
+    app.state.redis.lrange.side_effect = None
+    app.state.redis.lrange.return_value = []
+    app.state.redis.get.return_value = None
+    assert client_ready.get("/?limit=3&stream=true&datetime=2024-02-01T12:55:00Z").status_code == 404
+
+
+def test_get_top_crypto_list_conditional(client_ready):
+    response = client_ready.get("/?limit=2&datetime=2024-02-01T12:34:56Z")
+    etag = response.headers["ETag"]
+    assert etag == '"1706790840-2-json"'
+    assert response.headers["Last-Modified"] == "Thu, 01 Feb 2024 12:34:00 GMT"
+    assert "immutable" in response.headers["Cache-Control"]
+    reads = app.state.redis.lrange.await_count
+
+    # Same snapshot, limit and format: 304 without reading the snapshot
+    response_304 = client_ready.get("/?limit=2&datetime=2024-02-01T12:34:56Z", headers={"If-None-Match": etag})
+    assert response_304.status_code == 304
+    assert response_304.content == b""
+    assert response_304.headers["ETag"] == etag
+    assert app.state.redis.lrange.await_count == reads
+    assert client_ready.get("/?limit=2&datetime=2024-02-01T12:34:56Z&stream=true",
+                            headers={"If-None-Match": etag}).status_code == 304
+
+    assert client_ready.get("/?limit=3&datetime=2024-02-01T12:34:56Z", headers={"If-None-Match": etag}).status_code == 200
+    assert client_ready.get("/?limit=2&datetime=2024-02-01T12:34:56Z&format=CSV",
+                            headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_get_top_crypto_list_conditional_missing_snapshot(client_ready):
+    app.state.redis.lrange.side_effect = None
+    app.state.redis.lrange.return_value = []
+    app.state.redis.get.return_value = None
+    app.state.redis.zrevrangebyscore.return_value = []
+
+    # No snapshot to be unchanged: 404, whatever the validator
+    for if_none_match in ("*", '"1706790840-2-json"'):
+        for stream in ("false", "true"):
+            response = client_ready.get(f"/?limit=2&datetime=2024-02-01T12:34:56Z&stream={stream}",
+                                        headers={"If-None-Match": if_none_match})
+            assert response.status_code == 404
+
+
+def test_get_top_crypto_list_stale_while_revalidate(client_ready):
+    app.state.config = {"refresher": {"build_delay": 0, "stale_max_age": 120}}
+    app.state.redis.zrevrangebyscore.return_value = [b"1706792040"]
+    app.state.redis.lrange.side_effect = lambda key, start, stop: lrange_rows(key, start, stop) \
+        if key == "1706792040:rows" else []
+    app.state.redis.get.return_value = None
+
+    with patch("httpAPI_service.api.api.rounddown_time_to_minute", return_value=1706792100), \
+            patch("httpAPI_service.api.api.refresh_snapshot", new_callable=AsyncMock) as mock_refresh_snapshot:
+        response = client_ready.get("/?limit=2")
+
+    # Previous minute returned without waiting for the current one, built in the background
+    assert response.status_code == 200
+    assert response.json() == ROWS[:2]
+    assert response.headers["X-Snapshot-Timestamp"] == "1706792040"
+    assert response.headers["X-Snapshot-Staleness"] == "60"
+    assert response.headers["Cache-Control"] == "no-cache"
+    app.state.redis.zrevrangebyscore.assert_awaited_once_with("snapshots:index", max=1706792040, min=1706791980,
+                                                              offset=0, count=1)
+    assert mock_refresh_snapshot.await_args.args[3] == 1706792100
+
+
+def test_get_top_crypto_list_cache_miss_with_executor():
+    redis_mock = AsyncMock()
+    redis_mock.lrange.return_value = []
+    redis_mock.get.return_value = None
+    redis_mock.multi_exec = MagicMock()
+    redis_mock.multi_exec.return_value.execute = AsyncMock()
+    set_app_state(redis_mock)
+    app.state.executor = CpuExecutor("thread", 1)
+    app.state.price_fetcher = AsyncMock()
+    app.state.price_fetcher.get_data.return_value = (["Id", "Symbol", "Price USD"], [(1, "BTC", 42863.7), (2, "ETH", 2297.6)])
+    app.state.rank_fetcher = AsyncMock()
+    app.state.rank_fetcher.get_data.return_value = (["Id", "Symbol"], [(2, "ETH"), (1, "BTC")])
+
+    try:
+        response = TestClient(app).get("/?limit=2")
+    finally:
+        app.state.executor.shutdown()
+
+    # Fetched as packed rows, merged in the executor
+    assert response.status_code == 200
+    assert response.json() == [{"Rank": 1, "Symbol": "ETH", "Price USD": 2297.6},
+                               {"Rank": 2, "Symbol": "BTC", "Price USD": 42863.7}]
+    app.state.price_fetcher.get_data.assert_awaited_once_with(packed=True)
+    app.state.rank_fetcher.get_data.assert_awaited_once_with(packed=True)
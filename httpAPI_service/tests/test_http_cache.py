@@ -0,0 +1,35 @@
+from httpAPI_service.api.http_cache import snapshot_etag, etag_matches, cache_headers
+
+
+def test_etag_matches():
+    etag = snapshot_etag(1706791980, 10, "JSON")
+
+    assert etag == '"1706791980-10-json"'
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"1706791980-11-json"', etag)
+    assert not etag_matches(None, etag)
+    # Weak comparison
+    weak_etag = snapshot_etag(1706791980, 10, "JSON", weak=True)
+    assert weak_etag == 'W/"1706791980-10-json"'
+    assert etag_matches(etag, weak_etag)
+    assert etag_matches(weak_etag, weak_etag)
+
+
+def test_cache_headers():
+    now = 1706792010.5
+
+    latest = cache_headers(1706791980, 10, "JSON", None, now, {})
+    assert latest["Last-Modified"] == "Thu, 01 Feb 2024 12:53:00 GMT"
+    # Current minute, cached until it ends
+    assert latest["Cache-Control"] == "public, max-age=30"
+    # Not settled, it may still be written again
+    assert latest["ETag"] == 'W/"1706791980-10-json"'
+
+    historical = cache_headers(1706700000, 10, "CSV", 1706700000, now, {"historical_max_age": 3600})
+    assert historical["Cache-Control"] == "public, max-age=3600, immutable"
+    assert historical["ETag"] == '"1706700000-10-csv"'
+
+    # The snapshot of a recent minute may still be written
+    assert cache_headers(1706791920, 10, "JSON", 1706791980, now, {})["Cache-Control"] == "no-cache"
@@ -1,11 +1,21 @@
-import time
 import asyncio
 import logging
 import logging.config
 import json
+import time
 from tenacity import RetryError
+from common.history_store import HistoryStore
 from common.redis_utils import connect_to_redis
-from common.utils import round_to_previous_minute, unix_timestamp_to_iso, load_config_from_json, merge_data, unpack_message
+from common.retention import run_retention
+from common.snapshot_archive import SnapshotArchive
+from common.series_store import queue_series
+from common.snapshot_codec import encode_snapshot
+from common.snapshot_delta import DeltaWriter
+from common.snapshot_store import binary_key, delta_key, queue_snapshot, queue_snapshot_value, save_batch
+from common.merge_engine import merge_columns, merge_options, render_rows
+from common.utils import round_to_previous_minute, unix_timestamp_to_iso, load_config_from_json, unpack_message
+
+DEFAULT_BLOCK_TIMEOUT = 5000
 
 
 async def read_last_message(redis, stream):
@@ -22,8 +32,141 @@ async def run_task_with_name(name, task_coroutine):
     await task
     return task.result(), name
 
+
+async def read_initial_state(redis, streams):
+    """
+    Read the most recent message of every stream.
+
+    Parameters:
+        - `redis`: An initialized connection to a Redis server.
+        - `streams` (list): Names of the source streams.
+
+    Returns:
+        - tuple: `latest` dict with the `(timestamp, data)` of the last message of every
+          stream that has one, and `last_ids` dict with the id to read the next messages from.
+    """
+    tasks = [run_task_with_name(stream, read_last_message(redis, stream)) for stream in streams]
+    latest = {}
+    last_ids = {stream: '$' for stream in streams}
+    for result, stream in await asyncio.gather(*tasks):
+        if result:
+            last_ids[stream] = result[0][0]
+            latest[stream] = unpack_message(result)
+    return latest, last_ids
+
+
+def update_state(latest, last_ids, messages):
+    """
+    Store the messages returned by XREAD as the latest message of their stream.
+
+    Parameters:
+        - `latest` (dict): `(timestamp, data)` of the last message per stream. Updated in place.
+        - `last_ids` (dict): Last message id read per stream. Updated in place.
+        - `messages` (list): `(stream, message_id, fields)` tuples returned by XREAD.
+    """
+    for stream, message_id, fields in messages:
+        stream = stream.decode() if isinstance(stream, bytes) else stream
+        last_ids[stream] = message_id
+        latest[stream] = unpack_message([(message_id, fields)])
+        logging.debug(f"[{stream:<8}]: {unix_timestamp_to_iso(latest[stream][0])}: {latest[stream][1][:80]}")
+
+
+def synchronized_key(latest, streams, interval):
+    """
+    Get the snapshot key for the latest messages if every stream has one and they are synchronized.
+
+    Parameters:
+        - `latest` (dict): `(timestamp, data)` of the last message per stream.
+        - `streams` (list): Names of the source streams.
+        - `interval` (int): Max time difference (seconds) among the stream messages.
+
+    Returns:
+        - int: The snapshot key (minute timestamp), or None if data is missing or not synchronized.
+    """
+    if any(stream not in latest or not latest[stream][1] for stream in streams):
+        return None
+
+    timestamps = [latest[stream][0] for stream in streams]
+    timediff = max(timestamps) - min(timestamps)
+    if timediff > interval:
+        logging.info(f"Time difference among stream sources is too big : {timediff}s")
+        return None
+    return round_to_previous_minute(max(timestamps), unix_format=True)
+
+
+async def merge_and_save(redis, config, latest, redis_key, delta_writer=None, archive=None):
+    """
+    Merge the latest data of every stream and save the snapshot to Redis.
+
+    Parameters:
+        - `redis`: An initialized connection to a Redis server.
+        - `config` (dict): Merge service configuration.
+        - `latest` (dict): `(timestamp, data)` of the last message per stream.
+        - `redis_key` (int): Minute timestamp used as snapshot key.
+        - `delta_writer` (DeltaWriter, optional): Stores the snapshot as a delta of the previous
+          one when possible. Always a full snapshot if None.
+        - `archive` (SnapshotArchive, optional): On-disk archive the stored snapshot is appended to.
+
+    Returns:
+        - bool: True if the snapshot was stored.
+    """
+    # Assure mainstream is in list first position, so it will set the results entries order
+    streams = config["redis"]["source_streams"]
+    main_stream = config["redis"]["main_stream"]
+    ordered_streams = sorted(streams, key=lambda stream: stream != main_stream)
+    data_list = [json.loads(latest[stream][1]) for stream in ordered_streams]
+
+    logging.info(f"Merging data from {len(data_list)} sources")
+    names, columns = merge_columns(*data_list, **merge_options(config.get("merge", {}), ordered_streams))
+    encoded_rows = render_rows(names, columns)
+    # Save to redis
+    logging.info(f"Saving to Redis: {redis_key} : {encoded_rows[:1]}")
+
+    delta = delta_writer.encode(redis_key, encoded_rows) if delta_writer else None
+    encoding = config.get("snapshot_encoding", {})
+    ttl = config["redis"].get("snapshot_ttl")
+    if ttl and delta_writer and delta is None:
+        # Keyframes outlive the deltas rebuilt from them
+        ttl += delta_writer.keyframe_interval * 60
+    if delta is not None:
+        queue_functions = [lambda batch: queue_snapshot_value(batch, redis_key, delta_key(redis_key), delta, ttl)]
+    elif encoding.get("format") == "binary":
+        data = encode_snapshot(names, columns, encoding.get("compression"))
+        queue_functions = [lambda batch: queue_snapshot_value(batch, redis_key, binary_key(redis_key), data, ttl)]
+    else:
+        queue_functions = [lambda batch: queue_snapshot(batch, redis_key, encoded_rows, ttl)]
+    if "series" in config:
+        queue_functions.append(lambda batch: queue_series(batch, redis_key, names, columns, config["series"]))
+    # Notify the API instances so they drop stale cached copies
+    if config["redis"].get("snapshot_channel"):
+        queue_functions.append(lambda batch: batch.publish(config["redis"]["snapshot_channel"], redis_key))
+
+    # Snapshot, index, expiry, time series and notification in one MULTI/EXEC round trip
+    success = await save_batch(redis, f"snapshot {redis_key}", *queue_functions)
+
+    if delta_writer:
+        if success:
+            delta_writer.stored(redis_key, encoded_rows, delta is not None)
+        else:
+            delta_writer.reset()
+
+    if success:
+        logging.info(f"Data stored successfully with key {redis_key} data time {unix_timestamp_to_iso(redis_key)}")
+        if archive is not None:
+            try:
+                await asyncio.to_thread(archive.append, redis_key, names, columns)
+            except (ValueError, OSError) as e:
+                logging.error(f"Snapshot {redis_key} not archived: {e}")
+    else:
+        logging.error(f"{redis_key} Key already exists or there was an issue storing the data")
+    return success
+
+
 async def main():
     redis = None
+    history = None
+    retention_task = None
+    archive = None
     try:
         # Configuration
         config = load_config_from_json('merge_service/config.json')
@@ -33,62 +176,31 @@ async def main():
 
         logging.info(f"Service start. Loading configuration...")
         redis = await connect_to_redis(config["redis"])
-        tasks = []
+
+        streams = config["redis"]["source_streams"]
+        block_timeout = config["redis"].get("block_timeout", DEFAULT_BLOCK_TIMEOUT)
+        latest, last_ids = await read_initial_state(redis, streams)
+        merged_timestamps = {}
+        delta_writer = DeltaWriter(**config["delta"]) if "delta" in config else None
+        if "archive" in config:
+            archive = SnapshotArchive(**config["archive"])
+        if "retention" in config:
+            # Old minute snapshots are rolled up to the on-disk hourly/daily history store
+            history = HistoryStore(config["retention"]["history_path"])
+            retention_task = asyncio.create_task(run_retention(redis, history, config["retention"], time.time))
 
         while True:
-            if redis is None:
-                redis = await connect_to_redis(config["redis"])
-
-            # Create task per stream to read messages asynchronously
-            tasks = [run_task_with_name(stream, read_last_message(redis, stream)) for stream in config["redis"]["source_streams"]]
-            results = await asyncio.gather(*tasks)
-            
-            # Process the results
-            is_data_missing = False
-            timestamps = []
-            data_list = []
-            main_stream_id = 0
-            for result, task_name in results:
-                timestamp, data = unpack_message(result)
-                if task_name == config["redis"]["main_stream"]:
-                    main_stream_id = len(timestamps)
-                timestamps.append(timestamp)
-                if data != []:
-                    data_list.append(json.loads(data)) # type: ignore
-                logging.debug(f"[{task_name:<8}]: {unix_timestamp_to_iso(timestamp)}: {data[:80]}")
-                is_data_missing |= result == None
-
-            # In some stream is empty timeout and continue loop
-            if is_data_missing:
-                time.sleep(config["redis"]["interval"])
-                continue
-
-            # Check time difference among data sources
-            timediff = max(timestamps) - min(timestamps)
-            if timediff > config["redis"]["interval"]:
-                logging.info(f"Time difference among stream sources is too big : {timediff}s")
-            else : # Data sources synchronized
-                # Generate redis key
-                generated_redis_key = round_to_previous_minute(max(timestamps), unix_format=True)
-
-                # Merge data
-                if main_stream_id != 0 and data_list:
-                    # Assure mainstream is in list first position, so it will set the results entries order
-                    data_list.insert(0, data_list.pop(main_stream_id))
-
-                if data_list:
-                    merged_data = merge_data(*data_list)
-                    # Save to redis
-                    logging.info(f"Saving to Redis: {generated_redis_key} : {json.loads(merged_data)[:1]}")
-                
-                    success = False
-                    if redis is not None:
-                        success = await redis.set(generated_redis_key, merged_data)
-                    if success:
-                        logging.info(f"Data stored successfully with key {generated_redis_key} data time {unix_timestamp_to_iso(generated_redis_key)}")                        
-                    else:
-                        logging.error(f"{generated_redis_key} Key already exists or there was an issue storing the data")
-            time.sleep(config["redis"]["interval"])
+            # Merge only when a new message has arrived on every stream since the last merge
+            is_new_data = all(latest.get(stream, (None,))[0] != merged_timestamps.get(stream) for stream in streams)
+            redis_key = synchronized_key(latest, streams, config["redis"]["interval"]) if is_new_data else None
+            if redis_key is not None:
+                if await merge_and_save(redis, config, latest, redis_key, delta_writer, archive):
+                    merged_timestamps = {stream: latest[stream][0] for stream in streams}
+
+            # Block until a new message arrives in any stream
+            messages = await redis.xread(streams, timeout=block_timeout,
+                                         latest_ids=[last_ids[stream] for stream in streams])
+            update_state(latest, last_ids, messages)
 
     except RetryError as e:
         logging.error(f"Retry operation failed: {e}")
@@ -99,10 +211,16 @@ async def main():
         logging.exception("Stack trace:")
     finally:
         logging.info("Exiting program.")
+        if retention_task is not None:
+            retention_task.cancel()
+        if history is not None:
+            history.close()
+        if archive is not None:
+            archive.close()
         if redis is not None:
             redis.close()
             await redis.wait_closed()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,7 +1,11 @@
 import asyncio
 import pytest
-from unittest.mock import AsyncMock, patch, Mock
-from merge_service.merger import read_last_message, run_task_with_name, main
+from unittest.mock import AsyncMock, MagicMock, patch, Mock
+from aioredis.errors import ReplyError
+from merge_service.merger import read_last_message, run_task_with_name, main, update_state, synchronized_key, merge_and_save
+from common.snapshot_codec import decode_snapshot
+from common.snapshot_delta import DeltaWriter
+from common.snapshot_archive import SnapshotArchive
 
 @pytest.fixture
 def mocked_config():
@@ -58,10 +62,7 @@ async def test_run_task_with_name():
 #     # async def task_coroutine():
 #     await asyncio.sleep(1)
 #     return gather_results
-@pytest.mark.asyncio
-async def mock_coroutine():
-    await asyncio.sleep(1)  # Simulate some asynchronous operation (e.g., fetching data)
-    
+def mock_result():
     # Simulate the result you expect
     gather_results = "[{'Id': 1, 'Symbol': 'BTC', 'Price USD': 42938.387890741134}, " \
                      "{'Id': 2, 'Symbol': 'ETH', 'Price USD': 2305.1541836162664}, " \
@@ -89,7 +90,7 @@ async def test_main_successful_execution():
 
     with patch('price_service.price_publisher.load_config_from_json', return_value=config):
         with patch('price_service.price_publisher.connect_to_redis'):
-            with patch('asyncio.gather', return_value=[mock_coroutine() for _ in range(2)]):
+            with patch('asyncio.gather', return_value=[mock_result() for _ in range(2)]):
                 with patch("common.utils.unix_timestamp_to_iso", return_value="2022-01-01T00:00:00"):
                     with patch("common.utils.round_to_previous_minute", return_value=1640995200):
                         with patch("common.utils.merge_data", return_value=merged_data):
@@ -97,3 +98,148 @@ async def test_main_successful_execution():
 
                             mocked_redis.set.called
 
+
+
+def test_update_state_and_synchronized_key():
+    latest = {}
+    last_ids = {"price": "$", "rank": "$"}
+    update_state(latest, last_ids, [(b"price", b"1706868720-0", {b"data": b'[{"Id": 1}]'})])
+
+    assert last_ids == {"price": b"1706868720-0", "rank": "$"}
+    assert synchronized_key(latest, ["price", "rank"], 60) is None
+
+    update_state(latest, last_ids, [(b"rank", b"1706868660-0", {b"data": b'[{"Id": 1}]'})])
+    assert synchronized_key(latest, ["price", "rank"], 60) == 1706868720
+    assert synchronized_key(latest, ["price", "rank"], 30) is None
+
+
+def batch_redis(*results):
+    """
+    Redis mock recording the commands of every MULTI/EXEC, answering them with `results` (one reply list per batch).
+    """
+    redis_mock = AsyncMock()
+    redis_mock.batches = []
+
+    def multi_exec():
+        batch = MagicMock()
+        batch.execute = AsyncMock(return_value=results[len(redis_mock.batches)] if results else [])
+        redis_mock.batches.append(batch)
+        return batch
+
+    redis_mock.multi_exec = MagicMock(side_effect=multi_exec)
+    return redis_mock
+
+
+def queued(batch):
+    return [(name, args) for name, args, _ in batch.method_calls if name != "execute"]
+
+
+@pytest.mark.asyncio
+async def test_merge_and_save_main_stream_first():
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank", "snapshot_channel": "snapshots"}}
+    latest = {"price": (1706868720, '[{"Id": 2, "Symbol": "ETH", "Price USD": 2.5}, {"Id": 1, "Symbol": "BTC", "Price USD": 1.5}]'),
+              "rank": (1706868720, '[{"Id": 1, "Symbol": "BTC"}, {"Id": 2, "Symbol": "ETH"}]')}
+    redis_mock = batch_redis()
+
+    assert await merge_and_save(redis_mock, config, latest, 1706868720)
+
+    # Snapshot, index and notification in a single round trip
+    batch, = redis_mock.batches
+    assert queued(batch) == [
+        ("delete", ("1706868720:rows", "1706868720:delta", "1706868720:bin")),
+        ("rpush", ("1706868720:rows", '{"Rank": 1, "Symbol": "BTC", "Price USD": 1.5}',
+                   '{"Rank": 2, "Symbol": "ETH", "Price USD": 2.5}')),
+        ("zadd", ("snapshots:index", 1706868720, 1706868720)),
+        ("publish", ("snapshots", 1706868720))]
+    batch.execute.assert_awaited_once_with(return_exceptions=True)
+    redis_mock.publish.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_merge_and_save_stores_deltas_between_keyframes():
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank"}}
+    rank = '[{"Id": 1, "Symbol": "BTC"}, {"Id": 2, "Symbol": "ETH"}]'
+    latest = {"price": (1706868720, '[{"Id": 1, "Symbol": "BTC", "Price USD": 1.5}, {"Id": 2, "Symbol": "ETH", "Price USD": 2.5}]'),
+              "rank": (1706868720, rank)}
+    delta_writer = DeltaWriter(keyframe_interval=60, max_delta_ratio=1)
+    redis_mock = batch_redis()
+
+    assert await merge_and_save(redis_mock, config, latest, 1706868720, delta_writer)
+    latest["price"] = (1706868780, '[{"Id": 1, "Symbol": "BTC", "Price USD": 1.6}, {"Id": 2, "Symbol": "ETH", "Price USD": 2.5}]')
+    assert await merge_and_save(redis_mock, config, latest, 1706868780, delta_writer)
+
+    keyframe, delta = redis_mock.batches
+    assert queued(keyframe)[1][0] == "rpush"
+    assert queued(delta)[1] == (
+        "set", ("1706868780:delta", '{"base":1706868720,"ops":[", \\"Symbol\\": \\"BTC\\", \\"Price USD\\": 1.6}",[1,1]]}'))
+
+
+@pytest.mark.asyncio
+async def test_merge_and_save_expiry():
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank", "snapshot_ttl": 3600}}
+    latest = {"price": (1706868720, '[{"Id": 1, "Symbol": "BTC", "Price USD": 1.5}]'),
+              "rank": (1706868720, '[{"Id": 1, "Symbol": "BTC"}]')}
+    redis_mock = batch_redis()
+
+    assert await merge_and_save(redis_mock, config, latest, 1706868720, DeltaWriter(keyframe_interval=15))
+    assert await merge_and_save(redis_mock, config, latest, 1706868780)
+
+    # Keyframes expire after the deltas rebuilt from them, index entries with the snapshots
+    keyframe, snapshot = redis_mock.batches
+    assert queued(keyframe)[3:] == [("expire", ("1706868720:rows", 3600 + 15 * 60)),
+                                    ("zremrangebyscore", ("snapshots:index",))]
+    assert keyframe.zremrangebyscore.call_args.kwargs == {"max": 1706868720 - 4500}
+    assert queued(snapshot)[3] == ("expire", ("1706868780:rows", 3600))
+
+
+@pytest.mark.asyncio
+async def test_merge_and_save_binary_keyframe():
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank"},
+              "snapshot_encoding": {"format": "binary", "compression": "zlib"}}
+    latest = {"price": (1706868720, '[{"Id": 1, "Symbol": "BTC", "Price USD": 1.5}]'),
+              "rank": (1706868720, '[{"Id": 1, "Symbol": "BTC"}]')}
+    redis_mock = batch_redis()
+
+    assert await merge_and_save(redis_mock, config, latest, 1706868720)
+
+    key, data = redis_mock.batches[0].set.call_args.args
+    names, columns = decode_snapshot(data)
+    assert key == "1706868720:bin"
+    assert names == ["Rank", "Symbol", "Price USD"]
+    assert [list(column) for column in columns] == [[1], ["BTC"], [1.5]]
+
+
+@pytest.mark.asyncio
+async def test_merge_and_save_archive(tmp_path):
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank"}}
+    latest = {"price": (1706868720, '[{"Id": 1, "Symbol": "BTC", "Price USD": 1.5}]'),
+              "rank": (1706868720, '[{"Id": 1, "Symbol": "BTC"}]')}
+    archive = SnapshotArchive(str(tmp_path / "snapshots.tca"))
+    # The second batch fails (its error is checked, not lost)
+    redis_mock = batch_redis([1, 1, 1], [1, ReplyError("OOM command not allowed"), 1])
+
+    assert await merge_and_save(redis_mock, config, latest, 1706868720, archive=archive)
+    assert not await merge_and_save(redis_mock, config, latest, 1706868780, archive=archive)
+
+    # Only stored snapshots are archived
+    assert archive.find(1706868780, 60) == 1706868720
+    names, columns = archive.read(1706868720)
+    assert names == ["Rank", "Symbol", "Price USD"]
+    assert [list(column) for column in columns] == [[1], ["BTC"], [1.5]]
+    archive.close()
+
+
+@pytest.mark.asyncio
+async def test_merge_and_save_series():
+    config = {"redis": {"source_streams": ["price", "rank"], "main_stream": "rank"},
+              "series": {"columns": ["Price USD"]}}
+    latest = {"price": (1706868720, '[{"Id": 1, "Symbol": "BTC", "Price USD": 1.5}]'),
+              "rank": (1706868720, '[{"Id": 1, "Symbol": "BTC"}]')}
+    redis_mock = batch_redis()
+
+    assert await merge_and_save(redis_mock, config, latest, 1706868720)
+
+    # Series points written in the same MULTI/EXEC as the snapshot
+    batch, = redis_mock.batches
+    assert ("zadd", ("series:BTC", 1706868720, '{"Timestamp": 1706868720, "Rank": 1, "Price USD": 1.5}')) in queued(batch)
+    redis_mock.pipeline.assert_not_called()
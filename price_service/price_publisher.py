@@ -2,9 +2,9 @@ import asyncio
 import logging
 import logging.config
 import time
-import schedule
 from tenacity import RetryError
-from common.utils import seconds_until_next_minute, load_config_from_json
+from common.utils import load_config_from_json
+from common.scheduler import MinuteScheduler, next_tick
 from common.redis_utils import connect_to_redis
 from shared.data_fetcher import DataFetcher, CustomApiException
 from shared.publisher import Publisher
@@ -27,6 +27,7 @@ async def main():
     :return: None
     """
     redis = None
+    data_fetcher = None
     try:
         # Configuration
         config = load_config_from_json('price_service/config.json')
@@ -44,17 +45,15 @@ async def main():
         publisher = Publisher(config, data_fetcher, redis)
 
         # Synchronization to the minute for first stream update
-        seconds = seconds_until_next_minute()
-        logging.info(f"Synchronizing to rounded minute. Sending data in {seconds} seconds.")
-        time.sleep(seconds)
-        await publisher.send_data_to_redis_stream()
+        interval = config['redis']['interval']
+        scheduler = MinuteScheduler(interval)
+        first_tick = next_tick(time.time(), interval)
+        logging.info(f"Synchronizing to rounded minute. Sending data in {first_tick - time.time():.3f} seconds.")
+        await scheduler.sleep_until(first_tick)
+        await publisher.send_data_to_redis_stream(first_tick)
 
-        schedule.every(config['redis']['interval']).seconds.do(
-            lambda: asyncio.create_task(publisher.send_data_to_redis_stream())
-        )
-        while True:
-            schedule.run_pending()
-            await asyncio.sleep(5)
+        # Then on every minute boundary, without drift
+        await scheduler.run(publisher.send_data_to_redis_stream, first_tick + interval)
     except RetryError as e:
         logging.error(f"Retry operation failed: {e}")
     except ConnectionRefusedError as e:
@@ -69,6 +68,8 @@ async def main():
         logging.exception("Stack trace:")
     finally:
         logging.info("Exiting program.")
+        if data_fetcher is not None:
+            await data_fetcher.close()
         if redis is not None:
             redis.close()
             await redis.wait_closed()
@@ -1,6 +1,6 @@
 import asyncio
 from tenacity import RetryError
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import pytest
 from price_service.price_publisher import main
 
@@ -21,19 +21,34 @@ config = {
 async def test_main_successful_execution():
     with patch('price_service.price_publisher.load_config_from_json', return_value=config):
         with patch('price_service.price_publisher.DataFetcher') as mock_data_fetcher:
+            mock_data_fetcher.return_value.close = AsyncMock()
             with patch('price_service.price_publisher.connect_to_redis') as mock_connect_to_redis:
-                with patch('price_service.price_publisher.Publisher') as mock_publisher:
+                # close is sync, wait_closed is awaited
+                mock_connect_to_redis.return_value.close = MagicMock()
+                with patch('price_service.price_publisher.Publisher') as mock_publisher, \
+                        patch('price_service.price_publisher.MinuteScheduler') as mock_scheduler, \
+                        patch('price_service.price_publisher.time.time', return_value=1706792130.5):
+                    mock_publisher.return_value.send_data_to_redis_stream = AsyncMock()
+                    mock_scheduler.return_value.sleep_until = AsyncMock()
+                    mock_scheduler.return_value.run = AsyncMock()
                     await main()
 
     mock_data_fetcher.assert_called_once()
     mock_connect_to_redis.assert_called_once_with(config['redis'])
     mock_publisher.assert_called_once_with(config, mock_data_fetcher.return_value, mock_connect_to_redis.return_value)
+    # First message at the next minute boundary, then every minute
+    mock_scheduler.assert_called_once_with(60)
+    mock_scheduler.return_value.sleep_until.assert_awaited_once_with(1706792160)
+    mock_publisher.return_value.send_data_to_redis_stream.assert_awaited_once_with(1706792160)
+    mock_scheduler.return_value.run.assert_awaited_once_with(mock_publisher.return_value.send_data_to_redis_stream,
+                                                             1706792220)
 
 
 @pytest.mark.asyncio
 async def test_main_retry_error():
     with patch('price_service.price_publisher.load_config_from_json', return_value=config):
         with patch('price_service.price_publisher.DataFetcher') as mock_data_fetcher:
+            mock_data_fetcher.return_value.close = AsyncMock()
             with patch('price_service.price_publisher.connect_to_redis', side_effect=RetryError):
                 with patch('price_service.price_publisher.Publisher') as mock_publisher:
                     await main()
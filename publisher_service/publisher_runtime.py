@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import logging.config
+import os
+from tenacity import RetryError
+from common.utils import load_config_from_json
+from common.scheduler import MinuteScheduler
+from common.redis_utils import connect_to_redis
+from shared.data_fetcher import DataFetcher, CLIENT_HTTP_KEYS, create_http_client
+from shared.publisher import Publisher
+
+DEFAULT_SOURCES_DIR = "config/sources"
+DEFAULT_INTERVAL = 60
+
+
+def load_sources(sources_dir):
+    """
+    Load the source configs of a directory, one JSON file per source, in file name order.
+
+    A source config has the stream to publish to, the publishing `interval` (seconds) and the
+    data_fetcher config, inline (`fetcher`) or as a path (`fetcher_config`). Sources with
+    `"enabled": false` are skipped.
+
+    Parameters:
+        - `sources_dir` (str): Directory of the source configs.
+
+    Returns:
+        - list: Source configs, with their `name` (file name without extension) and `fetcher` config.
+
+    Raises:
+        - ValueError: If a source has no stream or fetcher config.
+    """
+    sources = []
+    for file_name in sorted(os.listdir(sources_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        source = load_config_from_json(os.path.join(sources_dir, file_name))
+        if not source.get("enabled", True):
+            continue
+        source.setdefault("name", file_name[:-len(".json")])
+        if "fetcher" not in source and "fetcher_config" in source:
+            source["fetcher"] = load_config_from_json(source["fetcher_config"])
+        if not source.get("stream") or not source.get("fetcher"):
+            raise ValueError(f"Source {source['name']} needs a stream and a fetcher config")
+        sources.append(source)
+    return sources
+
+
+def create_http_clients(sources, http_config):
+    """
+    Create the HTTP clients of the sources, one per distinct set of client settings.
+
+    The client settings of a source (`CLIENT_HTTP_KEYS`: timeouts and pool limits) are the
+    `http` block of its fetcher config over the `http` block of the runtime. Sources with
+    the same settings share a client; `max_concurrency` is applied by every fetcher.
+
+    Parameters:
+        - `sources` (list): Source configs (see `load_sources`).
+        - `http_config` (dict): `http` config block of the runtime, defaults of the sources.
+
+    Returns:
+        - list: HTTP client (httpx.AsyncClient) of every source.
+    """
+    clients = {}
+    source_clients = []
+    for source in sources:
+        source_http_config = {**http_config, **source["fetcher"].get("http", {})}
+        client_config = {key: value for key, value in source_http_config.items() if key in CLIENT_HTTP_KEYS}
+        settings = tuple(sorted(client_config.items()))
+        if settings not in clients:
+            clients[settings] = create_http_client(client_config)
+        source_clients.append(clients[settings])
+    return source_clients
+
+
+def create_publishers(sources, redis, clients, redis_config):
+    """
+    Create the data_fetcher and publisher of every source, all sharing the Redis pool.
+
+    Parameters:
+        - `sources` (list): Source configs (see `load_sources`).
+        - `redis`: An initialized connection to a Redis server.
+        - `clients` (list): HTTP client (httpx.AsyncClient) of every source, shared with the sources
+          of the same client settings (see `create_http_clients`).
+        - `redis_config` (dict): `redis` config block of the runtime.
+
+    Returns:
+        - list: `(source, fetcher, publisher)` of every source.
+    """
+    publishers = []
+    for source, client in zip(sources, clients):
+        fetcher = DataFetcher(source["fetcher"], client)
+        config = {"redis": {**redis_config, "stream": source["stream"],
+                            "interval": source.get("interval", DEFAULT_INTERVAL)}}
+        publishers.append((source, fetcher, Publisher(config, fetcher, redis)))
+    return publishers
+
+
+async def run_publishers(publishers):
+    """
+    Publish every source on its own interval, on the current event loop, until cancelled.
+
+    Parameters:
+        - `publishers` (list): `(source, fetcher, publisher)` of every source (see `create_publishers`).
+    """
+    schedulers = []
+    for source, _, publisher in publishers:
+        interval = source.get("interval", DEFAULT_INTERVAL)
+        logging.info(f"[{source['name']}] Publishing to stream {source['stream']} every {interval} seconds.")
+        schedulers.append(MinuteScheduler(interval).run(publisher.send_data_to_redis_stream))
+    await asyncio.gather(*schedulers)
+
+
+async def main():
+    """
+    Run every source of the sources directory (`sources_dir`) in a single process and event loop.
+
+    The fetchers share one pooled HTTP client per distinct set of client settings (see
+    `create_http_clients`) and the publishers one Redis pool, instead of one process
+    (interpreter, pools and imports) per source.
+
+    :return: None
+    """
+    redis = None
+    clients = []
+    publishers = []
+    try:
+        # Configuration
+        config = load_config_from_json('publisher_service/config.json')
+
+        # Set up logging based on the configuration
+        logging.config.dictConfig(config["logging"])
+
+        logging.info(f"Service start. Loading configuration...")
+
+        sources = load_sources(config.get("sources_dir", DEFAULT_SOURCES_DIR))
+        if not sources:
+            logging.error("No sources to publish.")
+            return
+        logging.info(f"Loaded {len(sources)} sources: {', '.join(source['name'] for source in sources)}")
+
+        # Pools shared by the sources
+        clients = create_http_clients(sources, config.get("http", {}))
+        redis = await connect_to_redis(config["redis"])
+
+        publishers = create_publishers(sources, redis, clients, config["redis"])
+        await run_publishers(publishers)
+    except RetryError as e:
+        logging.error(f"Retry operation failed: {e}")
+    except ConnectionRefusedError as e:
+        logging.error(f"Failed to connect to Redis: {e}")
+    except ValueError as e:
+        logging.error(f"Source config error: {e}")
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        logging.exception("Stack trace:")
+    finally:
+        logging.info("Exiting program.")
+        for _, fetcher, _ in publishers:
+            await fetcher.close()
+        for client in dict.fromkeys(clients):
+            await client.aclose()
+        if redis is not None:
+            redis.close()
+            await redis.wait_closed()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("Script interrupted by user.")
@@ -0,0 +1,113 @@
+import json
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from publisher_service.publisher_runtime import load_sources, create_http_clients, create_publishers, main
+
+FETCHER_CONFIG = {
+    "api_key_env_var_name": "TEST_API_KEY",
+    "url": "https://example.com/list",
+    "data_path": "data",
+    "fields": [{"name": "Id", "source": "id", "default": "NOT_AVAILABLE"}]
+}
+
+config = {
+    'logging': {'version': 1, 'disable_existing_loggers': False},
+    'redis': {'host': 'localhost', 'port': 6379},
+    'sources_dir': 'config/sources',
+    'http': {'max_connections': 20}
+}
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data))
+
+
+def test_load_sources(tmp_path):
+    write_json(tmp_path / "fetcher.json", FETCHER_CONFIG)
+    sources_dir = tmp_path / "sources"
+    sources_dir.mkdir()
+    write_json(sources_dir / "rank.json", {"fetcher_config": str(tmp_path / "fetcher.json"), "stream": "rank"})
+    write_json(sources_dir / "btc_price.json", {"fetcher": FETCHER_CONFIG, "stream": "btc", "interval": 300})
+    write_json(sources_dir / "old.json", {"fetcher": FETCHER_CONFIG, "stream": "old", "enabled": False})
+    (sources_dir / "README.md").write_text("Not a source")
+
+    sources = load_sources(str(sources_dir))
+
+    assert [(source["name"], source["stream"], source.get("interval")) for source in sources] == \
+           [("btc_price", "btc", 300), ("rank", "rank", None)]
+    assert all(source["fetcher"] == FETCHER_CONFIG for source in sources)
+
+
+def test_load_sources_without_stream(tmp_path):
+    write_json(tmp_path / "price.json", {"fetcher": FETCHER_CONFIG})
+
+    with pytest.raises(ValueError):
+        load_sources(str(tmp_path))
+
+
+def test_load_sources_of_the_repository():
+    assert [source["stream"] for source in load_sources("config/sources")] == ["price", "rank"]
+
+
+def test_create_publishers_share_pools():
+    redis, client = MagicMock(), MagicMock()
+    sources = [{"name": "price", "stream": "price", "fetcher": FETCHER_CONFIG},
+               {"name": "btc", "stream": "btc", "interval": 300, "fetcher": FETCHER_CONFIG}]
+
+    publishers = create_publishers(sources, redis, [client, client], config["redis"])
+
+    assert [publisher.config["redis"] for _, _, publisher in publishers] == [
+        {"host": "localhost", "port": 6379, "stream": "price", "interval": 60},
+        {"host": "localhost", "port": 6379, "stream": "btc", "interval": 300}]
+    assert all(fetcher.client is client and fetcher.shared_client for _, fetcher, _ in publishers)
+    assert all(publisher.redis is redis and publisher.data_fetcher is fetcher for _, fetcher, publisher in publishers)
+
+
+def test_create_http_clients_per_source_settings():
+    slow_config = {**FETCHER_CONFIG, "http": {"timeout": 90, "max_concurrency": 1}}
+    sources = [{"name": "price", "stream": "price", "fetcher": FETCHER_CONFIG},
+               {"name": "slow", "stream": "slow", "fetcher": slow_config},
+               {"name": "rank", "stream": "rank", "fetcher": {**FETCHER_CONFIG, "http": {"max_concurrency": 2}}},
+               {"name": "other_slow", "stream": "other_slow", "fetcher": slow_config}]
+
+    with patch('publisher_service.publisher_runtime.create_http_client',
+               side_effect=lambda http_config: MagicMock()) as mock_create_http_client:
+        clients = create_http_clients(sources, config["http"])
+
+    # Same client settings, same client: max_concurrency is applied by the fetchers
+    assert clients[0] is clients[2] and clients[1] is clients[3] and clients[0] is not clients[1]
+    assert [call.args for call in mock_create_http_client.call_args_list] == [
+        ({"max_connections": 20},), ({"max_connections": 20, "timeout": 90},)]
+
+
+@pytest.mark.asyncio
+async def test_main_successful_execution():
+    sources = [{"name": "price", "stream": "price", "fetcher": FETCHER_CONFIG}]
+    with patch('publisher_service.publisher_runtime.load_config_from_json', return_value=config), \
+            patch('publisher_service.publisher_runtime.load_sources', return_value=sources) as mock_load_sources, \
+            patch('publisher_service.publisher_runtime.create_http_client') as mock_create_http_client, \
+            patch('publisher_service.publisher_runtime.connect_to_redis') as mock_connect_to_redis, \
+            patch('publisher_service.publisher_runtime.run_publishers', new_callable=AsyncMock) as mock_run_publishers:
+        mock_create_http_client.return_value.aclose = AsyncMock()
+        mock_connect_to_redis.return_value.close = MagicMock()
+        mock_connect_to_redis.return_value.wait_closed = AsyncMock()
+        await main()
+
+    mock_load_sources.assert_called_once_with('config/sources')
+    mock_create_http_client.assert_called_once_with(config['http'])
+    mock_connect_to_redis.assert_called_once_with(config['redis'])
+    (source, fetcher, publisher), = mock_run_publishers.await_args.args[0]
+    assert fetcher.client is mock_create_http_client.return_value
+    assert publisher.redis is mock_connect_to_redis.return_value
+    mock_create_http_client.return_value.aclose.assert_awaited_once()
+    mock_connect_to_redis.return_value.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_main_without_sources():
+    with patch('publisher_service.publisher_runtime.load_config_from_json', return_value=config), \
+            patch('publisher_service.publisher_runtime.load_sources', return_value=[]), \
+            patch('publisher_service.publisher_runtime.connect_to_redis') as mock_connect_to_redis:
+        await main()
+
+    mock_connect_to_redis.assert_not_called()
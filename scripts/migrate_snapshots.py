@@ -0,0 +1,52 @@
+"""
+Migrate snapshots stored in the legacy layout (one JSON string under the bare unix
+timestamp key) to row lists (`<timestamp>:rows`, one JSON encoded row per item) and
+add them to the snapshot index.
+
+Usage:
+    python scripts/migrate_snapshots.py [--host localhost] [--port 6379] [--delete]
+"""
+import argparse
+import json
+import redis
+
+INDEX_KEY = "snapshots:index"
+
+
+def legacy_snapshot_keys(redis_connection):
+    for key in redis_connection.scan_iter(count=1000):
+        if key.isdigit() and redis_connection.type(key) == b'string':
+            yield key
+
+
+def migrate(redis_connection, delete=False):
+    migrated = 0
+    for key in legacy_snapshot_keys(redis_connection):
+        rows = json.loads(redis_connection.get(key))
+        rows_key = f"{key.decode()}:rows"
+        pipeline = redis_connection.pipeline(transaction=True)
+        pipeline.delete(rows_key)
+        if rows:
+            pipeline.rpush(rows_key, *[json.dumps(row) for row in rows])
+            pipeline.zadd(INDEX_KEY, {key: int(key)})
+        if delete:
+            pipeline.delete(key)
+        pipeline.execute()
+        migrated += 1
+        print(f"{key.decode()}: {len(rows)} rows -> {rows_key}")
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy snapshot keys to row lists")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--delete", action="store_true", help="Delete the legacy keys once migrated")
+    args = parser.parse_args()
+
+    redis_connection = redis.StrictRedis(host=args.host, port=args.port)
+    print(f"Migrated {migrate(redis_connection, args.delete)} snapshots.")
+
+
+if __name__ == "__main__":
+    main()
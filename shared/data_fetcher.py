@@ -1,10 +1,18 @@
-from requests import Session
-from requests.exceptions import ConnectionError, Timeout, TooManyRedirects
+import httpx
+import asyncio
 import copy
 import json
 import os
 import logging
+import math
+from functools import lru_cache
+from operator import itemgetter
 from datetime import datetime
+from common.merge_engine import pack_rows, unpack_rows
+try:
+    import ijson
+except ImportError:  # Only needed for sources with "parse_mode": "stream"
+    ijson = None
 
 
 class CustomApiException(Exception):
@@ -13,14 +21,312 @@ class CustomApiException(Exception):
         self.message = message
         super().__init__(self.message)
 
+DEFAULT_HTTP_CONFIG = {
+    "timeout": 30,
+    "connect_timeout": 10,
+    "max_connections": 10,
+    "max_keepalive_connections": 5,
+    "max_concurrency": 5
+}
+
+# `http` settings applied by the client (the pool), `max_concurrency` is applied per fetcher
+CLIENT_HTTP_KEYS = ("timeout", "connect_timeout", "max_connections", "max_keepalive_connections")
+
+DEFAULT_PAGE_WINDOW = 5
+
+
+def cmc_alternative_id(alternative_ids):
+    """
+    Extract the CoinMarketCap id from a list of alternative ids.
+
+    Parameters:
+        - `alternative_ids` (list): Items like `{"NAME": "CMC", "ID": "1"}`.
+
+    Returns:
+        - int: The CMC id, or None if the list has no CMC entry.
+    """
+    return next((int(alt_id['ID']) for alt_id in alternative_ids if alt_id.get('NAME') == 'CMC'), None)
+
+
+# Named transforms that can be referenced from the "transform" key of a field config
+TRANSFORMS = {
+    "int": int,
+    "float": float,
+    "str": str,
+    "cmc_alternative_id": cmc_alternative_id,
+}
+
+
+def compile_getter(path):
+    """
+    Compile a dotted field path into a getter function.
+
+    Parameters:
+        - `path` (str): Dotted path to the field, e.g. `quote.USD.price`.
+
+    Returns:
+        - function: Getter taking an item and returning the field value. Raises
+          KeyError/TypeError/IndexError if the path does not exist in the item.
+    """
+    keys = tuple(path.split("."))
+    if len(keys) == 1:
+        return itemgetter(keys[0])
+
+    def getter(item):
+        for key in keys:
+            item = item[key]
+        return item
+    return getter
+
+
+def compile_transform(transform):
+    """
+    Resolve the "transform" of a field config into a callable.
+
+    Names found in `TRANSFORMS` are used as they are. Any other value is treated as a
+    Python expression (e.g. a lambda) and evaluated once.
+
+    Parameters:
+        - `transform` (str): Transform name or expression.
+
+    Returns:
+        - function: The transform callable, or None if no transform is set.
+    """
+    if not transform:
+        return None
+    if transform in TRANSFORMS:
+        return TRANSFORMS[transform]
+    return eval(transform)
+
+
+def compile_fields(fields_config):
+    """
+    Compile the "fields" section of a source config into an extractor plan.
+
+    Parameters:
+        - `fields_config` (list): Field configs with `name`, `source`, `default` and optional `transform`.
+
+    Returns:
+        - tuple: One `(name, getter, default, transform)` entry per field.
+    """
+    return tuple((field_config["name"],
+                  compile_getter(field_config["source"]),
+                  field_config.get("default"),
+                  compile_transform(field_config.get("transform")))
+                 for field_config in fields_config)
+
+
+def access_nested_fields(json_data, path, default_value=None):
+    """
+    Get the value at a dotted path of a JSON document.
+
+    Parameters:
+        - `json_data`: Parsed JSON document.
+        - `path` (str): Dotted path, e.g. `Data.LIST`.
+        - `default_value` (optional): Returned if the path does not exist (when set).
+
+    Returns:
+        - The value at `path`.
+    """
+    field_value = json_data
+    try:
+        for key in path.split("."):
+            field_value = field_value[key]
+    except (KeyError, TypeError):
+        if default_value:
+            field_value = default_value
+    return field_value
+
+
+def filter_values(json_data, extractor):
+    """
+    Extract the configured fields from a raw item, as a tuple of values in field order.
+
+    Missing fields take their configured default value. Transforms are applied to
+    extracted values only.
+
+    Parameters:
+        - `json_data` (dict): Raw item from the API response.
+        - `extractor` (tuple): Compiled fields (see `compile_fields`).
+
+    Returns:
+        - tuple: One value per configured field.
+    """
+    values = []
+    for _, getter, default_value, transform in extractor:
+        try:
+            field_value = getter(json_data)
+        except (KeyError, TypeError, IndexError):
+            values.append(default_value)
+            continue
+        if transform is not None and field_value is not None:
+            field_value = transform(field_value)
+        values.append(field_value)
+    return tuple(values)
+
+
+@lru_cache(maxsize=32)
+def cached_extractor(fields_json):
+    """
+    Compile the JSON encoded "fields" section of a source config, once per worker process.
+    """
+    return compile_fields(json.loads(fields_json))
+
+
+def filter_response(content, data_path, total_count_path, fields_json):
+    """
+    Parse a response body and filter its items to packed rows (see `common.merge_engine.pack_rows`).
+
+    Module level function taking and returning compact payloads (the raw body, tuples of
+    values), to run in a process pool (see `common.executor`).
+
+    Parameters:
+        - `content` (bytes): Response body.
+        - `data_path` (str): Path to the items.
+        - `total_count_path` (str): Path to the total item count, None if not configured.
+        - `fields_json` (str): JSON encoded "fields" section of the source config.
+
+    Returns:
+        - tuple: The filtered items (list of tuples, values in field order) and the total item
+          count (None if not configured or missing).
+    """
+    extractor = cached_extractor(fields_json)
+    json_response = json.loads(content)
+    items = access_nested_fields(json_response, data_path)
+    total_count = access_nested_fields(json_response, total_count_path) if total_count_path else None
+    return [filter_values(item, extractor) for item in items], total_count
+
+
+def create_http_client(http_config, headers=None):
+    """
+    Create a pooled async HTTP client.
+
+    Connections are kept alive between requests and gzip/deflate responses are
+    decoded transparently by httpx.
+
+    Parameters:
+        - `http_config` (dict): `http` config block (see `DEFAULT_HTTP_CONFIG`), missing keys take the defaults.
+        - `headers` (dict, optional): Headers sent with every request.
+
+    Returns:
+        - httpx.AsyncClient: Client configured with the headers, timeouts and pool limits.
+    """
+    http_config = {**DEFAULT_HTTP_CONFIG, **http_config}
+    timeout = httpx.Timeout(http_config["timeout"], connect=http_config["connect_timeout"])
+    limits = httpx.Limits(max_connections=http_config["max_connections"],
+                          max_keepalive_connections=http_config["max_keepalive_connections"])
+    return httpx.AsyncClient(headers=headers, timeout=timeout, limits=limits)
+
+
+class StreamFilter:
+    """
+    Incremental parser of a response body, building and filtering the items under `data_path` chunk by chunk.
+    """
+
+    def __init__(self, data_path, total_count_path, apply_filter):
+        """
+        Parameters:
+            - `data_path` (str): Dotted path of the items list in the response.
+            - `total_count_path` (str): Dotted path of the total item count, None if there is none.
+            - `apply_filter` (function): Reduces an item to the configured fields.
+        """
+        self.items = ijson.sendable_list()
+        self.items_parser = ijson.items_coro(self.items, f'{data_path}.item', use_float=True)
+        self.counts = ijson.sendable_list()
+        self.count_parser = ijson.items_coro(self.counts, total_count_path) if total_count_path else None
+        self.apply_filter = apply_filter
+
+    def filtered_items(self):
+        """
+        Filter the items parsed since the last call.
+        """
+        filtered_items = [self.apply_filter(item) for item in self.items]
+        del self.items[:]
+        return filtered_items
+
+    def send(self, chunk):
+        """
+        Parse the next chunk of the body.
+
+        Parameters:
+            - `chunk` (bytes): Next bytes of the body.
+
+        Returns:
+            - list: The filtered items completed by the chunk.
+        """
+        self.items_parser.send(chunk)
+        if self.count_parser is not None:
+            self.count_parser.send(chunk)
+        return self.filtered_items()
+
+    def close(self):
+        """
+        End the parse of the body.
+
+        Returns:
+            - list: The filtered items completed at the end of the body.
+        """
+        self.items_parser.close()
+        if self.count_parser is not None:
+            self.count_parser.close()
+        return self.filtered_items()
+
+    def total_count(self):
+        """
+        Get the total item count read from the body, None if there is none.
+        """
+        return self.counts[0] if self.counts else None
+
+
 class DataFetcher():
-    def __init__(self, config):
+    def __init__(self, config, client=None, executor=None):
+        """
+        Parameters:
+            - `config` (dict): Source config (url, parameters, headers, http, fields...).
+            - `client` (httpx.AsyncClient, optional): Client shared with other fetchers, not closed by
+              this one. The source headers are sent with every request. An own client if None.
+            - `executor` (CpuExecutor, optional): Executor parsing and filtering the responses off the
+              event loop (see `common.executor`). On the loop if None. A `process` executor takes
+              over `stream` parse mode sources: whole bodies are parsed in the pool instead of every
+              chunk in a thread holding the GIL of the event loop.
+        """
         self.config = config
         self._set_api_key()
-        self.session = Session()
-        self.session.headers.update(self.config.get("headers"))
+        self.http_config = {**DEFAULT_HTTP_CONFIG, **self.config.get("http", {})}
+        self.extractor = compile_fields(self.config["fields"])
+        self.field_names = [field_name for field_name, _, _, _ in self.extractor]
+        self.fields_json = json.dumps(self.config["fields"])
+        self.executor = executor
+        # Set once, so the pages of a fetch do not mix forms if the process pool falls back to threads
+        self.stream_parse = (self.config.get("parse_mode") == "stream" and
+                             (executor is None or executor.kind != "process"))
+        self.shared_client = client is not None
+        self.client = client if client is not None else self._create_client()
+        self.semaphore = asyncio.Semaphore(self.http_config["max_concurrency"])
         logging.info(f"Initialized")
 
+    def _create_client(self):
+        """
+        Create the pooled async HTTP client owned by the fetcher.
+
+        Returns:
+            - httpx.AsyncClient: Client configured with the source headers, timeouts and pool limits.
+        """
+        return create_http_client(self.http_config, self.config.get("headers"))
+
+    async def close(self):
+        """
+        Close the HTTP client and release its pooled connections, unless it is shared.
+        """
+        if not self.shared_client:
+            await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
 
     def _set_api_key(self):
         json_string = json.dumps(self.config)
@@ -28,37 +334,238 @@ class DataFetcher():
         self.config = json.loads(new_json_string)
 
     def access_nested_fields(self, json_data, path, default_value = None):
-        field_value = json_data
-        try:
-            for key in path.split("."):
-                field_value = field_value[key]
-        except (KeyError, TypeError):
-            if default_value:
-                field_value = default_value
-        return field_value
-
-    def apply_filter(self, json_data, filter_config):
-        filtered_item = {}
-        for field_config in filter_config["fields"]:
-            field_name = field_config["name"]
-            field_source = field_config["source"]
-            default_value = field_config["default"]
-            logging.debug(f"name {field_name} - source {field_source} - default {default_value}")
-            # Access to nested field value
-            field_value = self.access_nested_fields(json_data, field_source, default_value)
-            logging.debug(f"Extracted Value : {field_value}")
-            # Apply transformation if specified
-            transform_function = field_config.get("transform")
-            logging.debug(f"Tranform : {transform_function}")
-            if transform_function and field_value is not None:
-                field_value = eval(transform_function)(field_value)
-                logging.debug(f"Tranform result: {field_value}")
-
-            filtered_item[field_name] = field_value
-
-        return filtered_item
-
-    async def get_data(self):
+        return access_nested_fields(json_data, path, default_value)
+
+    def apply_filter(self, json_data):
+        """
+        Extract the configured fields from a raw item using the compiled extractor plan
+        (see `filter_values`).
+
+        Parameters:
+            - `json_data` (dict): Raw item from the API response.
+
+        Returns:
+            - dict: Filtered item with one entry per configured field.
+        """
+        return dict(zip(self.field_names, filter_values(json_data, self.extractor)))
+
+    def check_response(self, response):
+        """
+        Raise a CustomApiException if the response status is not 200.
+
+        Parameters:
+            - `response` (httpx.Response): Response with its body already read.
+        """
+        if response.status_code != 200:
+            raise CustomApiException(response.json(), f"API Error ({response.status_code}) : {response.text}")
+
+    async def request(self, params):
+        """
+        Send a single GET request to the configured url.
+
+        The number of requests in flight at the same time is bounded by `max_concurrency`.
+
+        Parameters:
+            - `params` (dict): Query parameters for the request.
+
+        Returns:
+            - httpx.Response: The successful (200) response.
+
+        Raises:
+            - CustomApiException: If the API answers with a status code other than 200.
+        """
+        async with self.semaphore:
+            response = await self.client.get(self.config.get("url"), params=params, headers=self.config.get("headers"))
+        self.check_response(response)
+        return response
+
+    def packs_items(self):
+        """
+        Return True if the pages are filtered by the executor, to packed rows (tuples of values in field order).
+        """
+        return self.executor is not None and not self.stream_parse
+
+    def output(self, items, packed):
+        """
+        Convert the filtered items of every page to the form requested from `get_data`.
+
+        Parameters:
+            - `items` (list): Filtered items, packed rows if `packs_items()`, dictionaries otherwise.
+            - `packed` (bool): True to get packed rows.
+
+        Returns:
+            - list: Items (dictionaries), or a tuple with the field names and the packed rows if `packed`.
+        """
+        if self.packs_items():
+            return (self.field_names, items) if packed else unpack_rows(self.field_names, items)
+        return (self.field_names, pack_rows(items, self.field_names)) if packed else items
+
+    def total_count_path(self):
+        """
+        Return the configured path to the total item count of a paginated source, if any.
+        """
+        return self.config.get("pagination", {}).get("total_count_path")
+
+    async def fetch_items(self, params):
+        """
+        Request one page of data and return its filtered items.
+
+        Parameters:
+            - `params` (dict): Query parameters for the request.
+
+        Returns:
+            - tuple: The filtered items found at `data_path` and the total item count
+              read from `pagination.total_count_path` (None if not configured or missing).
+        """
+        if self.stream_parse:
+            return await self.stream_items(params)
+
+        response = await self.request(params)
+        if self.packs_items():
+            return await self.executor.run(filter_response, response.content, self.config["data_path"],
+                                           self.total_count_path(), self.fields_json)
+        json_response = response.json()
+        items = self.access_nested_fields(json_response, self.config["data_path"])
+        logging.debug(f"Filtering {len(items)} items")
+        total_count = None
+        if self.total_count_path():
+            total_count = self.access_nested_fields(json_response, self.total_count_path())
+        return [self.apply_filter(item) for item in items], total_count
+
+    async def stream_items(self, params):
+        """
+        Request one page of data and filter its items while the body is being received.
+
+        The response is parsed incrementally with ijson: only the items under `data_path`
+        are built, one at a time, and each one is reduced to the configured fields before
+        the next is parsed. The full response tree is never held in memory. With a `thread`
+        executor, every chunk is parsed and filtered in a thread, off the event loop.
+
+        Parameters:
+            - `params` (dict): Query parameters for the request.
+
+        Returns:
+            - tuple: The filtered items and the total item count (see `fetch_items`).
+
+        Raises:
+            - RuntimeError: If ijson is not installed.
+            - CustomApiException: If the API answers with a status code other than 200.
+        """
+        if ijson is None:
+            raise RuntimeError("parse_mode 'stream' requires the ijson package.")
+
+        filtered_items = []
+        stream_filter = StreamFilter(self.config["data_path"], self.total_count_path(), self.apply_filter)
+
+        async with self.semaphore:
+            async with self.client.stream("GET", self.config.get("url"), params=params,
+                                          headers=self.config.get("headers")) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self.check_response(response)
+                async for chunk in response.aiter_bytes():
+                    if self.executor is None:
+                        filtered_items.extend(stream_filter.send(chunk))
+                    else:
+                        # The parser state can not move to a worker process, chunks are parsed in a thread
+                        filtered_items.extend(await asyncio.to_thread(stream_filter.send, chunk))
+        filtered_items.extend(stream_filter.close())
+
+        logging.debug(f"Filtered {len(filtered_items)} streamed items")
+        return filtered_items, stream_filter.total_count()
+
+    def last_page(self, total_count, first_page, page_size):
+        """
+        Work out the last page to request for a paginated source.
+
+        The total item count read from `pagination.total_count_path` in the first response
+        is used when available, otherwise `pagination.max_pages` (only a fallback, it does not
+        cap a known total count).
+
+        Parameters:
+            - `total_count` (int): Total item count reported by the first page, or None.
+            - `first_page` (int): Number of the first page requested.
+            - `page_size` (int): Items per page.
+
+        Returns:
+            - int: Number of the last page to request, or None if unknown (no total count and
+              no `max_pages`): pages are then requested until a short or empty page.
+        """
+        pagination = self.config["pagination"]
+        if isinstance(total_count, int):
+            return first_page + max(-(-total_count // page_size) - 1, 0)
+        if pagination.get("max_pages"):
+            return first_page + pagination["max_pages"] - 1
+        return None
+
+    async def get_paginated_items(self, json_params):
+        """
+        Fetch all the pages of a paginated source concurrently.
+
+        The first page is requested alone to learn the total count, then the remaining
+        pages are fetched with at most `pagination.window` requests in flight. When the last
+        page is unknown, pages are requested one window at a time until a short or empty
+        page. Pages after the first short (last) page are skipped. Items are returned in page
+        order so the source ordering (e.g. rank) is preserved.
+
+        Parameters:
+            - `json_params` (dict): Request parameters including `page` and `page_size`.
+
+        Returns:
+            - list: Filtered items of all the pages in page order.
+        """
+        first_page = json_params["page"]
+        page_size = json_params["page_size"]
+        first_items, total_count = await self.fetch_items(json_params)
+        pages = [first_items]
+
+        last_page = self.last_page(total_count, first_page, page_size)
+        if len(first_items) == page_size and (last_page is None or last_page > first_page):
+            window_size = self.config["pagination"].get("window", DEFAULT_PAGE_WINDOW)
+            window = asyncio.Semaphore(window_size)
+            end_page = last_page if last_page is not None else math.inf
+
+            async def fetch_page(page):
+                nonlocal end_page
+                async with window:
+                    if page > end_page:
+                        return []
+                    items, _ = await self.fetch_items({**json_params, "page": page})
+                if len(items) < page_size:
+                    end_page = min(end_page, page)
+                return items
+
+            if last_page is not None:
+                logging.debug(f"Fetching pages {first_page + 1}..{last_page}")
+                pages.extend(await asyncio.gather(*[fetch_page(page) for page in range(first_page + 1, last_page + 1)]))
+            else:
+                # Unknown page count: one window of pages at a time until a short page
+                next_page = first_page + 1
+                while end_page == math.inf:
+                    logging.debug(f"Fetching pages {next_page}..{next_page + window_size - 1}")
+                    pages.extend(await asyncio.gather(*[fetch_page(page)
+                                                        for page in range(next_page, next_page + window_size)]))
+                    next_page += window_size
+
+        items = []
+        for page_items in pages:
+            items.extend(page_items)
+            if len(page_items) < page_size:
+                break
+        return items
+
+    async def get_data(self, packed=False):
+        """
+        Fetch every page of the source and filter its items.
+
+        Parameters:
+            - `packed` (bool): True to get the items as packed rows (see `common.merge_engine.pack_rows`),
+              the compact form passed to a process pool.
+
+        Returns:
+            - list: Filtered items (dictionaries), or a tuple with the field names (list) and the
+              packed rows (list of tuples) if `packed`.
+        """
         try:
             logging.info(f"Requesting data from {self.config.get('url')}")
 
@@ -67,20 +574,20 @@ class DataFetcher():
             page = json_params.get("page", None)
             page_size = json_params.get("page_size", None)
 
+            if page is not None and "pagination" in self.config:
+                filtered_items = await self.get_paginated_items(json_params)
+                logging.info(f"Total Filtered : {len(filtered_items)} items")
+                return self.output(filtered_items, packed)
+
             filtered_items = []
             while True:
-                response = self.session.get(self.config.get("url"), params=json_params)
-                if response.status_code == 200:
-                    json_response = json.loads(response.text)
-                    items = self.access_nested_fields(json_response, self.config["data_path"])
-                    logging.debug(f"Filtering {len(items)} items")
-                    filtered_items.extend([self.apply_filter(item, self.config) for item in items])
-                    if page is None or len(items) < page_size:
-                        logging.info(f"Total Filtered : {len(filtered_items)} items")
-                        return filtered_items
-                    else:
-                       json_params["page"] += 1
+                items, _ = await self.fetch_items(json_params)
+                filtered_items.extend(items)
+                if page is None or len(items) < page_size:
+                    logging.info(f"Total Filtered : {len(filtered_items)} items")
+                    return self.output(filtered_items, packed)
                 else:
-                    raise CustomApiException(response.json(), f"API Error ({response.status_code}) : {response.text}")
-        except (Exception,ConnectionError, Timeout, TooManyRedirects) as e:
-            raise e
\ No newline at end of file
+                   json_params["page"] += 1
+        except (httpx.TimeoutException, httpx.TransportError, httpx.TooManyRedirects) as e:
+            logging.error(f"Request to {self.config.get('url')} failed: {e!r}")
+            raise e
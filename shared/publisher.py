@@ -1,5 +1,6 @@
 import json
 import logging
+from aioredis.errors import ReplyError
 from common.utils import rounddown_time_to_minute, unix_timestamp_to_iso
 from common.redis_utils import connect_to_redis
 
@@ -37,22 +38,39 @@ class Publisher:
         if self.redis is None:
             raise RuntimeError("Redis connection is not initialized.")
     
-    async def send_data_to_redis_stream(self):
+    async def send_data_to_redis_stream(self, timestamp=None):
         """
         Send data to the specified Redis stream.
 
+        Parameters:
+        - timestamp (int, optional): Minute timestamp of the message id (scheduled tick). The current minute if None.
+
+        Returns:
+        - bool: True if the message was added, False if the stream already has a message for that minute or a later one.
+
         Raises:
         - RuntimeError: If essential dependencies are not set.
+        - aioredis.RedisError: If the message could not be added for any other reason.
         """
         self.check_dependencies_are_set()
+        if timestamp is None:
+            timestamp = rounddown_time_to_minute()
 
         # Fetch data from the data fetcher.
         data = await self.data_fetcher.get_data()        
         json_data = json.dumps(data)
 
-        # Publish the data to the specified Redis stream.
-        self.redis.xadd(self.config['redis']['stream'],
-                        {'data': json_data }, 
-                        message_id=(str(rounddown_time_to_minute()) + '-0').encode('utf-8'),
-                        max_len=1)
-        logging.info(f"[{self.config['redis']['stream']}] : {unix_timestamp_to_iso(rounddown_time_to_minute())}: {json_data[:100]}")
+        # Publish the data to the specified Redis stream, awaiting the reply so errors are not lost.
+        try:
+            await self.redis.xadd(self.config['redis']['stream'],
+                                  {'data': json_data }, 
+                                  message_id=(str(timestamp) + '-0').encode('utf-8'),
+                                  max_len=1)
+        except ReplyError as e:
+            if "equal or smaller" not in str(e):
+                raise
+            # Restarted within a minute already published
+            logging.warning(f"[{self.config['redis']['stream']}] : {unix_timestamp_to_iso(timestamp)} already published")
+            return False
+        logging.info(f"[{self.config['redis']['stream']}] : {unix_timestamp_to_iso(timestamp)}: {json_data[:100]}")
+        return True
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import threading
+import httpx
+import pytest
+from shared.data_fetcher import DataFetcher, CustomApiException, compile_fields
+from common.executor import CpuExecutor
+
+
+@pytest.fixture
+def fetcher_config():
+    return {
+        "api_key_env_var_name": "TEST_API_KEY",
+        "url": "https://example.com/list",
+        "parameters": {"limit": "3"},
+        "headers": {"Accepts": "application/json"},
+        "http": {"max_concurrency": 2},
+        "data_path": "data",
+        "fields": [
+            {"name": "Id", "source": "id", "default": "NOT_AVAILABLE"},
+            {"name": "Price USD", "source": "quote.USD.price", "default": "NOT_AVAILABLE"}
+        ]
+    }
+
+
+def mock_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_get_data(fetcher_config):
+    def handler(request):
+        assert request.url.params["limit"] == "3"
+        return httpx.Response(200, json={"data": [{"id": 1, "quote": {"USD": {"price": 42.5}}},
+                                                  {"id": 2, "quote": {}}]})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        data = await fetcher.get_data()
+
+    assert data == [{"Id": 1, "Price USD": 42.5}, {"Id": 2, "Price USD": "NOT_AVAILABLE"}]
+
+
+@pytest.mark.asyncio
+async def test_get_data_api_error(fetcher_config):
+    def handler(request):
+        return httpx.Response(401, json={"status": {"error_code": 1002}})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        with pytest.raises(CustomApiException):
+            await fetcher.get_data()
+
+
+@pytest.mark.asyncio
+async def test_requests_do_not_block_and_respect_concurrency(fetcher_config):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return httpx.Response(200, json={"data": []})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        await asyncio.gather(*[fetcher.get_data() for _ in range(4)])
+
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_paginated_pages_fetched_concurrently_in_order(fetcher_config):
+    fetcher_config["parameters"] = {"page": 1, "page_size": 2}
+    fetcher_config["pagination"] = {"window": 3, "max_pages": 10, "total_count_path": "stats.total"}
+    fetcher_config["http"] = {"max_concurrency": 10}
+    requested_pages = []
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        page = int(request.url.params["page"])
+        requested_pages.append(page)
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # Later pages answer first to check the reassembly order
+        await asyncio.sleep(0.05 / page)
+        in_flight -= 1
+        ids = [id for id in (2 * page - 1, 2 * page) if id <= 9]
+        return httpx.Response(200, json={"stats": {"total": 9}, "data": [{"id": id} for id in ids]})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        data = await fetcher.get_data()
+
+    assert [item["Id"] for item in data] == list(range(1, 10))
+    assert sorted(requested_pages) == [1, 2, 3, 4, 5]
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_paginated_total_count_not_capped_by_max_pages(fetcher_config):
+    # max_pages is a fallback for an unknown total count, not a cap of the total
+    fetcher_config["parameters"] = {"page": 1, "page_size": 2}
+    fetcher_config["pagination"] = {"window": 3, "max_pages": 2, "total_count_path": "stats.total"}
+    requested_pages = []
+
+    def handler(request):
+        page = int(request.url.params["page"])
+        requested_pages.append(page)
+        ids = [id for id in (2 * page - 1, 2 * page) if id <= 9]
+        return httpx.Response(200, json={"stats": {"total": 9}, "data": [{"id": id} for id in ids]})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        data = await fetcher.get_data()
+
+    assert [item["Id"] for item in data] == list(range(1, 10))
+    assert sorted(requested_pages) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_paginated_max_pages_stops_at_short_page(fetcher_config):
+    fetcher_config["parameters"] = {"page": 1, "page_size": 2}
+    fetcher_config["pagination"] = {"window": 1, "max_pages": 10}
+    requested_pages = []
+
+    def handler(request):
+        page = int(request.url.params["page"])
+        requested_pages.append(page)
+        ids = [id for id in (2 * page - 1, 2 * page) if id <= 5]
+        return httpx.Response(200, json={"data": [{"id": id} for id in ids]})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        data = await fetcher.get_data()
+
+    assert [item["Id"] for item in data] == [1, 2, 3, 4, 5]
+    assert requested_pages == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("total", [7, 8])
+async def test_paginated_without_page_count_fetches_until_short_page(fetcher_config, total):
+    # No total count nor max_pages: windows of pages until a short (7) or empty (8) page
+    fetcher_config["parameters"] = {"page": 1, "page_size": 2}
+    fetcher_config["pagination"] = {"window": 2}
+    requested_pages = []
+
+    def handler(request):
+        page = int(request.url.params["page"])
+        requested_pages.append(page)
+        ids = [id for id in (2 * page - 1, 2 * page) if id <= total]
+        return httpx.Response(200, json={"data": [{"id": id} for id in ids]})
+
+    fetcher = DataFetcher(fetcher_config)
+    fetcher.client = mock_client(handler)
+    async with fetcher:
+        data = await fetcher.get_data()
+
+    assert [item["Id"] for item in data] == list(range(1, total + 1))
+    # The window of the last page may request (or skip) the page after it, never more
+    assert sorted(requested_pages)[:4] == [1, 2, 3, 4] and max(requested_pages) <= 5
+
+
+def test_compile_fields_named_and_expression_transforms():
+    extractor = compile_fields([
+        {"name": "Id", "source": "ALT_IDS", "default": None, "transform": "cmc_alternative_id"},
+        {"name": "Price", "source": "quote.USD.price", "default": None, "transform": "lambda price: round(price, 1)"}
+    ])
+    (_, id_getter, _, id_transform), (_, price_getter, _, price_transform) = extractor
+    item = {"ALT_IDS": [{"NAME": "CG", "ID": "bitcoin"}, {"NAME": "CMC", "ID": "1"}], "quote": {"USD": {"price": 1.26}}}
+
+    assert id_transform(id_getter(item)) == 1
+    assert price_transform(price_getter(item)) == 1.3
+
+
+def test_apply_filter_defaults_skip_transform(fetcher_config):
+    fetcher_config["fields"].append({"name": "Rank", "source": "alt_ids", "default": "NOT_AVAILABLE",
+                                     "transform": "cmc_alternative_id"})
+    fetcher = DataFetcher(fetcher_config)
+
+    assert fetcher.apply_filter({"id": 7, "quote": None}) == {"Id": 7, "Price USD": "NOT_AVAILABLE", "Rank": "NOT_AVAILABLE"}
+
+
+@pytest.mark.asyncio
+async def test_stream_parse_mode_matches_json_mode(fetcher_config):
+    body = json.dumps({"status": {"total": 3},
+                       "data": [{"id": id, "name": "x" * 100, "quote": {"USD": {"price": id * 0.1}}} for id in range(3)]}).encode()
+
+    async def chunks():
+        for start in range(0, len(body), 16):
+            yield body[start:start + 16]
+
+    def handler(request):
+        return httpx.Response(200, content=chunks())
+
+    def json_handler(request):
+        return httpx.Response(200, content=body)
+
+    fetcher_config["pagination"] = {"total_count_path": "status.total"}
+    json_fetcher = DataFetcher(fetcher_config)
+    json_fetcher.client = mock_client(json_handler)
+    fetcher_config["parse_mode"] = "stream"
+    stream_fetcher = DataFetcher(fetcher_config)
+    stream_fetcher.client = mock_client(handler)
+    async with json_fetcher, stream_fetcher:
+        json_result = await json_fetcher.fetch_items({})
+        stream_result = await stream_fetcher.fetch_items({})
+
+    assert stream_result == json_result
+    assert stream_result[1] == 3
+    assert stream_result[0][2] == {"Id": 2, "Price USD": 0.2}
+
+
+@pytest.mark.asyncio
+async def test_shared_client_sends_source_headers_and_stays_open(fetcher_config):
+    def handler(request):
+        return httpx.Response(200, json={"data": [{"id": 1, "quote": {"USD": {"price": 42.5}}}],
+                                         "headers": request.headers.get("Accepts")})
+
+    client = mock_client(handler)
+    other_config = {**fetcher_config, "headers": {"Accepts": "text/plain"}}
+    async with DataFetcher(fetcher_config, client) as fetcher, DataFetcher(other_config, client) as other_fetcher:
+        responses = [await fetcher.request({}), await other_fetcher.request({})]
+
+    assert [response.json()["headers"] for response in responses] == ["application/json", "text/plain"]
+    # Closing the fetchers does not close the client shared with them
+    assert not client.is_closed
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_get_data_filtered_by_executor(fetcher_config):
+    def handler(request):
+        return httpx.Response(200, json={"data": [{"id": 1, "quote": {"USD": {"price": 42.5}}},
+                                                  {"id": 2, "quote": {}}]})
+
+    executor = CpuExecutor("thread", 1)
+    fetcher = DataFetcher(fetcher_config, mock_client(handler), executor)
+    try:
+        data = await fetcher.get_data()
+        packed_data = await fetcher.get_data(packed=True)
+    finally:
+        executor.shutdown()
+        await fetcher.client.aclose()
+
+    assert data == [{"Id": 1, "Price USD": 42.5}, {"Id": 2, "Price USD": "NOT_AVAILABLE"}]
+    assert packed_data == (["Id", "Price USD"], [(1, 42.5), (2, "NOT_AVAILABLE")])
+
+
+@pytest.mark.asyncio
+async def test_stream_parse_mode_filtered_off_the_loop(fetcher_config):
+    body = json.dumps({"data": [{"id": id, "quote": {"USD": {"price": id * 0.5}}} for id in range(5)]}).encode()
+
+    async def chunks():
+        for start in range(0, len(body), 32):
+            yield body[start:start + 32]
+
+    fetcher_config["parse_mode"] = "stream"
+    executor = CpuExecutor("thread", 1)
+    fetcher = DataFetcher(fetcher_config, mock_client(lambda request: httpx.Response(200, content=chunks())), executor)
+    filter_threads = set()
+    apply_filter = fetcher.apply_filter
+
+    def recording_filter(item):
+        filter_threads.add(threading.current_thread())
+        return apply_filter(item)
+
+    fetcher.apply_filter = recording_filter
+    try:
+        items, total = await fetcher.fetch_items({})
+    finally:
+        executor.shutdown()
+        await fetcher.client.aclose()
+
+    assert items == [{"Id": id, "Price USD": id * 0.5} for id in range(5)]
+    assert total is None
+    assert threading.main_thread() not in filter_threads
+
+
+@pytest.mark.asyncio
+async def test_stream_parse_mode_filtered_in_process_pool(fetcher_config):
+    def handler(request):
+        return httpx.Response(200, json={"data": [{"id": id, "quote": {"USD": {"price": id * 0.5}}} for id in range(5)]})
+
+    fetcher_config["parse_mode"] = "stream"
+    executor = CpuExecutor("process", 1)
+    fetcher = DataFetcher(fetcher_config, mock_client(handler), executor)
+    try:
+        packed_data = await fetcher.get_data(packed=True)
+    finally:
+        executor.shutdown()
+        await fetcher.client.aclose()
+
+    assert fetcher.packs_items()
+    assert packed_data == (["Id", "Price USD"], [(id, id * 0.5) for id in range(5)])
@@ -0,0 +1,39 @@
+import pytest
+from aioredis.errors import ReplyError
+from unittest.mock import AsyncMock
+from shared.publisher import Publisher
+
+config = {'redis': {'host': 'localhost', 'port': 6379, 'stream': 'price', 'interval': 60}}
+
+
+def publisher_with(redis_mock):
+    data_fetcher = AsyncMock()
+    data_fetcher.get_data.return_value = [{"Id": 1, "Symbol": "BTC", "Price USD": 42863.7}]
+    return Publisher(config, data_fetcher, redis_mock)
+
+
+@pytest.mark.asyncio
+async def test_send_data_to_redis_stream():
+    redis_mock = AsyncMock()
+
+    assert await publisher_with(redis_mock).send_data_to_redis_stream(1706792160)
+
+    redis_mock.xadd.assert_awaited_once_with('price', {'data': '[{"Id": 1, "Symbol": "BTC", "Price USD": 42863.7}]'},
+                                             message_id=b'1706792160-0', max_len=1)
+
+
+@pytest.mark.asyncio
+async def test_send_data_to_redis_stream_minute_already_published():
+    redis_mock = AsyncMock()
+    redis_mock.xadd.side_effect = ReplyError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+
+    assert not await publisher_with(redis_mock).send_data_to_redis_stream(1706792160)
+
+
+@pytest.mark.asyncio
+async def test_send_data_to_redis_stream_error_is_raised():
+    redis_mock = AsyncMock()
+    redis_mock.xadd.side_effect = ReplyError("OOM command not allowed when used memory > 'maxmemory'")
+
+    with pytest.raises(ReplyError):
+        await publisher_with(redis_mock).send_data_to_redis_stream(1706792160)